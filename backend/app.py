@@ -4,7 +4,7 @@ Restaurant demo app (Flask).
 - Bookings/users stored in JSON files
 """
 
-from flask import Flask, g, render_template, request, jsonify, session, redirect, send_from_directory, url_for
+from flask import Flask, Response, g, render_template, request, jsonify, session, redirect, send_from_directory, url_for
 from datetime import datetime, timedelta
 from functools import lru_cache
 from pathlib import Path
@@ -17,6 +17,7 @@ from itsdangerous import URLSafeTimedSerializer
 from werkzeug.middleware.proxy_fix import ProxyFix
 from routes.auth_routes import login_route, register_route, logout_route
 from routes.booking_routes import (
+    availability_day_route,
     availability_route,
     book_table_route,
     cancel_booking_with_orders_route,
@@ -56,6 +57,7 @@ from storage.json_store import (
     save_orders as store_save_orders,
     save_users as store_save_users,
 )
+from storage import query_metrics
 
 ACTIVE_STORAGE = "json"
 _pg_store_module = None
@@ -117,10 +119,6 @@ def _load_user_agreement_blocks():
     return blocks
 
 
-def _empty_promo_application_counts(**_kwargs):
-    return {}
-
-
 def _noop_save_promotion_applications(**_kwargs):
     return None
 
@@ -133,6 +131,7 @@ if _REDIS_URL:
         print(f"[cache] redis import failed ({exc}), menu cache disabled")
 from services.business_logic import (
     build_order_status_timeline_value,
+    compile_order_timeline_value,
     compute_serve_datetime_value,
     current_time_value,
     get_user_preparing_orders_from_orders_value,
@@ -144,20 +143,29 @@ from services.business_logic import (
     list_active_order_statuses_from_orders_value,
     list_active_order_statuses_value,
     order_cooking_window_value,
+    order_statuses_at_value,
     overlaps_booking_window,
     parse_datetime_value,
     parse_iso_datetime_value,
     parse_serving_option_value,
     resolve_order_items_value,
+    user_activity_snapshot_value,
 )
 from services.auth_session import AuthSessionService
 from services.menu_content import MenuContentService
 from services.one_time_tokens import OneTimeTokenStore
+from services.housekeeping import FileLeaderLock, HousekeepingService
+from services.order_deadlines import OrderDeadlineScheduler
+from services.order_status_batch import ORDER_STATUS_BATCH_FIELDS, parse_order_ids_value
+from services.order_status_stream import OrderStatusStream, stream_capacity_value
 from services.passwords import (
     hash_password as hash_password_value,
     verify_password as verify_password_value,
     verify_and_upgrade_password as verify_and_upgrade_password_value,
 )
+from services.pricing_sessions import CheckoutPricingSessions
+from services.promo_usage import PromoUsageCounter
+from services.promotions import DISCOUNT_MODES, DiscountPolicy, configure_discount_policy
 from services.storage_facade import StorageFacade
 from config import (
     BOOKINGS_PATH,
@@ -276,12 +284,12 @@ def _assert_storage_configuration():
 
 _activate_postgres_storage()
 _assert_storage_configuration()
-load_promo_application_counts = (
+store_load_promo_application_counts = (
     _pg_store_module.load_promotion_application_counts
     if ACTIVE_STORAGE == "postgres" and _pg_store_module is not None
-    else _empty_promo_application_counts
+    else None
 )
-save_promotion_applications = (
+store_save_promotion_applications = (
     _pg_store_module.save_promotion_applications
     if ACTIVE_STORAGE == "postgres" and _pg_store_module is not None
     else _noop_save_promotion_applications
@@ -381,6 +389,7 @@ _EVENT_ACTION_LABELS = {
     "menu_item": "Открыл блюдо",
     "reserve": "Открыл бронирование",
     "availability": "Проверил доступность столов",
+    "availability_day": "Проверил доступность столов на день",
     "book_table": "Забронировал стол",
     "release_table": "Освободил бронь",
     "cancel_booking": "Отменил бронь",
@@ -419,6 +428,7 @@ _EVENT_ENTITY_BY_ENDPOINT = {
     "add_card": "payment_card",
     "delete_card": "payment_card",
     "availability": "booking",
+    "availability_day": "booking",
 }
 
 
@@ -615,6 +625,13 @@ def _should_log_app_event(response):
 @app.before_request
 def start_request_timer():
     g.request_started_at = time.perf_counter()
+    query_metrics.begin_request()
+
+
+@app.before_request
+def supervise_housekeeping_worker():
+    if housekeeping is not None and not housekeeping.running:
+        housekeeping.start()
 
 
 @app.after_request
@@ -624,7 +641,8 @@ def append_server_timing_headers(response):
         return response
 
     elapsed_ms = max(0.0, (time.perf_counter() - started_at) * 1000.0)
-    response.headers["Server-Timing"] = f"app;dur={elapsed_ms:.1f}"
+    db_timings = query_metrics.server_timing_entries(query_metrics.end_request())
+    response.headers["Server-Timing"] = ", ".join([f"app;dur={elapsed_ms:.1f}", *db_timings])
     response.headers["X-Render-Time-Ms"] = f"{elapsed_ms:.1f}"
     return response
 
@@ -749,9 +767,35 @@ DB_KEEPALIVE_INTERVAL_SECONDS = max(60, env_int("DB_KEEPALIVE_INTERVAL_SECONDS",
 _DB_KEEPALIVE_STARTED = False
 _DB_KEEPALIVE_LOCK = threading.Lock()
 DEBUG_STORAGE_ENABLED = env_bool("DEBUG_STORAGE_ENABLED", False)
+DEBUG_DB_METRICS_ENABLED = env_bool("DEBUG_DB_METRICS_ENABLED", False)
 DEBUG_ROUTES_REQUIRE_ADMIN = env_bool("DEBUG_ROUTES_REQUIRE_ADMIN", True)
 MENU_CACHE_ENABLED = env_bool("MENU_CACHE_ENABLED", True)
 MENU_CACHE_TTL_SECONDS = max(30, env_int("MENU_CACHE_TTL_SECONDS", 600))
+POPULAR_ITEMS_CACHE_TTL_SECONDS = max(30, env_int("POPULAR_ITEMS_CACHE_TTL_SECONDS", 300))
+NOTIFICATIONS_COUNT_CACHE_TTL_SECONDS = max(0, env_int("NOTIFICATIONS_COUNT_CACHE_TTL_SECONDS", 15))
+ORDER_STATUS_BATCH_CACHE_TTL_SECONDS = max(0, env_int("ORDER_STATUS_BATCH_CACHE_TTL_SECONDS", 10))
+ORDER_STATUS_BATCH_MAX_IDS = max(1, env_int("ORDER_STATUS_BATCH_MAX_IDS", 50))
+AVAILABILITY_CACHE_TTL_SECONDS = max(0, env_int("AVAILABILITY_CACHE_TTL_SECONDS", 60))
+PROMO_USAGE_CACHE_TTL_SECONDS = max(0, env_int("PROMO_USAGE_CACHE_TTL_SECONDS", 300))
+CHECKOUT_PRICING_SESSION_TTL_SECONDS = max(30, env_int("CHECKOUT_PRICING_SESSION_TTL_SECONDS", 600))
+PROMO_DISCOUNT_MODE = env_str("PROMO_DISCOUNT_MODE", "priority").lower()
+PROMO_DISCOUNT_MAX_STACKED = max(1, env_int("PROMO_DISCOUNT_MAX_STACKED", 1))
+PROMO_DISCOUNT_EXCLUSIVE_KINDS = frozenset(
+    kind.strip().upper() for kind in env_str("PROMO_DISCOUNT_EXCLUSIVE_KINDS", "").split(",") if kind.strip()
+)
+PROMO_DISCOUNT_ALLOW_OVERLAP = env_bool("PROMO_DISCOUNT_ALLOW_OVERLAP", False)
+PROMO_DISCOUNT_CANDIDATE_BUDGET = max(1, env_int("PROMO_DISCOUNT_CANDIDATE_BUDGET", 16))
+ORDER_DEADLINE_SCHEDULER_ENABLED = env_bool("ORDER_DEADLINE_SCHEDULER_ENABLED", True)
+ORDER_DEADLINE_RESYNC_SECONDS = max(30, env_int("ORDER_DEADLINE_RESYNC_SECONDS", 300))
+HOUSEKEEPING_ENABLED = env_bool("HOUSEKEEPING_ENABLED", True)
+HOUSEKEEPING_BOOKING_EXPIRY_SECONDS = max(30, env_int("HOUSEKEEPING_BOOKING_EXPIRY_SECONDS", 300))
+HOUSEKEEPING_ORDER_STATUS_SECONDS = max(15, env_int("HOUSEKEEPING_ORDER_STATUS_SECONDS", 60))
+HOUSEKEEPING_LEADER_LOCK_KEY = env_int("HOUSEKEEPING_LEADER_LOCK_KEY", 7305039)
+WEB_THREADS = max(1, env_int("WEB_THREADS", 8))
+ORDER_STATUS_STREAM_MAX_CLIENTS = stream_capacity_value(env_int("ORDER_STATUS_STREAM_MAX_CLIENTS", 50), WEB_THREADS)
+ORDER_STATUS_STREAM_HEARTBEAT_SECONDS = max(5, env_int("ORDER_STATUS_STREAM_HEARTBEAT_SECONDS", 20))
+ORDER_STATUS_STREAM_RELOAD_SECONDS = max(30, env_int("ORDER_STATUS_STREAM_RELOAD_SECONDS", 300))
+ORDER_STATUS_STREAM_MAX_SECONDS = max(30, env_int("ORDER_STATUS_STREAM_MAX_SECONDS", 600))
 MENU_CACHE_KEY = env_str("MENU_CACHE_KEY", "menu:items:v1")
 CONTENT_AUTOSYNC_ON_STARTUP = env_bool("CONTENT_AUTOSYNC_ON_STARTUP", not is_hf_space)
 
@@ -791,6 +835,22 @@ storage = StorageFacade(
         ORDER_STATUS_STEPS,
         parse_iso_datetime_value,
     ),
+    compile_order_timeline_fn=lambda order: compile_order_timeline_value(
+        order,
+        ORDER_STATUS_STEPS,
+        parse_iso_datetime_value,
+    ),
+    order_statuses_at_fn=lambda orders, now: order_statuses_at_value(
+        orders,
+        now,
+        ORDER_STATUS_STEPS,
+        parse_iso_datetime_value,
+    ),
+    notifications_count_ttl_seconds=NOTIFICATIONS_COUNT_CACHE_TTL_SECONDS,
+    table_ids=[table["id"] for table in TABLES],
+    availability_cache_ttl_seconds=AVAILABILITY_CACHE_TTL_SECONDS,
+    background_housekeeping=HOUSEKEEPING_ENABLED,
+    order_status_batch_ttl_seconds=ORDER_STATUS_BATCH_CACHE_TTL_SECONDS,
     store_load_bookings=store_load_bookings,
     store_load_bookings_raw=store_load_bookings_raw,
     store_load_orders=store_load_orders,
@@ -827,11 +887,52 @@ if ACTIVE_STORAGE == "postgres" and CONTENT_AUTOSYNC_ON_STARTUP:
         print(f"[storage] host autosync failed ({exc})")
 elif ACTIVE_STORAGE == "postgres":
     print("[storage] host autosync skipped on startup")
+order_deadline_scheduler = None
+if ORDER_DEADLINE_SCHEDULER_ENABLED and ACTIVE_STORAGE == "postgres" and _pg_store_module is not None:
+    order_deadline_scheduler = OrderDeadlineScheduler(
+        load_open_orders=_pg_store_module.list_open_orders,
+        persist_updates=_pg_store_module.persist_order_status_fields,
+        resync_seconds=ORDER_DEADLINE_RESYNC_SECONDS,
+    )
+
+
+def refresh_open_order_statuses():
+    if order_deadline_scheduler is not None and order_deadline_scheduler.running:
+        # Orders created on other workers reach the leader's scheduler here instead of waiting for the resync.
+        return order_deadline_scheduler.track_untracked()
+    return _pg_store_module.refresh_persisted_order_fields(active_only=True)
+
+
+housekeeping = None
+if HOUSEKEEPING_ENABLED:
+    if ACTIVE_STORAGE == "postgres" and _pg_store_module is not None:
+        housekeeping = HousekeepingService(
+            try_acquire_leadership=lambda: _pg_store_module.try_acquire_leader_lock(HOUSEKEEPING_LEADER_LOCK_KEY),
+            release_leadership=lambda: _pg_store_module.release_leader_lock(HOUSEKEEPING_LEADER_LOCK_KEY),
+        )
+        housekeeping.add_job("order_status_refresh", HOUSEKEEPING_ORDER_STATUS_SECONDS, refresh_open_order_statuses)
+        if order_deadline_scheduler is not None:
+            # One scheduler for all workers: it follows housekeeping leadership.
+            housekeeping.add_leadership_listener(
+                lambda leader: order_deadline_scheduler.start() if leader else order_deadline_scheduler.stop()
+            )
+    else:
+        _housekeeping_lock = FileLeaderLock(DATA_DIR / "housekeeping.lock")
+        housekeeping = HousekeepingService(
+            try_acquire_leadership=_housekeeping_lock.try_acquire,
+            release_leadership=_housekeeping_lock.release,
+        )
+    housekeeping.add_job("bookings_expiry", HOUSEKEEPING_BOOKING_EXPIRY_SECONDS, storage.expire_bookings)
+    housekeeping.add_job("orders_retention", ORDER_PRUNE_INTERVAL_SECONDS, storage.prune_expired_orders)
 admin_service = None
 if AdminService is not None and create_admin_blueprint is not None:
     admin_service = AdminService(
         active_storage=ACTIVE_STORAGE,
         menu_content=menu_content,
+        popular_items_ttl_seconds=POPULAR_ITEMS_CACHE_TTL_SECONDS,
+        on_user_activity_changed=storage.invalidate_user_notifications,
+        on_bookings_changed=storage.invalidate_table_availability,
+        order_deadline_scheduler=order_deadline_scheduler,
     )
     app.register_blueprint(create_admin_blueprint(admin_service))
 elif _ADMIN_IMPORT_ERROR is not None:
@@ -867,7 +968,15 @@ list_reserved_table_ids = storage.list_reserved_table_ids
 create_booking_if_available = storage.create_booking_if_available
 cancel_user_booking = storage.cancel_user_booking
 cancel_booking_with_orders = storage.cancel_booking_with_orders
-create_order = storage.create_order
+
+
+def create_order(order: dict):
+    created_order = storage.create_order(order)
+    if order_deadline_scheduler is not None and order_deadline_scheduler.running and isinstance(created_order, dict):
+        order_deadline_scheduler.track(created_order)
+    return created_order
+
+
 apply_user_balance_delta = storage.apply_user_balance_delta
 next_user_id = storage.next_user_id
 next_order_id = storage.next_order_id
@@ -875,6 +984,35 @@ json_file_lock = storage.json_file_lock
 storage_write_lock = storage.storage_write_lock
 load_menu_items = menu_content.load_menu_items
 load_promo_items = menu_content.load_promo_items
+if PROMO_DISCOUNT_MODE not in DISCOUNT_MODES:
+    print(f"[promo] unknown PROMO_DISCOUNT_MODE={PROMO_DISCOUNT_MODE}, fallback=priority")
+    PROMO_DISCOUNT_MODE = "priority"
+configure_discount_policy(
+    DiscountPolicy(
+        mode=PROMO_DISCOUNT_MODE,
+        max_stacked=PROMO_DISCOUNT_MAX_STACKED,
+        exclusive_kinds=PROMO_DISCOUNT_EXCLUSIVE_KINDS,
+        allow_overlapping_targets=PROMO_DISCOUNT_ALLOW_OVERLAP,
+        candidate_budget=PROMO_DISCOUNT_CANDIDATE_BUDGET,
+    )
+)
+promo_usage = PromoUsageCounter(
+    load_counts=store_load_promo_application_counts,
+    load_user_orders=list_user_orders if store_load_promo_application_counts is None else None,
+    redis_client_fn=menu_content.get_redis_client,
+    ttl_seconds=PROMO_USAGE_CACHE_TTL_SECONDS,
+)
+load_promo_application_counts = promo_usage.counts
+# Payment and confirm enforce per-day limits, so they skip the per-process memory entry.
+load_fresh_promo_application_counts = promo_usage.fresh_counts
+checkout_pricing_sessions = CheckoutPricingSessions(ttl_seconds=CHECKOUT_PRICING_SESSION_TTL_SECONDS)
+
+
+def save_promotion_applications(**kwargs):
+    result = promo_usage.save_applications(store_save_promotion_applications, **kwargs)
+    # The pricing context holds a snapshot of the usage counts that just changed.
+    checkout_pricing_sessions.invalidate(kwargs.get("user_id"))
+    return result
 promo_items_to_news_cards = menu_content.promo_items_to_news_cards
 
 
@@ -941,14 +1079,14 @@ def user_agreement():
 @app.route("/")
 def index():
     return index_route(
-        list_user_bookings,
+        list_request_user_bookings,
         load_promo_items,
         promo_items_to_news_cards,
         NEWS_CARDS,
         load_menu_items,
-        (admin_service.get_analytics if ACTIVE_STORAGE == "postgres" and admin_service is not None else None),
-        get_user_preparing_orders,
-        list_active_order_statuses,
+        (admin_service.popular_items if ACTIVE_STORAGE == "postgres" and admin_service is not None else None),
+        get_request_preparing_orders,
+        list_request_order_statuses,
         get_user_by_id,
         POPULAR_MENU_LIMIT,
     )
@@ -968,6 +1106,61 @@ def api_order_statuses():
     )
 
 
+@app.get("/api/orders/status")
+def api_orders_status():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"ok": False, "error": "Войдите, чтобы следить за заказами."}), 401
+    order_ids = parse_order_ids_value(request.args.get("ids"), limit=ORDER_STATUS_BATCH_MAX_IDS)
+    if order_ids is None:
+        return jsonify({"ok": False, "error": f"ids: от 1 до {ORDER_STATUS_BATCH_MAX_IDS} номеров заказов через запятую."}), 400
+    snapshot = storage.order_status_snapshot(user_id, order_ids)
+    response = jsonify(
+        {
+            "ok": True,
+            "version": snapshot["version"],
+            "fields": list(ORDER_STATUS_BATCH_FIELDS),
+            "orders": snapshot["orders"],
+            "missing": snapshot["missing"],
+            "server_time": datetime.now().isoformat(timespec="seconds"),
+        }
+    )
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.set_etag(snapshot["etag"])
+    return response.make_conditional(request)
+
+
+order_status_stream = OrderStatusStream(
+    load_orders=lambda user_id: load_user_orders_for_statuses(user_id),
+    statuses_for=lambda orders: list_active_order_statuses_from_orders_value(orders, build_order_status_timeline),
+    version=storage.order_status_batch.version,
+    max_streams=ORDER_STATUS_STREAM_MAX_CLIENTS,
+    heartbeat_seconds=ORDER_STATUS_STREAM_HEARTBEAT_SECONDS,
+    reload_seconds=ORDER_STATUS_STREAM_RELOAD_SECONDS,
+    max_stream_seconds=ORDER_STATUS_STREAM_MAX_SECONDS,
+)
+
+
+@app.get("/api/order-statuses/stream")
+def api_order_statuses_stream():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"ok": False, "error": "Войдите, чтобы следить за заказами."}), 401
+    if not order_status_stream.try_acquire():
+        response = jsonify({"ok": False, "error": "Слишком много открытых подключений, используйте /api/order-statuses."})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(ORDER_STATUS_STREAM_HEARTBEAT_SECONDS)
+        return response
+    response = Response(
+        order_status_stream.events(user_id, request.headers.get("Last-Event-ID", "")),
+        mimetype="text/event-stream",
+    )
+    response.call_on_close(order_status_stream.release)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
 @app.get("/api/index-summary")
 def api_index_summary():
     user_id = session.get("user_id")
@@ -1023,6 +1216,25 @@ def debug_storage():
     )
 
 
+@app.get("/debug/db")
+def debug_db():
+    if not DEBUG_DB_METRICS_ENABLED:
+        return render_template("placeholder.html", title="Страница не найдена"), 404
+    blocked = require_debug_route_admin()
+    if blocked is not None:
+        return blocked
+    return jsonify(
+        {
+            "ok": True,
+            "storage_backend": ACTIVE_STORAGE,
+            "histogram_buckets_ms": list(query_metrics.HISTOGRAM_BUCKETS_MS),
+            **query_metrics.snapshot(),
+            "housekeeping": housekeeping.snapshot() if housekeeping is not None else None,
+            "server_time": datetime.now().isoformat(timespec="seconds"),
+        }
+    )
+
+
 @app.get("/debug/session")
 def debug_session():
     if not SESSION_DEBUG_ENABLED:
@@ -1078,6 +1290,11 @@ def availability():
     return availability_route(list_reserved_table_ids, parse_datetime)
 
 
+@app.get("/availability/day")
+def availability_day():
+    return availability_day_route(storage.get_day_availability)
+
+
 @app.route("/points")
 def points():
     return points_route()
@@ -1087,7 +1304,7 @@ def points():
 def profile():
     return profile_route(
         get_user_by_id,
-        list_user_bookings,
+        list_request_user_bookings,
         BOOKING_DURATION_MINUTES,
         is_admin_user_fn=(admin_service.is_admin_user if admin_service is not None else None),
         get_profile_about_text_fn=(admin_service.get_profile_about_text if admin_service is not None else None),
@@ -1098,7 +1315,7 @@ def profile():
 def delivery():
     return delivery_menu_route(
         load_menu_items,
-        (admin_service.get_analytics if ACTIVE_STORAGE == "postgres" and admin_service is not None else None),
+        (admin_service.popular_items if ACTIVE_STORAGE == "postgres" and admin_service is not None else None),
     )
 
 
@@ -1114,7 +1331,7 @@ def delivery_confirm():
         apply_user_balance_delta,
         verify_checkout_preview_token,
         consume_checkout_preview,
-        load_promo_application_counts,
+        load_fresh_promo_application_counts,
         save_promotion_applications,
         load_promo_items,
         load_menu_items,
@@ -1127,7 +1344,7 @@ def delivery_payment():
     return delivery_payment_route(
         resolve_order_items,
         list_user_orders,
-        load_promo_application_counts,
+        load_fresh_promo_application_counts,
         load_promo_items,
         load_menu_items,
         issue_checkout_preview_token,
@@ -1141,7 +1358,12 @@ def delivery_payment_page():
 
 @app.route("/notifications")
 def notifications():
-    return notifications_route(list_user_bookings, get_user_preparing_orders, load_promo_items, BOOKING_DURATION_MINUTES)
+    return notifications_route(
+        list_request_user_bookings,
+        get_request_preparing_orders,
+        load_promo_items,
+        BOOKING_DURATION_MINUTES,
+    )
 
 
 @app.route("/login", methods=["GET", "POST"])
@@ -1211,7 +1433,7 @@ def menu_item(item_id: int):
 def menu():
     return menu_route(
         load_menu_items,
-        (admin_service.get_analytics if ACTIVE_STORAGE == "postgres" and admin_service is not None else None),
+        (admin_service.popular_items if ACTIVE_STORAGE == "postgres" and admin_service is not None else None),
     )
 
 
@@ -1233,7 +1455,7 @@ def payment():
         resolve_order_items,
         parse_serving_option,
         list_user_orders,
-        load_promo_application_counts,
+        load_fresh_promo_application_counts,
         load_promo_items,
         load_menu_items,
         issue_checkout_preview_token,
@@ -1249,6 +1471,7 @@ def checkout_promo_preview():
         load_promo_application_counts,
         load_promo_items,
         load_menu_items,
+        checkout_pricing_sessions,
     )
 
 
@@ -1261,7 +1484,7 @@ def payment_confirm():
         apply_user_balance_delta,
         verify_checkout_preview_token,
         consume_checkout_preview,
-        load_promo_application_counts,
+        load_fresh_promo_application_counts,
         save_promotion_applications,
         load_promo_items,
         load_menu_items,
@@ -1336,6 +1559,24 @@ def list_active_order_statuses(user_id):
     return list_active_order_statuses_value(user_id, load_orders, build_order_status_timeline)
 
 
+def load_user_orders_for_statuses(user_id):
+    if ACTIVE_STORAGE == "postgres":
+        return list_user_orders(user_id)
+    return [order for order in load_orders() if order.get("user_id") == user_id]
+
+
+def order_statuses_at(orders, now: datetime):
+    return order_statuses_at_value(orders, now, ORDER_STATUS_STEPS, parse_iso_datetime)
+
+
+def build_user_activity(user_id):
+    if ACTIVE_STORAGE == "postgres":
+        orders = list_user_orders(user_id)
+    else:
+        orders = [o for o in load_orders() if o.get("user_id") == user_id]
+    return user_activity_snapshot_value(list_user_bookings(user_id), orders, order_statuses_at)
+
+
 def latest_user_booking_status(user_id):
     if ACTIVE_STORAGE == "postgres":
         return latest_user_booking_status_from_bookings_value(
@@ -1399,6 +1640,8 @@ auth_session = AuthSessionService(
     get_user_by_id=get_user_by_id,
     list_user_bookings=list_user_bookings,
     get_user_preparing_orders=get_user_preparing_orders,
+    build_user_activity=build_user_activity,
+    count_user_notifications=storage.count_user_notifications,
 )
 auth_session.list_active_order_statuses = list_active_order_statuses
 debug_login_failure = auth_session.debug_login_failure
@@ -1409,6 +1652,20 @@ issue_checkout_preview_token = auth_session.issue_checkout_preview_token
 verify_checkout_preview_token = auth_session.verify_checkout_preview_token
 get_request_user = auth_session.get_request_user
 get_request_notification_data = auth_session.get_request_notification_data
+get_request_activity = auth_session.get_request_activity
+
+
+def list_request_user_bookings(user_id):
+    return get_request_activity(user_id)["bookings"]
+
+
+def get_request_preparing_orders(user_id):
+    return get_request_activity(user_id)["preparing_orders"]
+
+
+def list_request_order_statuses(user_id):
+    return get_request_activity(user_id)["order_statuses"]
+
 
 def get_request_notifications_count():
     handler = getattr(auth_session, "get_request_notifications_count", None)
@@ -1442,6 +1699,18 @@ def delete_card():
 
 
 start_db_keepalive()
+if order_deadline_scheduler is not None and housekeeping is None:
+    order_deadline_scheduler.start()
+    print(f"[storage] order deadline scheduler started resync={ORDER_DEADLINE_RESYNC_SECONDS}s")
+if housekeeping is not None:
+    housekeeping.start()
+    print(
+        "[housekeeping] worker started bookings={0}s orders={1}s order_status={2}s".format(
+            HOUSEKEEPING_BOOKING_EXPIRY_SECONDS,
+            ORDER_PRUNE_INTERVAL_SECONDS,
+            HOUSEKEEPING_ORDER_STATUS_SECONDS if ACTIVE_STORAGE == "postgres" else "-",
+        )
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,19 @@
+"""Gunicorn settings; picked up automatically when gunicorn starts from backend/."""
+
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(str(os.getenv(name, default)).strip())
+    except (TypeError, ValueError):
+        return default
+
+
+# Order status SSE streams hold a request thread for minutes, so sync workers would block every other request.
+# app.py caps open streams at WEB_THREADS - 2 so plain requests always keep free threads.
+worker_class = "gthread"
+workers = max(1, _env_int("WEB_WORKERS", 1))
+threads = max(1, _env_int("WEB_THREADS", 8))
+timeout = max(30, _env_int("WEB_TIMEOUT", 120))
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
@@ -24,6 +24,7 @@ class PromoItem:
     end_at: str = ""
     dsl_valid: bool = True
     dsl_error: str = ""
+    dsl_ast: str = ""
 
     def to_dict(self):
         data = asdict(self)
@@ -59,4 +60,5 @@ class PromoItem:
             "end_at": data["end_at"],
             "dsl_valid": data["dsl_valid"],
             "dsl_error": data["dsl_error"],
+            "dsl_ast": data["dsl_ast"],
         }
@@ -0,0 +1,276 @@
+r"""
+Promotion evaluation micro-benchmarks on synthetic menus, promotion sets and carts.
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe ops\bench_promotions.py --output bench.json
+  .\.venv\Scripts\python.exe ops\bench_promotions.py --baseline bench.json --max-regression 0.25
+
+With --baseline the run exits with code 1 when an operation's median got slower than allowed.
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+from services.promotions import (  # noqa: E402
+    apply_promotions_to_order,
+    build_dsl_text_from_promo_item,
+    build_priced_order_preview,
+    collect_runtime_promotions,
+    invalidate_compiled_promotions,
+    parse_promotion,
+)
+from services.promotions import parser as promotion_parser  # noqa: E402
+
+
+RESULT_FORMAT_VERSION = 1
+MENU_TYPES = ("закуски", "горячее", "супы", "салаты", "десерты", "напитки", "паста", "пицца")
+SCALES = {
+    "small": {"menu_items": 40, "promotions": 10, "carts": 200},
+    "medium": {"menu_items": 150, "promotions": 60, "carts": 200},
+    "large": {"menu_items": 400, "promotions": 200, "carts": 200},
+}
+OPERATIONS = ("parse_promotion", "collect_runtime_promotions", "apply_promotions_to_order", "build_priced_order_preview")
+
+
+def build_synthetic_menu(size: int, rng: random.Random) -> list[dict]:
+    return [
+        {
+            "id": item_id,
+            "name": f"Блюдо {item_id}",
+            "type": MENU_TYPES[item_id % len(MENU_TYPES)],
+            "price": rng.randrange(90, 1500, 10),
+            "active": True,
+        }
+        for item_id in range(1, size + 1)
+    ]
+
+
+def _v1_promotion(menu_items: list[dict], rng: random.Random) -> dict:
+    item = rng.choice(menu_items)
+    shape = rng.randrange(4)
+    if shape == 0:
+        # Per-match rewards need a single `>=` comparison.
+        return {"condition": f"ID({item['id']}).QTY >= {rng.randint(1, 3)}", "reward": f"POINTS({rng.randint(10, 100)})", "reward_mode": "per_match"}
+    if shape == 1:
+        return {"condition": f"ID.{item['type']}.QTY >= 2 AND ORDER.SUM >= {rng.randrange(500, 3000, 100)}", "reward": f"DISCOUNT_RUB({rng.randrange(50, 400, 50)})"}
+    if shape == 2:
+        gift = rng.choice(menu_items)
+        return {"condition": f"ORDER.SUM >= {rng.randrange(1500, 5000, 100)}", "reward": f"GIFT({gift['id']}, 1)"}
+    return {"condition": f"ID({item['id']}).SUM >= {item['price']} OR ID.{item['type']}.QTY >= 3", "reward": f"DISCOUNT_PERCENT({rng.randint(5, 20)})"}
+
+
+def _v2_promotion(menu_items: list[dict], rng: random.Random) -> dict:
+    group = sorted({item["id"] for item in rng.sample(menu_items, min(len(menu_items), rng.randint(2, 5)))})
+    group_text = ",".join(str(item_id) for item_id in group)
+    item_type = rng.choice(MENU_TYPES)
+    shape = rng.randrange(4)
+    if shape == 0:
+        return {
+            "condition": f"GROUP({group_text}).QTY >= 2",
+            "reward": f"DISCOUNT_PERCENT({rng.randint(10, 30)}, TARGET=GROUP({group_text}))",
+        }
+    if shape == 1:
+        return {
+            "condition": f"TYPE({item_type}).QTY >= {rng.randint(1, 3)}",
+            "reward": f"POINTS({rng.randint(20, 150)})",
+            "reward_mode": "per_match",
+            "limit_per_order": str(rng.randint(2, 5)),
+        }
+    if shape == 2:
+        return {
+            "condition": f"TYPE({item_type}).UNIQUE_QTY >= 2 AND NOT GROUP({group_text}).SUM < {rng.randrange(300, 1500, 100)}",
+            "reward": f"DISCOUNT_RUB({rng.randrange(50, 300, 50)}, TARGET=ORDER)",
+        }
+    return {"condition": f"GROUP({group_text}).QTY >= 3", "reward": f"CHEAPEST_FREE_FROM_GROUP({group_text})"}
+
+
+def build_synthetic_promotions(count: int, menu_items: list[dict], rng: random.Random) -> list[dict]:
+    promotions = []
+    for promo_id in range(1, count + 1):
+        dsl_version = rng.choice((1, 2))
+        rules = _v1_promotion(menu_items, rng) if dsl_version == 1 else _v2_promotion(menu_items, rng)
+        promotions.append(
+            {
+                "id": promo_id,
+                "class": "akciya",
+                "name": f"Акция {promo_id}",
+                "active": True,
+                "priority": rng.randint(0, 100),
+                "dsl_version": str(dsl_version) if dsl_version == 2 else "",
+                **rules,
+            }
+        )
+    return promotions
+
+
+def build_synthetic_carts(count: int, menu_items: list[dict], rng: random.Random) -> list[list[dict]]:
+    carts = []
+    for _index in range(count):
+        # Mostly small carts with a long tail of large group orders.
+        lines = min(len(menu_items), max(1, int(rng.expovariate(1 / 4))))
+        carts.append(
+            [
+                {"id": item["id"], "name": item["name"], "type": item["type"], "price": item["price"], "qty": rng.choice((1, 1, 1, 2, 3))}
+                for item in rng.sample(menu_items, lines)
+            ]
+        )
+    return carts
+
+
+def _timings_summary(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "calls": len(ordered),
+        "median_us": round(statistics.median(ordered) * 1e6, 2),
+        "p95_us": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1e6, 2),
+        "min_us": round(ordered[0] * 1e6, 2),
+    }
+
+
+def _time_call(fn, samples: list[float]):
+    started_at = time.perf_counter()
+    fn()
+    samples.append(time.perf_counter() - started_at)
+
+
+def bench_scale(name: str, spec: dict, *, repeats: int, seed: int) -> dict:
+    rng = random.Random(f"{seed}:{name}")
+    menu_items = build_synthetic_menu(spec["menu_items"], rng)
+    promo_items = build_synthetic_promotions(spec["promotions"], menu_items, rng)
+    carts = build_synthetic_carts(spec["carts"], menu_items, rng)
+    promo_texts = [build_dsl_text_from_promo_item(promo_item) for promo_item in promo_items]
+    samples = {operation: [] for operation in OPERATIONS}
+
+    def parse_all():
+        for text in promo_texts:
+            parse_promotion(text)
+
+    invalidate_compiled_promotions()
+    runtime_entries = collect_runtime_promotions(promo_items, menu_items=menu_items)
+    for _round in range(repeats):
+        # Parsing memoizes repeated conditions; start each round cold like a fresh worker.
+        promotion_parser._parse_condition_memo.cache_clear()
+        promotion_parser._parse_reward_memo.cache_clear()
+        _time_call(parse_all, samples["parse_promotion"])
+        _time_call(lambda: collect_runtime_promotions(promo_items, menu_items=menu_items), samples["collect_runtime_promotions"])
+        for cart in carts:
+            _time_call(
+                lambda: apply_promotions_to_order(order={"items": cart}, promo_items=promo_items, menu_items=menu_items),
+                samples["apply_promotions_to_order"],
+            )
+            _time_call(
+                lambda: build_priced_order_preview(
+                    items=cart,
+                    service_fee=0,
+                    user_id=None,
+                    load_orders_fn=list,
+                    promo_items=promo_items,
+                    menu_items=menu_items,
+                ),
+                samples["build_priced_order_preview"],
+            )
+    invalidate_compiled_promotions()
+    return {
+        **spec,
+        "valid_promotions": len(runtime_entries),
+        "operations": {operation: _timings_summary(values) for operation, values in samples.items()},
+    }
+
+
+def _git_commit() -> str:
+    try:
+        completed = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    return completed.stdout.strip() if completed.returncode == 0 else ""
+
+
+def run_benchmarks(scales: dict, *, repeats: int = 5, seed: int = 48) -> dict:
+    return {
+        "format": RESULT_FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "repeats": repeats,
+        "seed": seed,
+        "scales": {name: bench_scale(name, spec, repeats=repeats, seed=seed) for name, spec in scales.items()},
+    }
+
+
+def find_regressions(results: dict, baseline: dict, *, max_regression: float, min_delta_us: float = 20.0) -> list[dict]:
+    """Operations whose median grew by more than `max_regression` (and `min_delta_us`, to ignore timer noise)."""
+    regressions = []
+    for scale_name, scale in (results.get("scales") or {}).items():
+        baseline_scale = (baseline.get("scales") or {}).get(scale_name) or {}
+        for operation, timing in (scale.get("operations") or {}).items():
+            previous = (baseline_scale.get("operations") or {}).get(operation)
+            if not previous or not previous.get("median_us"):
+                continue
+            before = float(previous["median_us"])
+            after = float(timing["median_us"])
+            if after > before * (1 + max_regression) and after - before > min_delta_us:
+                regressions.append(
+                    {
+                        "scale": scale_name,
+                        "operation": operation,
+                        "baseline_median_us": before,
+                        "median_us": after,
+                        "ratio": round(after / before, 3),
+                    }
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark promotion parsing and evaluation on synthetic data.")
+    parser.add_argument("--scales", default=",".join(SCALES), help=f"Comma-separated scale points ({', '.join(SCALES)}).")
+    parser.add_argument("--repeats", type=int, default=5, help="Rounds per scale point.")
+    parser.add_argument("--seed", type=int, default=48, help="Seed for the synthetic data.")
+    parser.add_argument("--output", type=Path, default=None, help="Write results as JSON to this path.")
+    parser.add_argument("--baseline", type=Path, default=None, help="Results JSON of an earlier run to compare with.")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed median slowdown vs baseline (0.25 = 25%%).")
+    args = parser.parse_args()
+
+    selected = [name.strip() for name in args.scales.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in SCALES]
+    if unknown:
+        raise SystemExit(f"Unknown scale points: {', '.join(unknown)}")
+
+    results = run_benchmarks({name: SCALES[name] for name in selected}, repeats=max(1, args.repeats), seed=args.seed)
+    for scale_name, scale in results["scales"].items():
+        print(f"[bench] {scale_name}: menu={scale['menu_items']} promotions={scale['promotions']} (valid {scale['valid_promotions']}) carts={scale['carts']}")
+        for operation, timing in scale["operations"].items():
+            print(f"[bench]   {operation}: median {timing['median_us']}us, p95 {timing['p95_us']}us")
+    if args.output:
+        args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[bench] results written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = find_regressions(results, baseline, max_regression=args.max_regression)
+        for regression in regressions:
+            print(
+                f"[bench] REGRESSION {regression['scale']}/{regression['operation']}: "
+                f"{regression['baseline_median_us']}us -> {regression['median_us']}us (x{regression['ratio']})"
+            )
+        if regressions:
+            raise SystemExit(1)
+        print(f"[bench] no regressions above {args.max_regression:.0%} vs {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
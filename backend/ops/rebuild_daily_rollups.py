@@ -0,0 +1,39 @@
+r"""
+Rebuild daily_sales_rollup / daily_item_rollup from orders and order_items.
+
+Usage (PowerShell):
+  $env:DATABASE_URL="postgresql://..."; .\.venv\Scripts\python.exe ops\rebuild_daily_rollups.py
+  $env:DATABASE_URL="postgresql://..."; .\.venv\Scripts\python.exe ops\rebuild_daily_rollups.py --from 2026-10-01 --to 2026-10-19
+"""
+
+import argparse
+import os
+import sys
+from datetime import date
+from pathlib import Path
+
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+from storage import pg_store  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild daily analytics rollups from raw orders.")
+    parser.add_argument("--from", dest="start_date", type=date.fromisoformat, default=None, help="First local date to rebuild (YYYY-MM-DD).")
+    parser.add_argument("--to", dest="end_date", type=date.fromisoformat, default=None, help="Local date to stop before (YYYY-MM-DD, exclusive).")
+    args = parser.parse_args()
+
+    database_url = (os.getenv("DATABASE_URL") or "").strip()
+    if not database_url:
+        raise SystemExit("DATABASE_URL is not set")
+
+    result = pg_store.rebuild_daily_rollups(start_date=args.start_date, end_date=args.end_date)
+    print(f"[rollups] sales rows: {result['sales_rows']}, item rows: {result['item_rows']}")
+
+
+if __name__ == "__main__":
+    main()
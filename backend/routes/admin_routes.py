@@ -503,6 +503,18 @@ def create_admin_blueprint(admin_service):
             return jsonify({"ok": False, "error": str(exc)}), 400
         return jsonify(preview)
 
+    @admin.post("/api/promo/simulate")
+    def api_promo_simulate():
+        blocked = guard(is_api=True)
+        if blocked is not None:
+            return blocked
+        payload = request.get_json(silent=True) or {}
+        try:
+            result = admin_service.simulate_promo_dsl(payload)
+        except ValueError as exc:
+            return jsonify({"ok": False, "error": str(exc)}), 400
+        return jsonify(result)
+
     @admin.post("/promo/<class_name>/<int:item_id>/delete")
     def promo_delete(class_name: str, item_id: int):
         blocked = guard()
@@ -51,6 +51,39 @@ def availability_route(list_reserved_table_ids, parse_datetime):
     return response
 
 
+def availability_day_route(get_day_availability):
+    occupancy = get_day_availability(request.args.get("date"))
+    if occupancy is None:
+        response = jsonify({"ok": False, "error": "Некорректная дата."})
+        response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+        return response, 400
+    encoding = (request.args.get("encoding") or "bitset").strip().lower()
+    if encoding not in {"bitset", "rle"}:
+        response = jsonify({"ok": False, "error": "encoding must be bitset or rle"})
+        response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+        return response, 400
+    table_ids = sorted(occupancy.bitmaps)
+    if encoding == "rle":
+        reserved = {str(table_id): occupancy.busy_runs(table_id) for table_id in table_ids}
+    else:
+        reserved = {str(table_id): occupancy.bitmap_hex(table_id) for table_id in table_ids}
+    response = jsonify(
+        {
+            "ok": True,
+            "date": occupancy.day.isoformat(),
+            "slot_minutes": occupancy.slot_minutes,
+            "slots": occupancy.slots,
+            "duration_minutes": int(occupancy.duration.total_seconds() // 60),
+            "encoding": encoding,
+            "reserved": reserved,
+        }
+    )
+    # Revalidate on every use; an unchanged day is answered with 304 and no body.
+    response.headers["Cache-Control"] = "no-cache"
+    response.set_etag(f"{occupancy.etag}-{encoding}")
+    return response.make_conditional(request)
+
+
 def book_table_route(
     create_booking_if_available,
     parse_datetime,
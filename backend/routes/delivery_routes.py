@@ -88,12 +88,12 @@ def _build_delivery_address(data):
     return "; ".join(lines)
 
 
-def delivery_menu_route(load_menu_items, get_popular_analytics=None):
+def delivery_menu_route(load_menu_items, get_popular_items=None):
     from routes.menu_routes import _attach_menu_popularity
 
     return render_template(
         "menu.html",
-        items=_attach_menu_popularity(load_menu_items(), get_popular_analytics),
+        items=_attach_menu_popularity(load_menu_items(), get_popular_items),
         delivery_mode=True,
     )
 
@@ -89,17 +89,16 @@ def _pick_popular_items(items, limit):
     return _POPULAR_ROTATOR.sample(pool, safe_limit)
 
 
-def _pick_popular_items_from_analytics(get_popular_analytics, items, limit):
-    if not callable(get_popular_analytics):
+def _pick_popular_items_from_analytics(get_popular_items, items, limit):
+    if not callable(get_popular_items):
         return []
     menu_pool = list(items or [])
     if not menu_pool:
         return []
     try:
-        analytics = get_popular_analytics({"period": "30d", "mode": "all"}) or {}
+        ranked_items = get_popular_items("30d") or []
     except Exception:
         return []
-    ranked_items = analytics.get("top_qty_items") or []
     if not ranked_items:
         return []
     item_index = {}
@@ -160,7 +159,7 @@ def index_route(
     promo_items_to_news_cards,
     news_cards_fallback,
     load_menu_items,
-    get_popular_analytics,
+    get_popular_items,
     get_user_preparing_orders,
     list_active_order_statuses,
     *compat_args,
@@ -184,7 +183,7 @@ def index_route(
     promo_gallery_cards = _promo_items_to_gallery_cards(promo_items)
     all_menu_items = load_menu_items()
     limit = max(1, int(popular_menu_limit or 3))
-    popular_menu = _pick_popular_items_from_analytics(get_popular_analytics, all_menu_items, limit)
+    popular_menu = _pick_popular_items_from_analytics(get_popular_items, all_menu_items, limit)
     featured_items = [item for item in all_menu_items if item.get("featured")]
     if not popular_menu:
         featured_items.sort(key=lambda item: (-int(item.get("popularity") or 0), int(item.get("id") or 0)))
@@ -1,15 +1,15 @@
 from flask import redirect, render_template, url_for
 
 
-def _attach_menu_popularity(items, get_popular_analytics=None):
+def _attach_menu_popularity(items, get_popular_items=None):
     menu_items = [dict(item or {}) for item in (items or [])]
     popularity_by_id = {}
-    if callable(get_popular_analytics):
+    if callable(get_popular_items):
         try:
-            analytics = get_popular_analytics({"period": "30d", "mode": "all"}) or {}
+            ranked_items = get_popular_items("30d") or []
         except Exception:
-            analytics = {}
-        for entry in analytics.get("full_items") or []:
+            ranked_items = []
+        for entry in ranked_items:
             try:
                 item_id = int(entry.get("id") or 0)
             except (TypeError, ValueError):
@@ -38,8 +38,8 @@ def menu_item_route(item_id, load_menu_items):
     return redirect(url_for("menu"))
 
 
-def menu_route(load_menu_items, get_popular_analytics=None):
+def menu_route(load_menu_items, get_popular_items=None):
     return render_template(
         "menu.html",
-        items=_attach_menu_popularity(load_menu_items(), get_popular_analytics),
+        items=_attach_menu_popularity(load_menu_items(), get_popular_items),
     )
@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 
 from flask import g, jsonify, redirect, render_template, request, session, url_for
 from services.business_logic import current_timestamp_value
+from services.pricing_sessions import normalize_cart_delta_value
 from services.promotions import build_priced_order_preview
 
 
@@ -219,37 +220,71 @@ def checkout_promo_preview_route(
     load_promo_application_counts,
     load_promo_items,
     load_menu_items,
+    pricing_sessions=None,
 ):
     user_id = session.get("user_id")
     if not user_id:
         return jsonify({"ok": False, "error": "Войдите, чтобы продолжить оформление."}), 401
 
     payload = request.get_json(silent=True) or {}
-    raw_items = payload.get("items")
-    if not isinstance(raw_items, list):
-        raw_items = []
-
-    normalized_source_items = []
-    for item in raw_items:
-        if not isinstance(item, dict):
-            continue
-        try:
-            item_id = int(item.get("id"))
-            qty = int(item.get("qty"))
-        except (TypeError, ValueError):
-            continue
-        if item_id <= 0 or qty <= 0:
-            continue
-        normalized_source_items.append({"id": item_id, "qty": qty})
-
-    resolved_items = resolve_order_items(json.dumps(normalized_source_items, ensure_ascii=False))
-
     user = getattr(g, "current_user", None)
     if not user or user.get("id") != user_id:
         user = get_user_by_id(user_id)
     if user is None:
         return jsonify({"ok": False, "error": "Пользователь не найден."}), 404
 
+    context = None
+    if pricing_sessions is not None and "delta" in payload:
+        # Incremental preview: only the changed lines arrive, the rest of the cart lives in the pricing context.
+        try:
+            revision = int(payload.get("revision"))
+        except (TypeError, ValueError):
+            revision = -1
+        context = pricing_sessions.advance(
+            payload.get("pricing_session"),
+            user_id=user_id,
+            revision=revision,
+            changes=normalize_cart_delta_value(payload.get("delta")),
+            menu_items=load_menu_items(),
+            promo_items=load_promo_items(),
+        )
+        if context is None:
+            return jsonify({"ok": False, "error": "pricing_session_expired"}), 409
+        resolved_items = context.items()
+        promo_items = context.promo_items
+        menu_items = context.menu_items
+        usage_counts = context.usage_counts
+    else:
+        raw_items = payload.get("items")
+        if not isinstance(raw_items, list):
+            raw_items = []
+
+        normalized_source_items = []
+        for item in raw_items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                item_id = int(item.get("id"))
+                qty = int(item.get("qty"))
+            except (TypeError, ValueError):
+                continue
+            if item_id <= 0 or qty <= 0:
+                continue
+            normalized_source_items.append({"id": item_id, "qty": qty})
+
+        resolved_items = resolve_order_items(json.dumps(normalized_source_items, ensure_ascii=False))
+        promo_items = load_promo_items()
+        menu_items = load_menu_items()
+        usage_counts = load_promo_application_counts(user_id=user_id) if load_promo_application_counts is not None else None
+        if pricing_sessions is not None and usage_counts is not None:
+            context = pricing_sessions.open(
+                user_id=user_id,
+                items=resolved_items,
+                menu_items=menu_items,
+                promo_items=promo_items,
+                usage_counts=usage_counts,
+            )
+
     use_points = bool(payload.get("use_points"))
     pricing = build_priced_order_preview(
         items=resolved_items,
@@ -257,21 +292,23 @@ def checkout_promo_preview_route(
         use_points=use_points,
         user_id=user_id,
         load_orders_fn=lambda: list_user_orders(user_id),
-        load_promo_application_counts_fn=load_promo_application_counts,
-        promo_items=load_promo_items(),
-        menu_items=load_menu_items(),
-    )
-    return jsonify(
-        {
-            "ok": True,
-            "promo_points": pricing["promo_points"],
-            "promo_notifications": pricing["promo_notifications"],
-            "promotions_applied": pricing["promotions_applied"],
-            "discount_total": pricing["discount_total"],
-            "discount": pricing["discount"],
-            "totals": pricing["totals"],
-        }
+        load_promo_application_counts_fn=(lambda **_kwargs: usage_counts) if usage_counts is not None else None,
+        promo_items=promo_items,
+        menu_items=menu_items,
     )
+    response_payload = {
+        "ok": True,
+        "promo_points": pricing["promo_points"],
+        "promo_notifications": pricing["promo_notifications"],
+        "promotions_applied": pricing["promotions_applied"],
+        "discount_total": pricing["discount_total"],
+        "discount": pricing["discount"],
+        "totals": pricing["totals"],
+    }
+    if context is not None:
+        response_payload["pricing_session"] = context.session_id
+        response_payload["revision"] = context.revision
+    return jsonify(response_payload)
 
 
 def payment_confirm_route(
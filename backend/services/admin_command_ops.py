@@ -1,6 +1,8 @@
 from datetime import datetime
 from typing import Any
 
+from services.business_logic import UTC
+
 
 def _safe_int(value: Any, default: int = 0) -> int:
     try:
@@ -16,12 +18,11 @@ def update_order_status(service, *, admin_user_id: int, order_id: int, status: s
     order = service.get_order_detail(order_id)
     if order is None:
         raise ValueError("Заказ не найден.")
-    cancelled_at = datetime.now().isoformat(timespec="seconds") if normalized == "cancelled" else ""
-    service._execute(
-        "UPDATE orders SET status = %s, cancelled_at = %s WHERE id = %s",
-        (normalized, cancelled_at, int(order_id)),
-    )
+    cancelled_at = datetime.now(UTC) if normalized == "cancelled" else None
+    service._set_order_status(order_id=int(order_id), status=normalized, cancelled_at=cancelled_at)
     service._refresh_persisted_order_fields(order_ids=[int(order_id)])
+    service._notify_order_changed(int(order_id))
+    service._notify_user_activity_changed(order.get("user_id"))
     service.log_admin_action(
         admin_user_id=admin_user_id,
         action_type=entity_action,
@@ -49,6 +50,8 @@ def cancel_booking(service, *, admin_user_id: int, booking_id: int, reason: str)
     if booking is None:
         raise ValueError("Бронь не найдена.")
     service._execute("DELETE FROM bookings WHERE id = %s", (int(booking_id),))
+    service._notify_user_activity_changed(booking.get("user_id"))
+    service._notify_bookings_changed(booking.get("booking_date"))
     service.log_admin_action(
         admin_user_id=admin_user_id,
         action_type="booking_cancelled",
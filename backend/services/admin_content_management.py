@@ -1,12 +1,15 @@
+from datetime import timedelta
 from pathlib import Path
 import shutil
 from typing import Any
 
 from werkzeug.datastructures import FileStorage
 
+from services.business_logic import current_time_value, parse_iso_datetime_value
 from services.path_naming import ascii_slug, canonical_menu_photo_path, canonical_promo_photo_path
 from services.promotions import build_dsl_text_from_promo_item, parse_and_validate_promo_source
 from services.promotions.ast import PromotionDslError
+from services.promotions.simulation import PromotionSimulation
 from services.promotions.validator import PromotionValidationError
 from services.url_safety import normalize_public_link
 
@@ -326,6 +329,79 @@ def preview_promo_dsl(service, form: dict):
     }
 
 
+PROMO_SIMULATION_MAX_DAYS = 90
+
+
+def simulate_promo_dsl(service, form: dict, *, chunk_size: int = 500):
+    payload = validate_promo_form(service, form)
+    if not payload["condition"] or not payload["reward"]:
+        raise ValueError("Для симуляции нужны условие и награда.")
+    promo_payload = {
+        "class": "akciya",
+        "name": payload["name"],
+        "active": True,
+        "priority": _safe_int(form.get("priority"), 100),
+        **payload,
+    }
+    menu_items = service.menu_content.load_menu_items_admin()
+    definition = parse_and_validate_promo_source(promo_payload, menu_items=menu_items)
+    days = max(1, min(PROMO_SIMULATION_MAX_DAYS, _safe_int(form.get("days"), 30)))
+    since = current_time_value() - timedelta(days=days)
+    item_types = {_safe_int(item.get("id")): str(item.get("type") or "").strip() for item in menu_items or []}
+    simulation = PromotionSimulation(definition)
+    last_order_id = 0
+    while True:
+        # Keyset pages of whole carts, so a month of orders is never held in memory at once.
+        rows = service._fetch_all(
+            """
+            SELECT
+                o.id,
+                o.user_id,
+                o.created_at,
+                array_agg(oi.item_id ORDER BY oi.position) AS item_ids,
+                array_agg(oi.price ORDER BY oi.position) AS prices,
+                array_agg(oi.qty ORDER BY oi.position) AS qtys
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.id
+            WHERE o.created_at >= %s
+              AND o.id > %s
+              AND o.status <> 'cancelled'
+            GROUP BY o.id
+            ORDER BY o.id
+            LIMIT %s
+            """,
+            (since, last_order_id, int(chunk_size)),
+        )
+        if not rows:
+            break
+        simulation.add_carts(
+            {
+                "user_id": row.get("user_id"),
+                "created_at": parse_iso_datetime_value(row.get("created_at")),
+                "items": [
+                    {"id": item_id, "type": item_types.get(_safe_int(item_id), ""), "price": price, "qty": qty}
+                    for item_id, price, qty in zip(row.get("item_ids") or [], row.get("prices") or [], row.get("qtys") or [])
+                    # Gift lines are stored with a zero price.
+                    if _safe_int(price) > 0
+                ],
+            }
+            for row in rows
+        )
+        last_order_id = _safe_int(rows[-1].get("id"))
+        if len(rows) < chunk_size:
+            break
+    return {
+        "ok": True,
+        "days": days,
+        "summary": {
+            "name": definition.name,
+            "reward_kind": definition.reward.kind,
+            "reward_mode": definition.reward_mode,
+        },
+        "simulation": simulation.summary(),
+    }
+
+
 def delete_promo_item(service, *, admin_user_id: int, class_name: str, item_id: int, reason: str, promo_items_path):
     if not reason:
         raise ValueError("Укажите причину удаления.")
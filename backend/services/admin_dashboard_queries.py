@@ -4,9 +4,26 @@ from typing import Any
 
 from flask import url_for
 
+from services.business_logic import APP_TIMEZONE, current_local_datetime_value
 from services.order_status import read_delivery_overdue_value
 
 
+APP_TIMEZONE_NAME = getattr(APP_TIMEZONE, "key", "UTC")
+ANALYTICS_PERIOD_DAYS = {"today": 1, "7d": 7, "30d": 30, "month": 30}
+AGGREGATE_KEYS = (
+    "total_orders",
+    "orders_count",
+    "cancellations",
+    "points_applied",
+    "bonus_earned",
+    "revenue",
+    "dine_in_orders",
+    "delivery_orders",
+    "dine_in_revenue",
+    "delivery_revenue",
+)
+
+
 def _safe_int(value: Any, default: int = 0) -> int:
     try:
         return int(value)
@@ -15,15 +32,35 @@ def _safe_int(value: Any, default: int = 0) -> int:
 
 
 def _today_bounds(now: datetime | None = None):
-    now = now or datetime.now()
+    now = now or current_local_datetime_value()
     start = datetime(now.year, now.month, now.day)
     return start, start + timedelta(days=1)
 
 
+def _local_bound(value: datetime) -> datetime:
+    return value if value.tzinfo is not None else value.replace(tzinfo=APP_TIMEZONE)
+
+
+def _split_rollup_range(range_start: datetime, range_end: datetime, today_start: datetime):
+    first_full_day = range_start.replace(hour=0, minute=0, second=0, microsecond=0)
+    if first_full_day < range_start:
+        first_full_day += timedelta(days=1)
+    last_full_day = min(range_end.replace(hour=0, minute=0, second=0, microsecond=0), today_start)
+    if first_full_day >= last_full_day:
+        return None, [(range_start, range_end)]
+    raw_ranges = []
+    if range_start < first_full_day:
+        raw_ranges.append((range_start, first_full_day))
+    if last_full_day < range_end:
+        raw_ranges.append((last_full_day, range_end))
+    return (first_full_day.date(), last_full_day.date()), raw_ranges
+
+
 def get_dashboard_data(service, *, now: datetime | None = None):
-    service._refresh_persisted_order_fields(active_only=True)
-    now = now or datetime.now()
+    service._refresh_open_order_fields()
+    now = now or current_local_datetime_value()
     start, end = _today_bounds(now)
+    start_bound, end_bound = _local_bound(start), _local_bound(end)
     booking_now = now
     payable_total_sql = """
         GREATEST(
@@ -34,18 +71,39 @@ def get_dashboard_data(service, *, now: datetime | None = None):
     aggregate_row = service._fetch_one(
         f"""
         SELECT
-            COALESCE(SUM(CASE WHEN LOWER(COALESCE(effective_status, status, '')) NOT IN ('served', 'cancelled') THEN 1 ELSE 0 END), 0) AS active_orders,
-            COALESCE(SUM(CASE WHEN LOWER(COALESCE(order_type, 'dine_in')) = 'delivery' AND LOWER(COALESCE(effective_status, status, '')) NOT IN ('served', 'cancelled') THEN 1 ELSE 0 END), 0) AS delivery_in_work,
-            COALESCE(SUM(CASE WHEN created_at >= %s AND created_at < %s AND LOWER(COALESCE(effective_status, status, '')) <> 'cancelled' THEN {payable_total_sql} ELSE 0 END), 0) AS today_revenue,
-            COALESCE(SUM(CASE WHEN cancelled_at >= %s AND cancelled_at < %s THEN 1 ELSE 0 END), 0) AS today_cancellations
-        FROM orders
+            (
+                SELECT COUNT(*)
+                FROM orders
+                WHERE effective_status NOT IN ('served', 'cancelled')
+            ) AS active_orders,
+            (
+                SELECT COUNT(*)
+                FROM orders
+                WHERE order_type = 'delivery'
+                  AND effective_status NOT IN ('served', 'cancelled')
+            ) AS delivery_in_work,
+            (
+                SELECT COALESCE(SUM({payable_total_sql}), 0)
+                FROM orders
+                WHERE created_at >= %s
+                  AND created_at < %s
+                  AND status <> 'cancelled'
+            ) AS today_revenue,
+            (
+                SELECT COUNT(*)
+                FROM orders
+                WHERE cancelled_at >= %s
+                  AND cancelled_at < %s
+            ) AS today_cancellations,
+            (
+                SELECT COUNT(*)
+                FROM orders
+                WHERE order_type = 'delivery'
+                  AND effective_status NOT IN ('served', 'cancelled')
+                  AND is_delivery_overdue
+            ) AS overdue_deliveries
         """,
-        (
-            start.isoformat(timespec="seconds"),
-            end.isoformat(timespec="seconds"),
-            start.isoformat(timespec="seconds"),
-            end.isoformat(timespec="seconds"),
-        ),
+        (start_bound, end_bound, start_bound, end_bound),
     ) or {}
     active_bookings_row = service._fetch_one(
         """
@@ -57,12 +115,13 @@ def get_dashboard_data(service, *, now: datetime | None = None):
     ) or {"count": 0}
     overdue_rows = service._fetch_all(
         """
-        SELECT id, created_at, delivery_eta_minutes, order_type, status, effective_status, is_delivery_overdue
+        SELECT id, is_delivery_overdue
         FROM orders
-        WHERE LOWER(COALESCE(order_type, 'dine_in')) = 'delivery'
-          AND LOWER(COALESCE(effective_status, status, '')) NOT IN ('served', 'cancelled')
+        WHERE order_type = 'delivery'
+          AND effective_status NOT IN ('served', 'cancelled')
+          AND is_delivery_overdue
         ORDER BY created_at ASC, id ASC
-        LIMIT 100
+        LIMIT 5
         """
     )
     today_orders = service._fetch_all(
@@ -73,7 +132,7 @@ def get_dashboard_data(service, *, now: datetime | None = None):
         ORDER BY created_at DESC, id DESC
         LIMIT 8
         """,
-        (start.isoformat(timespec="seconds"), end.isoformat(timespec="seconds")),
+        (start_bound, end_bound),
     )
     nearest_bookings = service._fetch_all(
         """
@@ -89,12 +148,9 @@ def get_dashboard_data(service, *, now: datetime | None = None):
     )
     latest_actions = service.list_audit_actions(limit=8)
     attention = []
-    overdue_deliveries = 0
     for order in overdue_rows:
         if read_delivery_overdue_value(order):
-            overdue_deliveries += 1
-            if len(attention) < 5:
-                attention.append({"title": f"Просрочена доставка #{order['id']}", "href": url_for("admin.delivery")})
+            attention.append({"title": f"Просрочена доставка #{order['id']}", "href": url_for("admin.delivery")})
     for booking in nearest_bookings:
         booking["state_label"] = "Активна" if service.booking_state(booking, booking_now) == "active" else "Прошла"
     today_orders = service._normalize_order_rows(today_orders)
@@ -105,7 +161,7 @@ def get_dashboard_data(service, *, now: datetime | None = None):
             "delivery_in_work": _safe_int(aggregate_row.get("delivery_in_work")),
             "today_revenue": _safe_int(aggregate_row.get("today_revenue")),
             "today_cancellations": _safe_int(aggregate_row.get("today_cancellations")),
-            "overdue_deliveries": overdue_deliveries,
+            "overdue_deliveries": _safe_int(aggregate_row.get("overdue_deliveries")),
         },
         "attention": attention,
         "nearest_bookings": nearest_bookings,
@@ -114,9 +170,48 @@ def get_dashboard_data(service, *, now: datetime | None = None):
     }
 
 
+def get_popular_items(service, period: str = "30d", *, now: datetime | None = None):
+    now = now or current_local_datetime_value()
+    days = ANALYTICS_PERIOD_DAYS.get(period, 30)
+    today_start, _ = _today_bounds(now)
+    start = today_start - timedelta(days=days - 1)
+    rows = []
+    if start < today_start:
+        rows = service._fetch_all(
+            """
+            SELECT item_id, COALESCE(SUM(qty_total), 0) AS qty_total
+            FROM daily_item_rollup
+            WHERE sales_date >= %s
+              AND sales_date < %s
+            GROUP BY item_id
+            """,
+            (start.date(), today_start.date()),
+        )
+    rows += service._fetch_all(
+        """
+        SELECT oi.item_id, COALESCE(SUM(oi.qty), 0) AS qty_total
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        WHERE o.created_at >= %s
+          AND o.created_at < %s
+          AND o.status <> 'cancelled'
+        GROUP BY oi.item_id
+        """,
+        (_local_bound(today_start), _local_bound(now)),
+    )
+    qty_by_item = {}
+    for row in rows:
+        item_id = _safe_int(row.get("item_id"))
+        if item_id <= 0:
+            continue
+        qty_by_item[item_id] = qty_by_item.get(item_id, 0) + _safe_int(row.get("qty_total"))
+    ranked = sorted(qty_by_item.items(), key=lambda entry: (-entry[1], entry[0]))
+    return [{"id": item_id, "qty_total": qty_total} for item_id, qty_total in ranked if qty_total > 0]
+
+
 def get_analytics(service, filters: dict, *, now: datetime | None = None):
     def build_bounds(now_value: datetime, selected_period: str):
-        selected_days = {"today": 1, "7d": 7, "30d": 30, "month": 30}.get(selected_period, 7)
+        selected_days = ANALYTICS_PERIOD_DAYS.get(selected_period, 7)
         period_start = (now_value - timedelta(days=selected_days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
         period_end = now_value
         previous_period_end = period_start
@@ -174,7 +269,45 @@ def get_analytics(service, filters: dict, *, now: datetime | None = None):
         }
 
     def aggregate_orders(range_start: datetime, range_end: datetime):
-        params = [range_start.isoformat(timespec="seconds"), range_end.isoformat(timespec="seconds")]
+        rollup_days, raw_ranges = _split_rollup_range(range_start, range_end, today_start)
+        totals = {}
+        if rollup_days is not None:
+            totals = aggregate_rollup_orders(*rollup_days)
+        for raw_start, raw_end in raw_ranges:
+            for key, value in aggregate_raw_orders(raw_start, raw_end).items():
+                totals[key] = totals.get(key, 0) + value
+        return {key: totals.get(key, 0) for key in AGGREGATE_KEYS}
+
+    def aggregate_rollup_orders(first_day, end_day):
+        params = [first_day, end_day]
+        mode_sql = ""
+        if mode in {"dine_in", "delivery"}:
+            mode_sql = "AND order_type = %s"
+            params.append(mode)
+        aggregate = service._fetch_one(
+            f"""
+            SELECT
+                COALESCE(SUM(total_orders), 0) AS total_orders,
+                COALESCE(SUM(orders_count), 0) AS orders_count,
+                COALESCE(SUM(cancellations), 0) AS cancellations,
+                COALESCE(SUM(points_applied), 0) AS points_applied,
+                COALESCE(SUM(bonus_earned), 0) AS bonus_earned,
+                COALESCE(SUM(revenue), 0) AS revenue,
+                COALESCE(SUM(orders_count) FILTER (WHERE order_type = 'dine_in'), 0) AS dine_in_orders,
+                COALESCE(SUM(orders_count) FILTER (WHERE order_type = 'delivery'), 0) AS delivery_orders,
+                COALESCE(SUM(revenue) FILTER (WHERE order_type = 'dine_in'), 0) AS dine_in_revenue,
+                COALESCE(SUM(revenue) FILTER (WHERE order_type = 'delivery'), 0) AS delivery_revenue
+            FROM daily_sales_rollup
+            WHERE sales_date >= %s
+              AND sales_date < %s
+              {mode_sql}
+            """,
+            tuple(params),
+        ) or {}
+        return {key: _safe_int(value) for key, value in aggregate.items()}
+
+    def aggregate_raw_orders(range_start: datetime, range_end: datetime):
+        params = [_local_bound(range_start), _local_bound(range_end)]
         mode_sql = ""
         if mode in {"dine_in", "delivery"}:
             mode_sql = "AND order_type = %s"
@@ -183,15 +316,15 @@ def get_analytics(service, filters: dict, *, now: datetime | None = None):
             f"""
             SELECT
                 COUNT(*) AS total_orders,
-                COALESCE(SUM(CASE WHEN LOWER(status) <> 'cancelled' THEN 1 ELSE 0 END), 0) AS orders_count,
-                COALESCE(SUM(CASE WHEN LOWER(status) = 'cancelled' THEN 1 ELSE 0 END), 0) AS cancellations,
+                COALESCE(SUM(CASE WHEN status <> 'cancelled' THEN 1 ELSE 0 END), 0) AS orders_count,
+                COALESCE(SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END), 0) AS cancellations,
                 COALESCE(SUM(GREATEST(COALESCE(points_applied, 0), 0)), 0) AS points_applied,
                 COALESCE(SUM({bonus_earned_sql}), 0) AS bonus_earned,
-                COALESCE(SUM(CASE WHEN LOWER(status) <> 'cancelled' THEN {payable_total_sql} ELSE 0 END), 0) AS revenue,
-                COALESCE(SUM(CASE WHEN LOWER(status) <> 'cancelled' AND LOWER(COALESCE(order_type, 'dine_in')) = 'dine_in' THEN 1 ELSE 0 END), 0) AS dine_in_orders,
-                COALESCE(SUM(CASE WHEN LOWER(status) <> 'cancelled' AND LOWER(COALESCE(order_type, 'dine_in')) = 'delivery' THEN 1 ELSE 0 END), 0) AS delivery_orders,
-                COALESCE(SUM(CASE WHEN LOWER(status) <> 'cancelled' AND LOWER(COALESCE(order_type, 'dine_in')) = 'dine_in' THEN {payable_total_sql} ELSE 0 END), 0) AS dine_in_revenue,
-                COALESCE(SUM(CASE WHEN LOWER(status) <> 'cancelled' AND LOWER(COALESCE(order_type, 'dine_in')) = 'delivery' THEN {payable_total_sql} ELSE 0 END), 0) AS delivery_revenue
+                COALESCE(SUM(CASE WHEN status <> 'cancelled' THEN {payable_total_sql} ELSE 0 END), 0) AS revenue,
+                COALESCE(SUM(CASE WHEN status <> 'cancelled' AND order_type = 'dine_in' THEN 1 ELSE 0 END), 0) AS dine_in_orders,
+                COALESCE(SUM(CASE WHEN status <> 'cancelled' AND order_type = 'delivery' THEN 1 ELSE 0 END), 0) AS delivery_orders,
+                COALESCE(SUM(CASE WHEN status <> 'cancelled' AND order_type = 'dine_in' THEN {payable_total_sql} ELSE 0 END), 0) AS dine_in_revenue,
+                COALESCE(SUM(CASE WHEN status <> 'cancelled' AND order_type = 'delivery' THEN {payable_total_sql} ELSE 0 END), 0) AS delivery_revenue
             FROM orders
             WHERE created_at >= %s
               AND created_at < %s
@@ -299,10 +432,11 @@ def get_analytics(service, filters: dict, *, now: datetime | None = None):
         )
         return insights
 
-    now = now or datetime.now()
+    now = now or current_local_datetime_value()
     period = str(filters.get("period") or "7d")
     mode = str(filters.get("mode") or "all")
     days, start, end, previous_start, previous_end = build_bounds(now, period)
+    today_start, _ = _today_bounds(now)
     payable_total_sql = """
         GREATEST(
             COALESCE(payable_total, COALESCE(items_total, 0) - COALESCE(points_applied, 0)),
@@ -353,28 +487,52 @@ def get_analytics(service, filters: dict, *, now: datetime | None = None):
         "dine_in_revenue": previous_order_metrics["dine_in_revenue"],
         "delivery_revenue": previous_order_metrics["delivery_revenue"],
     }
-    daily_params = [start.isoformat(timespec="seconds"), end.isoformat(timespec="seconds")]
+    rollup_start_date = start.date()
+    today_date = today_start.date()
+    mode_params = []
     mode_sql = ""
     aliased_mode_sql = ""
     if mode in {"dine_in", "delivery"}:
         mode_sql = "AND order_type = %s"
         aliased_mode_sql = "AND o.order_type = %s"
-        daily_params.append(mode)
-    daily_rows = service._fetch_all(
+        mode_params.append(mode)
+    daily_rows = []
+    if rollup_start_date < today_date:
+        daily_rows = service._fetch_all(
+            f"""
+            SELECT
+                sales_date::text AS label,
+                COALESCE(SUM(orders_count), 0) AS orders_count,
+                COALESCE(SUM(cancellations), 0) AS cancellations,
+                COALESCE(SUM(revenue), 0) AS revenue,
+                COALESCE(SUM(orders_count) FILTER (WHERE order_type = 'dine_in'), 0) AS dine_in_orders,
+                COALESCE(SUM(orders_count) FILTER (WHERE order_type = 'delivery'), 0) AS delivery_orders
+            FROM daily_sales_rollup
+            WHERE sales_date >= %s
+              AND sales_date < %s
+              {mode_sql}
+            GROUP BY sales_date
+            ORDER BY sales_date ASC
+            """,
+            (rollup_start_date, today_date, *mode_params),
+        )
+    raw_start = max(start, today_start)
+    daily_params = [APP_TIMEZONE_NAME, _local_bound(raw_start), _local_bound(end), *mode_params]
+    daily_rows += service._fetch_all(
         f"""
         SELECT
-            created_at::date::text AS label,
-            COALESCE(SUM(CASE WHEN LOWER(status) <> 'cancelled' THEN 1 ELSE 0 END), 0) AS orders_count,
-            COALESCE(SUM(CASE WHEN LOWER(status) = 'cancelled' THEN 1 ELSE 0 END), 0) AS cancellations,
-            COALESCE(SUM(CASE WHEN LOWER(status) <> 'cancelled' THEN {payable_total_sql} ELSE 0 END), 0) AS revenue,
-            COALESCE(SUM(CASE WHEN LOWER(status) <> 'cancelled' AND LOWER(COALESCE(order_type, 'dine_in')) = 'dine_in' THEN 1 ELSE 0 END), 0) AS dine_in_orders,
-            COALESCE(SUM(CASE WHEN LOWER(status) <> 'cancelled' AND LOWER(COALESCE(order_type, 'dine_in')) = 'delivery' THEN 1 ELSE 0 END), 0) AS delivery_orders
+            (created_at AT TIME ZONE %s)::date::text AS label,
+            COALESCE(SUM(CASE WHEN status <> 'cancelled' THEN 1 ELSE 0 END), 0) AS orders_count,
+            COALESCE(SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END), 0) AS cancellations,
+            COALESCE(SUM(CASE WHEN status <> 'cancelled' THEN {payable_total_sql} ELSE 0 END), 0) AS revenue,
+            COALESCE(SUM(CASE WHEN status <> 'cancelled' AND order_type = 'dine_in' THEN 1 ELSE 0 END), 0) AS dine_in_orders,
+            COALESCE(SUM(CASE WHEN status <> 'cancelled' AND order_type = 'delivery' THEN 1 ELSE 0 END), 0) AS delivery_orders
         FROM orders
         WHERE created_at >= %s
           AND created_at < %s
           {mode_sql}
-        GROUP BY created_at::date
-        ORDER BY created_at::date ASC
+        GROUP BY 1
+        ORDER BY 1 ASC
         """,
         tuple(daily_params),
     )
@@ -406,46 +564,81 @@ def get_analytics(service, filters: dict, *, now: datetime | None = None):
         channels_by_day[label] = {"dine_in": dine_in_orders, "delivery": delivery_orders}
         split["dine_in"] += dine_in_orders
         split["delivery"] += delivery_orders
-    product_params = [start.isoformat(timespec="seconds"), end.isoformat(timespec="seconds")]
-    if mode in {"dine_in", "delivery"}:
-        product_params.append(mode)
-    sold_rows = service._fetch_all(
+    item_rows = []
+    if rollup_start_date < today_date:
+        item_rows = service._fetch_all(
+            f"""
+            SELECT
+                item_id,
+                MAX(name) AS name,
+                COALESCE(SUM(qty_total), 0) AS qty_total,
+                COALESCE(SUM(revenue_total), 0) AS revenue_total,
+                COALESCE(SUM(price_total), 0) AS price_total,
+                COALESCE(SUM(price_rows), 0) AS price_rows
+            FROM daily_item_rollup
+            WHERE sales_date >= %s
+              AND sales_date < %s
+              {mode_sql}
+            GROUP BY item_id
+            """,
+            (rollup_start_date, today_date, *mode_params),
+        )
+    today_item_rows = service._fetch_all(
         f"""
         SELECT
             oi.item_id,
             MAX(oi.name) AS name,
             COALESCE(SUM(oi.qty), 0) AS qty_total,
             COALESCE(SUM(oi.qty * oi.price), 0) AS revenue_total,
-            COALESCE(ROUND(AVG(oi.price)), 0) AS average_price,
+            COALESCE(SUM(oi.price), 0) AS price_total,
+            COUNT(*) AS price_rows,
             MAX(o.created_at) AS last_sold_at
         FROM order_items oi
         JOIN orders o ON o.id = oi.order_id
         WHERE o.created_at >= %s
           AND o.created_at < %s
           {aliased_mode_sql}
-          AND LOWER(o.status) <> 'cancelled'
+          AND o.status <> 'cancelled'
         GROUP BY oi.item_id
-        ORDER BY revenue_total DESC, qty_total DESC, name ASC
         """,
-        tuple(product_params),
+        (_local_bound(raw_start), _local_bound(end), *mode_params),
     )
-    last_sale_params = []
-    if mode in {"dine_in", "delivery"}:
-        last_sale_params.append(mode)
+    sold_totals = {}
+    for row in [*item_rows, *today_item_rows]:
+        if row.get("item_id") is None:
+            continue
+        totals = sold_totals.setdefault(
+            _safe_int(row.get("item_id")),
+            {"item_id": _safe_int(row.get("item_id")), "name": row.get("name"), "qty_total": 0, "revenue_total": 0, "price_total": 0, "price_rows": 0},
+        )
+        totals["name"] = row.get("name") or totals["name"]
+        for key in ("qty_total", "revenue_total", "price_total", "price_rows"):
+            totals[key] += _safe_int(row.get(key))
+    sold_rows = []
+    for totals in sold_totals.values():
+        price_rows = totals.pop("price_rows")
+        price_total = totals.pop("price_total")
+        totals["average_price"] = int(price_total / price_rows + 0.5) if price_rows else 0
+        sold_rows.append(totals)
+    sold_rows.sort(key=lambda row: (-row["revenue_total"], -row["qty_total"], str(row.get("name") or "")))
     last_sale_rows = service._fetch_all(
         f"""
         SELECT
-            oi.item_id,
-            MAX(o.created_at) AS last_sold_at
-        FROM order_items oi
-        JOIN orders o ON o.id = oi.order_id
-        WHERE LOWER(o.status) <> 'cancelled'
-          {aliased_mode_sql}
-        GROUP BY oi.item_id
+            item_id,
+            MAX(last_sold_at) AS last_sold_at
+        FROM daily_item_rollup
+        WHERE sales_date < %s
+          {mode_sql}
+        GROUP BY item_id
         """,
-        tuple(last_sale_params),
+        (today_date, *mode_params),
     )
-    last_sale_map = {int(row["item_id"]): row.get("last_sold_at") for row in last_sale_rows if row.get("item_id") is not None}
+    last_sale_map = {}
+    for row in [*last_sale_rows, *today_item_rows]:
+        if row.get("item_id") is None or not row.get("last_sold_at"):
+            continue
+        item_id = int(row["item_id"])
+        last_sale_map[item_id] = max(last_sale_map.get(item_id) or row["last_sold_at"], row["last_sold_at"])
     menu_items = service.menu_content.load_menu_items_admin()
     menu_index = {int(item["id"]): item for item in menu_items if item.get("id") is not None}
     sales_index = {}
@@ -459,7 +652,6 @@ def get_analytics(service, filters: dict, *, now: datetime | None = None):
             "qty_total": _safe_int(row.get("qty_total")),
             "revenue_total": _safe_int(row.get("revenue_total")),
             "average_price": _safe_int(row.get("average_price")) or _safe_int(menu_item.get("price")),
-            "last_sold_at": row.get("last_sold_at"),
         }
     full_items = []
     total_revenue = max(current_metrics["revenue"], 1)
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 from typing import Any
 
+from services.business_logic import APP_TIMEZONE, current_local_datetime_value
 from services.order_status import read_delivery_overdue_value, read_effective_status_value
 from services.order_totals import summarize_saved_order_totals
 
@@ -13,8 +14,8 @@ def _safe_int(value: Any, default: int = 0) -> int:
 
 
 def _today_bounds():
-    now = datetime.now()
-    start = datetime(now.year, now.month, now.day)
+    now = current_local_datetime_value()
+    start = datetime(now.year, now.month, now.day, tzinfo=APP_TIMEZONE)
     return start, start + timedelta(days=1)
 
 
@@ -52,7 +53,7 @@ def build_order_filters(filters: dict, *, delivery_only: bool = False):
     conditions = []
     params = []
     if delivery_only:
-        conditions.append("LOWER(COALESCE(o.order_type, 'dine_in')) = 'delivery'")
+        conditions.append("o.order_type = 'delivery'")
     order_id = str(filters.get("order_id") or "").strip()
     if order_id:
         conditions.append("CAST(o.id AS TEXT) ILIKE %s")
@@ -85,30 +86,30 @@ def build_order_filters(filters: dict, *, delivery_only: bool = False):
         params.append(f"%{table_id}%")
     created_at = str(filters.get("created_at") or "").strip()
     if created_at:
-        conditions.append("COALESCE(o.created_at, '') ILIKE %s")
+        conditions.append("CAST(o.created_at AS TEXT) ILIKE %s")
         params.append(f"%{created_at}%")
     status = str(filters.get("status") or "").strip()
     if status:
-        conditions.append("LOWER(COALESCE(o.effective_status, o.status, '')) = %s")
+        conditions.append("o.effective_status = %s")
         params.append(status.lower())
     order_type = str(filters.get("order_type") or "").strip()
     if order_type and not delivery_only:
         conditions.append("o.order_type = %s")
-        params.append(order_type)
+        params.append(order_type.lower())
     preset = str(filters.get("preset") or "").strip()
     start, end = _today_bounds()
     if preset == "today":
         conditions.append("o.created_at >= %s AND o.created_at < %s")
-        params.extend([start.isoformat(timespec="seconds"), end.isoformat(timespec="seconds")])
+        params.extend([start, end])
     elif preset == "last_hour":
         conditions.append("o.created_at >= %s")
-        params.append((datetime.now() - timedelta(hours=1)).isoformat(timespec="seconds"))
+        params.append(datetime.now(APP_TIMEZONE) - timedelta(hours=1))
     elif preset == "active":
-        conditions.append("LOWER(COALESCE(o.effective_status, o.status, '')) NOT IN ('served', 'cancelled')")
+        conditions.append("o.effective_status NOT IN ('served', 'cancelled')")
     elif preset == "cancelled":
-        conditions.append("LOWER(COALESCE(o.effective_status, o.status, '')) = 'cancelled'")
+        conditions.append("o.effective_status = 'cancelled'")
     elif preset == "served" and delivery_only:
-        conditions.append("LOWER(COALESCE(o.effective_status, o.status, '')) = 'served'")
+        conditions.append("o.effective_status = 'served'")
     where_sql = "WHERE " + " AND ".join(conditions) if conditions else ""
     return where_sql, tuple(params)
 
@@ -130,7 +131,7 @@ def normalize_order_rows(service, rows: list[dict], *, force_delivery: bool = Fa
 
 
 def query_orders_page(service, filters: dict, *, page: int | None = None, per_page: int | None = None, delivery_only: bool = False):
-    service._refresh_persisted_order_fields(active_only=True)
+    service._refresh_open_order_fields()
     where_sql, params = build_order_filters(filters, delivery_only=delivery_only)
     pagination = None
     limit_sql = ""
@@ -138,7 +139,7 @@ def query_orders_page(service, filters: dict, *, page: int | None = None, per_pa
         normalized_page, normalized_per_page = _normalize_pagination(page, per_page)
         count_row = service._fetch_one(
             f"""
-            SELECT COUNT(DISTINCT o.id) AS count
+            SELECT COUNT(*) AS count
             FROM orders o
             LEFT JOIN users u ON u.id = o.user_id
             {where_sql}
@@ -152,13 +153,10 @@ def query_orders_page(service, filters: dict, *, page: int | None = None, per_pa
         SELECT
             o.*,
             u.name AS user_name,
-            u.phone AS user_phone,
-            COUNT(oi.order_id) AS items_count
+            u.phone AS user_phone
         FROM orders o
         LEFT JOIN users u ON u.id = o.user_id
-        LEFT JOIN order_items oi ON oi.order_id = o.id
         {where_sql}
-        GROUP BY o.id, u.id
         ORDER BY o.created_at DESC, o.id DESC
         {limit_sql}
         """,
@@ -1,5 +1,7 @@
 import json
 import importlib
+import threading
+import time
 from collections import OrderedDict
 from datetime import date, datetime, time as dt_time, timedelta
 from pathlib import Path
@@ -10,7 +12,8 @@ from werkzeug.datastructures import FileStorage
 
 from config import MENU_ITEMS_PATH, ORDER_STATUS_STEPS, PROMO_ITEMS_PATH
 from services import admin_audit_queries, admin_command_ops, admin_content_management, admin_dashboard_queries, admin_directory_queries, admin_order_queries, app_event_queries
-from services.business_logic import UTC, build_order_status_timeline_value, current_time_value, parse_iso_datetime_value
+from storage import query_metrics
+from services.business_logic import UTC, build_order_status_timeline_value, current_local_datetime_value, current_time_value, parse_iso_datetime_value
 from services.order_status import (
     runtime_delivery_overdue_value,
     runtime_effective_status_value,
@@ -112,11 +115,27 @@ def _build_pagination(total: int, page: int, per_page: int):
 
 
 class AdminService:
-    def __init__(self, *, active_storage: str, menu_content):
+    def __init__(
+        self,
+        *,
+        active_storage: str,
+        menu_content,
+        popular_items_ttl_seconds: int = 300,
+        on_user_activity_changed=None,
+        on_bookings_changed=None,
+        order_deadline_scheduler=None,
+    ):
         self.active_storage = active_storage
         self.menu_content = menu_content
+        self.popular_items_ttl_seconds = popular_items_ttl_seconds
+        self.on_user_activity_changed = on_user_activity_changed
+        self.on_bookings_changed = on_bookings_changed
+        self.order_deadline_scheduler = order_deadline_scheduler
         self._audit_filter_options_cache = None
         self._app_event_filter_options_cache = None
+        self._popular_items_cache = {}
+        self._popular_items_refreshing = set()
+        self._popular_items_lock = threading.Lock()
 
     @property
     def postgres_ready(self) -> bool:
@@ -138,10 +157,10 @@ class AdminService:
             return render_template("admin/access_denied.html", title="Нет доступа"), 403
         return None
 
-    def _run(self, operation):
+    def _run(self, operation, name: str | None = None):
         if not self.postgres_ready:
             raise RuntimeError("Admin service requires Postgres")
-        return self._pg_store()._run_db_operation(operation)
+        return self._pg_store()._run_db_operation(operation, name)
 
     def _pg_store(self):
         return importlib.import_module("storage.pg_store")
@@ -156,7 +175,7 @@ class AdminService:
                 columns = [column.name if hasattr(column, "name") else column[0] for column in (cur.description or [])]
                 return [dict(zip(columns, [_normalize_db_value(value) for value in row])) for row in cur.fetchall()]
 
-        return self._run(operation)
+        return self._run(operation, query_metrics.query_label(query, "admin"))
 
     def _fetch_one(self, query: str, params: tuple = ()):
         rows = self._fetch_all(query, params)
@@ -170,8 +189,9 @@ class AdminService:
             with conn.transaction():
                 with conn.cursor() as cur:
                     cur.execute(query, params)
+                    query_metrics.note_rows(max(0, cur.rowcount))
 
-        self._run(operation)
+        self._run(operation, query_metrics.query_label(query, "admin"))
 
     def _refresh_persisted_order_fields(self, *, order_ids: list[int] | None = None, user_id: int | None = None, active_only: bool = False):
         refresh_method = getattr(self._pg_store(), "refresh_persisted_order_fields", None)
@@ -179,6 +199,31 @@ class AdminService:
             return 0
         return refresh_method(order_ids=order_ids, user_id=user_id, active_only=active_only)
 
+    def _set_order_status(self, *, order_id: int, status: str, cancelled_at):
+        return self._pg_store().set_order_status(order_id, status=status, cancelled_at=cancelled_at)
+
+    def _refresh_open_order_fields(self):
+        scheduler = self.order_deadline_scheduler
+        if scheduler is not None and scheduler.running:
+            # Flags are kept current by the scheduler; pick up orders from other workers and flush what is due now.
+            scheduler.track_untracked()
+            scheduler.run_due()
+            return
+        self._refresh_persisted_order_fields(active_only=True)
+
+    def _notify_order_changed(self, order_id: int):
+        scheduler = self.order_deadline_scheduler
+        if scheduler is not None and scheduler.running:
+            scheduler.reload([int(order_id)])
+
+    def _notify_user_activity_changed(self, user_id):
+        if callable(self.on_user_activity_changed) and user_id is not None:
+            self.on_user_activity_changed(user_id)
+
+    def _notify_bookings_changed(self, booking_date):
+        if callable(self.on_bookings_changed):
+            self.on_bookings_changed(str(booking_date or "") or None)
+
     def is_admin_user(self, user_id: int) -> bool:
         row = self._fetch_one("SELECT 1 FROM admin_users WHERE user_id = %s", (int(user_id),))
         return bool(row)
@@ -415,7 +460,7 @@ class AdminService:
         )
 
     def get_dashboard_data(self):
-        return admin_dashboard_queries.get_dashboard_data(self, now=datetime.now())
+        return admin_dashboard_queries.get_dashboard_data(self, now=current_local_datetime_value())
 
     def get_profile_about_text(self) -> str:
         if not self.postgres_ready:
@@ -475,7 +520,47 @@ class AdminService:
         return admin_directory_queries.table_occupancy_for_date(self, booking_date)
 
     def get_analytics(self, filters: dict):
-        return admin_dashboard_queries.get_analytics(self, filters, now=datetime.now())
+        return admin_dashboard_queries.get_analytics(self, filters, now=current_local_datetime_value())
+
+    def popular_items(self, period: str = "30d"):
+        with self._popular_items_lock:
+            entry = self._popular_items_cache.get(period)
+        if entry is None:
+            return self._store_popular_items(period, self._load_popular_items(period))
+        expires_at, items = entry
+        if expires_at <= time.monotonic():
+            self._schedule_popular_items_refresh(period)
+        return items
+
+    def _load_popular_items(self, period: str):
+        return admin_dashboard_queries.get_popular_items(self, period, now=current_local_datetime_value())
+
+    def _store_popular_items(self, period: str, items: list[dict]):
+        ttl = max(1, int(self.popular_items_ttl_seconds or 0))
+        with self._popular_items_lock:
+            self._popular_items_cache[period] = (time.monotonic() + ttl, items)
+        return items
+
+    def _schedule_popular_items_refresh(self, period: str):
+        with self._popular_items_lock:
+            if period in self._popular_items_refreshing:
+                return
+            self._popular_items_refreshing.add(period)
+        threading.Thread(
+            target=self._refresh_popular_items,
+            args=(period,),
+            name=f"popular-items-{period}",
+            daemon=True,
+        ).start()
+
+    def _refresh_popular_items(self, period: str):
+        try:
+            self._store_popular_items(period, self._load_popular_items(period))
+        except Exception as exc:
+            print(f"[admin] popular items refresh failed period={period} ({exc})")
+        finally:
+            with self._popular_items_lock:
+                self._popular_items_refreshing.discard(period)
 
     def list_menu_items(self, filters: dict, items: list[dict] | None = None):
         return admin_content_management.list_menu_items(self, filters, items=items)
@@ -748,6 +833,9 @@ class AdminService:
             },
         }
 
+    def simulate_promo_dsl(self, form: dict):
+        return admin_content_management.simulate_promo_dsl(self, form)
+
     def delete_promo_item(self, *, admin_user_id: int, class_name: str, item_id: int, reason: str):
         return admin_content_management.delete_promo_item(
             self,
@@ -40,6 +40,8 @@ class AuthSessionService:
         list_user_bookings=None,
         get_user_preparing_orders,
         list_active_order_statuses=None,
+        build_user_activity=None,
+        count_user_notifications=None,
     ):
         self.app = app
         self.auth_session_cookie_name = auth_session_cookie_name
@@ -59,6 +61,8 @@ class AuthSessionService:
         self.list_user_bookings = list_user_bookings
         self.get_user_preparing_orders = get_user_preparing_orders
         self.list_active_order_statuses = list_active_order_statuses
+        self.build_user_activity = build_user_activity
+        self.count_user_notifications = count_user_notifications
 
     def _should_issue_csrf_token(self):
         endpoint = request.endpoint or ""
@@ -367,6 +371,27 @@ class AuthSessionService:
         self._set_request_user(user)
         return user
 
+    def _request_activity_user_id(self, user_id=None) -> int:
+        try:
+            normalized_user_id = int(user_id if user_id is not None else session.get("user_id"))
+        except (TypeError, ValueError):
+            return 0
+        return max(0, normalized_user_id)
+
+    def get_request_activity(self, user_id=None):
+        normalized_user_id = self._request_activity_user_id(user_id)
+        if normalized_user_id <= 0 or not callable(self.build_user_activity):
+            return {"bookings": [], "preparing_orders": [], "order_statuses": []}
+
+        # One snapshot per user per request: the badge, notifications, index
+        # and profile all read the same bookings/orders and status timelines.
+        cache_key = f"_user_activity_{normalized_user_id}"
+        if hasattr(g, cache_key):
+            return getattr(g, cache_key)
+        activity = self.build_user_activity(normalized_user_id)
+        setattr(g, cache_key, activity)
+        return activity
+
     def get_request_notification_data(self):
         if getattr(g, "notifications_loaded", False):
             return getattr(g, "notification_bookings", []), getattr(g, "notification_preparing_orders", [])
@@ -387,11 +412,16 @@ class AuthSessionService:
             g.notification_preparing_orders = []
             return g.notification_bookings, g.notification_preparing_orders
 
-        if callable(self.list_user_bookings):
-            bookings = self.list_user_bookings(user_id)
+        if callable(self.build_user_activity):
+            activity = self.get_request_activity(user_id)
+            bookings = activity["bookings"]
+            preparing_orders = activity["preparing_orders"]
         else:
-            bookings = [b for b in self._load_bookings_cached() if b.get("user_id") == user_id]
-        preparing_orders = self.get_user_preparing_orders(user_id)
+            if callable(self.list_user_bookings):
+                bookings = self.list_user_bookings(user_id)
+            else:
+                bookings = [b for b in self._load_bookings_cached() if b.get("user_id") == user_id]
+            preparing_orders = self.get_user_preparing_orders(user_id)
         g.notifications_loaded = True
         g.notification_bookings = bookings
         g.notification_preparing_orders = preparing_orders
@@ -427,6 +457,24 @@ class AuthSessionService:
             g.notification_preparing_orders_count = 0
             return 0
 
+        activity_loaded = hasattr(g, f"_user_activity_{self._request_activity_user_id(user_id)}")
+        if callable(self.build_user_activity) and activity_loaded:
+            bookings, preparing_orders = self.get_request_notification_data()
+            return len(bookings) + len(preparing_orders)
+
+        # The badge only needs two numbers; the storage answers them with a
+        # count query instead of hydrating bookings and order timelines.
+        if callable(self.count_user_notifications):
+            counts = self.count_user_notifications(user_id) or {}
+            g.notifications_count_loaded = True
+            g.notification_bookings_count = int(counts.get("bookings", 0) or 0)
+            g.notification_preparing_orders_count = int(counts.get("orders", 0) or 0)
+            return g.notification_bookings_count + g.notification_preparing_orders_count
+
+        if callable(self.build_user_activity):
+            bookings, preparing_orders = self.get_request_notification_data()
+            return len(bookings) + len(preparing_orders)
+
         if callable(self.list_user_bookings):
             bookings_count = len(self.list_user_bookings(user_id))
         else:
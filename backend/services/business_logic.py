@@ -1,9 +1,10 @@
 import os
-import math
 from datetime import datetime, timedelta, timezone
 import json
 from zoneinfo import ZoneInfo
 
+from services.order_timeline import OrderTimeline, epoch_seconds_value, steps_signature_value
+
 
 def _resolve_app_timezone():
     tz_name = (os.getenv("APP_TIMEZONE") or "Europe/Kaliningrad").strip()
@@ -123,193 +124,95 @@ def order_cooking_window_value(order, parse_datetime_fn, parse_iso_datetime_fn,
     return cook_start, ready_time, booking_end
 
 
+def compile_order_timeline_value(order, order_status_steps, parse_iso_datetime_fn):
+    return OrderTimeline.compile(
+        order,
+        order_status_steps,
+        parse_iso_datetime_fn,
+        parse_datetime_value,
+        compute_serve_datetime_value,
+    )
+
+
+def order_timeline_value(order, order_status_steps, parse_iso_datetime_fn):
+    timeline = OrderTimeline.from_payload(
+        order.get("status_timeline"),
+        order_id=order.get("id"),
+        steps_signature=steps_signature_value(order_status_steps),
+    )
+    if timeline is not None:
+        return timeline
+    return compile_order_timeline_value(order, order_status_steps, parse_iso_datetime_fn)
+
+
 def build_order_status_timeline_value(order, now, order_status_steps, parse_iso_datetime_fn):
-    created_at = parse_iso_datetime_fn(order.get("created_at"))
-    if created_at is None:
+    timeline = order_timeline_value(order, order_status_steps, parse_iso_datetime_fn)
+    if timeline is None:
         return None
-    order_type = str(order.get("order_type") or "").strip().lower()
+    return timeline.status_at(epoch_seconds_value(now))
 
-    if order_type == "delivery":
-        cooking_seconds = 15 * 60
-        courier_sent_seconds = 60
-        eta_minutes = int(order.get("delivery_eta_minutes", 20) or 20)
-        eta_total_seconds = max(cooking_seconds + courier_sent_seconds, eta_minutes * 60)
-        delivering_seconds = max(0, eta_total_seconds - cooking_seconds - courier_sent_seconds)
-        delivered_seconds = 60
-
-        total_duration = eta_total_seconds + delivered_seconds
-        elapsed = int((now - created_at).total_seconds())
-        if elapsed < 0:
-            elapsed = 0
-        if elapsed >= total_duration:
-            return None
 
-        segments = (
-            ("cooking", cooking_seconds),
-            ("courier_sent", courier_sent_seconds),
-            ("delivering", delivering_seconds),
-            ("delivered", delivered_seconds),
-        )
+def order_statuses_at_value(orders, now, order_status_steps, parse_iso_datetime_fn):
+    timelines = [
+        order_timeline_value(order, order_status_steps, parse_iso_datetime_fn) if isinstance(order, dict) else None
+        for order in orders
+    ]
+    return OrderTimeline.statuses_at(timelines, epoch_seconds_value(now))
 
-        phase_key = segments[-1][0]
-        phase_duration = segments[-1][1]
-        phase_start_offset = 0
-        elapsed_acc = 0
-        for key, duration in segments:
-            next_acc = elapsed_acc + duration
-            if elapsed < next_acc:
-                phase_key = key
-                phase_duration = duration
-                phase_start_offset = elapsed_acc
-                break
-            elapsed_acc = next_acc
-
-        phase_elapsed = max(0, elapsed - phase_start_offset)
-        phase_remaining = max(0, phase_duration - phase_elapsed)
-        phase_start = created_at + timedelta(seconds=phase_start_offset)
-        phase_end = phase_start + timedelta(seconds=phase_duration)
-        cycle_end = created_at + timedelta(seconds=total_duration)
-        eta_end = created_at + timedelta(seconds=eta_total_seconds)
-        eta_remaining = max(0, math.ceil((eta_end - now).total_seconds()))
-
-        return {
-            "order_id": order.get("id"),
-            "order_type": "delivery",
-            "phase": phase_key,
-            "phase_elapsed_seconds": phase_elapsed,
-            "phase_remaining_seconds": phase_remaining,
-            "phase_duration_seconds": phase_duration,
-            "phase_progress_ratio": (phase_elapsed / phase_duration) if phase_duration else 1.0,
-            "cycle_started_at": created_at.isoformat(timespec="seconds"),
-            "phase_started_at": phase_start.isoformat(timespec="seconds"),
-            "phase_ends_at": phase_end.isoformat(timespec="seconds"),
-            "cycle_ends_at": cycle_end.isoformat(timespec="seconds"),
-            "eta_total_seconds": eta_total_seconds,
-            "eta_remaining_seconds": eta_remaining,
-            "time_to_target_seconds": eta_remaining,
-        }
 
-    steps_index = {
-        step.get("key"): int(step.get("duration_seconds", 0) or 0)
-        for step in order_status_steps
-    }
-    cooking_seconds = max(0, steps_index.get("preparing", 15 * 60))
-    delivering_seconds = max(0, steps_index.get("delivering", 60))
-    delivered_seconds = max(0, steps_index.get("served", 60))
+def _is_visible_order_status(timeline):
+    if timeline is None:
+        return False
+    return not (timeline.get("order_type") == "delivery" and timeline.get("phase") == "delivered")
 
-    booking = order.get("booking") or {}
-    booking_dt = parse_datetime_value(booking.get("date"), booking.get("time"))
-    if booking_dt:
-        serve_dt = compute_serve_datetime_value(order, booking_dt, parse_datetime_value) or booking_dt
-        if serve_dt < booking_dt:
-            serve_dt = booking_dt
-
-        planned_cook_start = serve_dt - timedelta(seconds=cooking_seconds + delivering_seconds)
-        cook_start = max(created_at, planned_cook_start)
-        delivering_start = cook_start + timedelta(seconds=cooking_seconds)
-        delivered_start = delivering_start + timedelta(seconds=delivering_seconds)
-        cycle_end = delivered_start + timedelta(seconds=delivered_seconds)
-        target_remaining_seconds = max(0, math.ceil((delivered_start - now).total_seconds()))
-
-        if now < cook_start:
-            waiting_duration = max(1, math.ceil((cook_start - created_at).total_seconds()))
-            waiting_elapsed = min(waiting_duration, max(0, math.floor((now - created_at).total_seconds())))
-            waiting_remaining = max(0, math.ceil((cook_start - now).total_seconds()))
-            return {
-                "order_id": order.get("id"),
-                "order_type": "dine_in",
-                "phase": "waiting",
-                "phase_elapsed_seconds": waiting_elapsed,
-                "phase_remaining_seconds": waiting_remaining,
-                "phase_duration_seconds": waiting_duration,
-                "phase_progress_ratio": (waiting_elapsed / waiting_duration),
-                "cycle_started_at": created_at.isoformat(timespec="seconds"),
-                "phase_started_at": created_at.isoformat(timespec="seconds"),
-                "phase_ends_at": cook_start.isoformat(timespec="seconds"),
-                "cycle_ends_at": cycle_end.isoformat(timespec="seconds"),
-                "time_to_target_seconds": target_remaining_seconds,
-            }
 
-        if now < delivering_start:
-            phase_key = "preparing"
-            phase_start = cook_start
-            phase_end = delivering_start
-        elif now < delivered_start:
-            phase_key = "delivering"
-            phase_start = delivering_start
-            phase_end = delivered_start
-        elif now < cycle_end:
-            phase_key = "served"
-            phase_start = delivered_start
-            phase_end = cycle_end
-        else:
-            return None
+def _preparing_order_entry(order, timeline):
+    order_type = timeline.get("order_type", "dine_in")
+    phase = timeline.get("phase")
+    remaining_seconds = int(
+        timeline.get("eta_remaining_seconds")
+        if order_type == "delivery"
+        else timeline.get("phase_remaining_seconds", 0)
+        or 0
+    )
+    remaining_seconds = max(0, remaining_seconds)
+    minutes, seconds = divmod(remaining_seconds, 60)
 
-        phase_duration = max(1, math.ceil((phase_end - phase_start).total_seconds()))
-        phase_elapsed = min(phase_duration, max(0, math.floor((now - phase_start).total_seconds())))
-        phase_remaining = max(0, math.ceil((phase_end - now).total_seconds()))
-        return {
-            "order_id": order.get("id"),
-            "order_type": "dine_in",
-            "phase": phase_key,
-            "phase_elapsed_seconds": phase_elapsed,
-            "phase_remaining_seconds": phase_remaining,
-            "phase_duration_seconds": phase_duration,
-            "phase_progress_ratio": (phase_elapsed / phase_duration),
-            "cycle_started_at": cook_start.isoformat(timespec="seconds"),
-            "phase_started_at": phase_start.isoformat(timespec="seconds"),
-            "phase_ends_at": phase_end.isoformat(timespec="seconds"),
-            "cycle_ends_at": cycle_end.isoformat(timespec="seconds"),
-            "time_to_target_seconds": target_remaining_seconds,
+    if order_type == "delivery":
+        status_titles = {
+            "cooking": "Готовим заказ",
+            "courier_sent": "Отправили курьера",
+            "delivering": "Заказ в пути",
+            "delivered": "Заказ доставлен",
+        }
+        status_texts = {
+            "cooking": "До прибытия",
+            "courier_sent": "До прибытия",
+            "delivering": "До прибытия",
+            "delivered": "Доставлено",
+        }
+    else:
+        status_titles = {
+            "waiting": "Ожидаем время брони",
+            "preparing": "Заказ готовится",
+            "delivering": "Заказ несут",
+            "served": "Заказ выдан",
+        }
+        status_texts = {
+            "waiting": "До начала готовки",
+            "preparing": "Осталось",
+            "delivering": "Сейчас принесём",
+            "served": "Можно забирать",
         }
 
-    total_duration = sum(step["duration_seconds"] for step in order_status_steps)
-    elapsed = int((now - created_at).total_seconds())
-    if elapsed < 0:
-        elapsed = 0
-    if elapsed >= total_duration:
-        return None
-
-    phase_key = order_status_steps[-1]["key"]
-    phase_duration = order_status_steps[-1]["duration_seconds"]
-    phase_start_offset = 0
-    elapsed_acc = 0
-    for step in order_status_steps:
-        next_acc = elapsed_acc + step["duration_seconds"]
-        if elapsed < next_acc:
-            phase_key = step["key"]
-            phase_duration = step["duration_seconds"]
-            phase_start_offset = elapsed_acc
-            break
-        elapsed_acc = next_acc
-
-    phase_elapsed = elapsed - phase_start_offset
-    phase_remaining = max(0, phase_duration - phase_elapsed)
-    cycle_end = created_at + timedelta(seconds=total_duration)
-    phase_start = created_at + timedelta(seconds=phase_start_offset)
-    phase_end = phase_start + timedelta(seconds=phase_duration)
-    serving_start_offset = 0
-    for step in order_status_steps:
-        if step.get("key") == "served":
-            break
-        serving_start_offset += int(step.get("duration_seconds", 0) or 0)
-    serving_start = created_at + timedelta(seconds=serving_start_offset)
-    time_to_target_seconds = max(0, int((serving_start - now).total_seconds()))
-
-    return {
-        "order_id": order.get("id"),
-        "order_type": "dine_in",
-        "phase": phase_key,
-        "phase_elapsed_seconds": phase_elapsed,
-        "phase_remaining_seconds": phase_remaining,
-        "phase_duration_seconds": phase_duration,
-        "phase_progress_ratio": (phase_elapsed / phase_duration) if phase_duration else 1.0,
-        "cycle_started_at": created_at.isoformat(timespec="seconds"),
-        "phase_started_at": phase_start.isoformat(timespec="seconds"),
-        "phase_ends_at": phase_end.isoformat(timespec="seconds"),
-        "cycle_ends_at": cycle_end.isoformat(timespec="seconds"),
-        "time_to_target_seconds": time_to_target_seconds,
-    }
+    enriched = dict(order)
+    enriched["order_type"] = order_type
+    enriched["status_phase"] = phase
+    enriched["status_title"] = status_titles.get(phase, "Статус заказа")
+    enriched["status_text"] = status_texts.get(phase, "Осталось")
+    enriched["status_remaining_seconds"] = remaining_seconds
+    enriched["status_remaining_mmss"] = f"{minutes:02d}:{seconds:02d}"
+    return enriched
 
 
 def get_user_preparing_orders_from_orders_value(orders, build_timeline_fn):
@@ -319,57 +222,9 @@ def get_user_preparing_orders_from_orders_value(orders, build_timeline_fn):
         if not isinstance(order, dict) or is_cancelled_order(order):
             continue
         timeline = build_timeline_fn(order, now)
-        if timeline is None:
+        if not _is_visible_order_status(timeline):
             continue
-        if timeline.get("order_type") == "delivery" and timeline.get("phase") == "delivered":
-            continue
-
-        order_type = timeline.get("order_type", "dine_in")
-        phase = timeline.get("phase")
-        remaining_seconds = int(
-            timeline.get("eta_remaining_seconds")
-            if order_type == "delivery"
-            else timeline.get("phase_remaining_seconds", 0)
-            or 0
-        )
-        remaining_seconds = max(0, remaining_seconds)
-        minutes, seconds = divmod(remaining_seconds, 60)
-
-        if order_type == "delivery":
-            status_titles = {
-                "cooking": "Готовим заказ",
-                "courier_sent": "Отправили курьера",
-                "delivering": "Заказ в пути",
-                "delivered": "Заказ доставлен",
-            }
-            status_texts = {
-                "cooking": "До прибытия",
-                "courier_sent": "До прибытия",
-                "delivering": "До прибытия",
-                "delivered": "Доставлено",
-            }
-        else:
-            status_titles = {
-                "waiting": "Ожидаем время брони",
-                "preparing": "Заказ готовится",
-                "delivering": "Заказ несут",
-                "served": "Заказ выдан",
-            }
-            status_texts = {
-                "waiting": "До начала готовки",
-                "preparing": "Осталось",
-                "delivering": "Сейчас принесём",
-                "served": "Можно забирать",
-            }
-
-        enriched = dict(order)
-        enriched["order_type"] = order_type
-        enriched["status_phase"] = phase
-        enriched["status_title"] = status_titles.get(phase, "Статус заказа")
-        enriched["status_text"] = status_texts.get(phase, "Осталось")
-        enriched["status_remaining_seconds"] = remaining_seconds
-        enriched["status_remaining_mmss"] = f"{minutes:02d}:{seconds:02d}"
-        active_orders.append(enriched)
+        active_orders.append(_preparing_order_entry(order, timeline))
 
     active_orders.sort(key=lambda o: o.get("created_at", ""), reverse=True)
     return active_orders
@@ -380,34 +235,22 @@ def get_user_preparing_orders_value(user_id, load_orders_fn, build_timeline_fn):
     return get_user_preparing_orders_from_orders_value(orders, build_timeline_fn)
 
 
-def list_active_order_statuses_from_orders_value(orders, build_timeline_fn):
-    now = current_time_value()
-    active = []
-    phase_priority = {
-        "served": 0,
-        "delivered": 0,
-        "courier_sent": 1,
-        "delivering": 1,
-        "cooking": 2,
-        "preparing": 2,
-        "waiting": 3,
-    }
+_ACTIVE_PHASE_PRIORITY = {
+    "served": 0,
+    "delivered": 0,
+    "courier_sent": 1,
+    "delivering": 1,
+    "cooking": 2,
+    "preparing": 2,
+    "waiting": 3,
+}
 
-    for order in orders:
-        if not isinstance(order, dict) or is_cancelled_order(order):
-            continue
-        timeline = build_timeline_fn(order, now)
-        if timeline is None:
-            continue
-        if timeline.get("order_type") == "delivery" and timeline.get("phase") == "delivered":
-            continue
-        timeline["created_at"] = order.get("created_at", "")
-        active.append(timeline)
 
+def _sort_active_order_statuses(active):
     active.sort(
         key=lambda item: (
             int(item.get("time_to_target_seconds", 0) or 0),
-            phase_priority.get(item.get("phase"), 99),
+            _ACTIVE_PHASE_PRIORITY.get(item.get("phase"), 99),
             int(item.get("phase_remaining_seconds", 0) or 0),
             item.get("created_at", ""),
             int(item.get("order_id", 0) or 0),
@@ -416,11 +259,43 @@ def list_active_order_statuses_from_orders_value(orders, build_timeline_fn):
     return active
 
 
+def list_active_order_statuses_from_orders_value(orders, build_timeline_fn):
+    now = current_time_value()
+    active = []
+    for order in orders:
+        if not isinstance(order, dict) or is_cancelled_order(order):
+            continue
+        timeline = build_timeline_fn(order, now)
+        if not _is_visible_order_status(timeline):
+            continue
+        timeline["created_at"] = order.get("created_at", "")
+        active.append(timeline)
+    return _sort_active_order_statuses(active)
+
+
 def list_active_order_statuses_value(user_id, load_orders_fn, build_timeline_fn):
     orders = [o for o in load_orders_fn() if o.get("user_id") == user_id]
     return list_active_order_statuses_from_orders_value(orders, build_timeline_fn)
 
 
+def user_activity_snapshot_value(bookings, orders, order_statuses_at_fn):
+    now = current_time_value()
+    live_orders = [order for order in orders if isinstance(order, dict) and not is_cancelled_order(order)]
+    preparing_orders = []
+    order_statuses = []
+    for order, timeline in zip(live_orders, order_statuses_at_fn(live_orders, now)):
+        if not _is_visible_order_status(timeline):
+            continue
+        preparing_orders.append(_preparing_order_entry(order, timeline))
+        order_statuses.append({**timeline, "created_at": order.get("created_at", "")})
+    preparing_orders.sort(key=lambda o: o.get("created_at", ""), reverse=True)
+    return {
+        "bookings": list(bookings or []),
+        "preparing_orders": preparing_orders,
+        "order_statuses": _sort_active_order_statuses(order_statuses),
+    }
+
+
 def latest_active_order_status_value(user_id, list_active_order_statuses_fn):
     active = list_active_order_statuses_fn(user_id)
     return active[0] if active else None
@@ -0,0 +1,213 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows dev machines
+    fcntl = None
+
+
+class FileLeaderLock:
+    """Non-blocking `flock` on a file in the data dir; held for as long as the process keeps it open."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            return True
+        fd = os.open(str(self.path), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}".encode("utf-8"))
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class HousekeepingJob:
+    __slots__ = (
+        "name",
+        "interval_seconds",
+        "run",
+        "next_run_at",
+        "runs",
+        "failures",
+        "last_started_at",
+        "last_duration_ms",
+        "last_result",
+        "last_error",
+    )
+
+    def __init__(self, name: str, interval_seconds: float, run):
+        self.name = name
+        self.interval_seconds = max(1.0, float(interval_seconds))
+        self.run = run
+        self.next_run_at = 0.0
+        self.runs = 0
+        self.failures = 0
+        self.last_started_at = None
+        self.last_duration_ms = None
+        self.last_result = None
+        self.last_error = ""
+
+
+class HousekeepingService:
+    """One thread per process; only the leader (advisory lock / lock file) runs the jobs."""
+
+    def __init__(
+        self,
+        *,
+        try_acquire_leadership,
+        release_leadership=None,
+        leader_retry_seconds: float = 30.0,
+        max_sleep_seconds: float = 30.0,
+        monotonic=time.monotonic,
+    ):
+        self.try_acquire_leadership = try_acquire_leadership
+        self.release_leadership = release_leadership
+        self.leader_retry_seconds = max(1.0, float(leader_retry_seconds))
+        self.max_sleep_seconds = max(0.05, float(max_sleep_seconds))
+        self._monotonic = monotonic
+        self._jobs = []
+        self._leadership_listeners = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.is_leader = False
+        self.restarts = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_job(self, name: str, interval_seconds: float, run):
+        with self._lock:
+            self._jobs.append(HousekeepingJob(name, interval_seconds, run))
+
+    def add_leadership_listener(self, listener):
+        """`listener(is_leader)` runs in the housekeeping thread whenever this process gains or loses leadership."""
+        with self._lock:
+            self._leadership_listeners.append(listener)
+
+    def _set_leader(self, leader: bool):
+        if leader == self.is_leader:
+            return
+        print(f"[housekeeping] {'acquired' if leader else 'lost'} leadership pid={os.getpid()}")
+        self.is_leader = leader
+        with self._lock:
+            listeners = list(self._leadership_listeners)
+        for listener in listeners:
+            try:
+                listener(leader)
+            except Exception as exc:
+                print(f"[housekeeping] leadership listener failed ({exc})")
+
+    def _check_leadership(self) -> bool:
+        try:
+            leader = bool(self.try_acquire_leadership())
+        except Exception as exc:
+            print(f"[housekeeping] leader check failed ({exc})")
+            leader = False
+        self._set_leader(leader)
+        return leader
+
+    def run_due_jobs(self) -> int:
+        now = self._monotonic()
+        with self._lock:
+            due_jobs = [job for job in self._jobs if job.next_run_at <= now]
+        for job in due_jobs:
+            started_at = time.perf_counter()
+            job.last_started_at = datetime.now().isoformat(timespec="seconds")
+            try:
+                job.last_result = job.run()
+                job.last_error = ""
+            except Exception as exc:
+                job.failures += 1
+                job.last_error = str(exc)[:300]
+                print(f"[housekeeping] {job.name} failed ({exc})")
+            job.runs += 1
+            job.last_duration_ms = round((time.perf_counter() - started_at) * 1000.0, 2)
+            job.next_run_at = self._monotonic() + job.interval_seconds
+        return len(due_jobs)
+
+    def seconds_until_next_job(self) -> float:
+        now = self._monotonic()
+        with self._lock:
+            next_run_at = min((job.next_run_at for job in self._jobs), default=now + self.max_sleep_seconds)
+        return max(0.05, min(self.max_sleep_seconds, next_run_at - now))
+
+    def tick(self) -> float:
+        if not self._check_leadership():
+            return self.leader_retry_seconds
+        self.run_due_jobs()
+        return self.seconds_until_next_job()
+
+    def _run_forever(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    wait = self.tick()
+                except Exception as exc:
+                    print(f"[housekeeping] tick failed ({exc})")
+                    wait = self.max_sleep_seconds
+                self._stop.wait(timeout=wait)
+        finally:
+            if self.is_leader and callable(self.release_leadership):
+                try:
+                    self.release_leadership()
+                except Exception:
+                    pass
+            self._set_leader(False)
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            if self._thread is not None:
+                # Supervision: a thread that died is replaced on the next start() call.
+                self.restarts += 1
+                print(f"[housekeeping] worker restarted restarts={self.restarts}")
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run_forever, name="housekeeping", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self) -> dict:
+        now = self._monotonic()
+        with self._lock:
+            jobs = [
+                {
+                    "name": job.name,
+                    "interval_seconds": job.interval_seconds,
+                    "runs": job.runs,
+                    "failures": job.failures,
+                    "last_started_at": job.last_started_at,
+                    "last_duration_ms": job.last_duration_ms,
+                    "last_result": job.last_result,
+                    "last_error": job.last_error,
+                    "next_run_in_seconds": round(max(0.0, job.next_run_at - now), 1) if job.runs else 0.0,
+                }
+                for job in self._jobs
+            ]
+        return {"running": self.running, "is_leader": self.is_leader, "restarts": self.restarts, "jobs": jobs}
@@ -10,7 +10,7 @@ from pathlib import Path, PurePosixPath
 from config import MENU_ITEMS_PATH, MENU_META_NAME, MENU_PHOTO_NAMES, PROMO_ITEMS_PATH, PROMO_META_NAME, PROMO_PHOTO_NAMES
 from models import MenuItem, PromoItem
 from services.business_logic import current_local_datetime_value
-from services.promotions import parse_and_validate_promo_source
+from services.promotions import PromotionSchedule, invalidate_compiled_promotions, parse_and_validate_promo_source
 from services.promotions.ast import PromotionDslError
 from services.promotions.validator import PromotionValidationError
 
@@ -70,6 +70,7 @@ class MenuContentService:
             self._disk_menu_photo_cache = None
         with self._disk_promo_photo_cache_lock:
             self._disk_promo_photo_cache = None
+        invalidate_compiled_promotions()
 
     def _build_disk_menu_photo_cache(self):
         cache = {}
@@ -423,11 +424,23 @@ class MenuContentService:
         }
 
     def load_promo_items(self, include_inactive: bool = False):
-        memory_key = "promo:admin" if include_inactive else "promo:public"
-        memory_items = self._memory_cache_get(memory_key)
-        if memory_items is not None:
-            return memory_items
+        if include_inactive:
+            memory_items = self._memory_cache_get("promo:admin")
+            if memory_items is not None:
+                return memory_items
+            return self._memory_cache_set("promo:admin", self._load_promo_items_from_origin(include_inactive=True))
+
+        # Public promos are cached together with their windows; the schedule picks the ones active right now,
+        # so a window that opens or closes between reloads takes effect on time.
+        schedule = self._memory_cache_get("promo:public")
+        if schedule is None:
+            schedule = self._memory_cache_set(
+                "promo:public",
+                PromotionSchedule(self._load_promo_items_from_origin(include_inactive=False)),
+            )
+        return schedule.active_at(current_local_datetime_value())
 
+    def _load_promo_items_from_origin(self, *, include_inactive: bool):
         if self.active_storage == "postgres":
             items = self.load_promotions_from_db(include_inactive=include_inactive)
         else:
@@ -436,7 +449,7 @@ class MenuContentService:
             items.extend(self._load_disk_promo_items(include_inactive=include_inactive, allowed_classes={"akciya"}))
 
         items.sort(key=lambda item: (-int(item.get("priority", 100) or 100), int(item["id"])))
-        return self._memory_cache_set(memory_key, items)
+        return items
 
     def _load_disk_promo_items(self, *, include_inactive: bool, allowed_classes: set[str]):
         items = []
@@ -457,8 +470,6 @@ class MenuContentService:
                 continue
             if not include_inactive and not promo_item.get("active", True):
                 continue
-            if not include_inactive and not self.is_promo_in_active_window(promo_item):
-                continue
             if not include_inactive and promo_item.get("class") == "akciya" and not promo_item.get("dsl_valid", True):
                 continue
             items.append(promo_item)
@@ -478,8 +489,6 @@ class MenuContentService:
                 continue
             if not include_inactive and not promo_item.get("active", True):
                 continue
-            if not include_inactive and not self.is_promo_in_active_window(promo_item):
-                continue
             if not include_inactive and not promo_item.get("dsl_valid", True):
                 continue
             items.append(promo_item)
@@ -820,6 +829,7 @@ class MenuContentService:
             limit_per_user_per_day=str(promotion.get("limit_per_user_per_day", "") or "").strip(),
             start_at=start_at,
             end_at=end_at,
+            dsl_ast=str(promotion.get("dsl_ast", "") or ""),
         )
         validation = self.validate_promo_dsl(item.to_dict())
         item.dsl_valid = validation["valid"]
@@ -864,16 +874,6 @@ class MenuContentService:
         except (PromotionValidationError, PromotionDslError) as exc:
             return {"valid": False, "error": str(exc)}
 
-    def is_promo_in_active_window(self, promo_item: dict, now: datetime | None = None) -> bool:
-        current = now or current_local_datetime_value()
-        start_at = self.parse_iso_datetime(promo_item.get("start_at"))
-        end_at = self.parse_iso_datetime(promo_item.get("end_at"))
-        if start_at and current < start_at:
-            return False
-        if end_at and current > end_at:
-            return False
-        return True
-
     def parse_iso_datetime(self, value):
         text = str(value or "").strip()
         if not text:
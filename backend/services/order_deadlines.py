@@ -0,0 +1,222 @@
+import heapq
+import threading
+import time
+from datetime import timedelta
+
+from config import ORDER_STATUS_STEPS
+from services.business_logic import (
+    current_time_value,
+    epoch_seconds_value,
+    order_timeline_value,
+    parse_iso_datetime_value,
+)
+from services.order_status import FINAL_EFFECTIVE_STATUSES, build_persisted_status_fields_value
+
+
+def order_deadlines_value(order: dict) -> list[float]:
+    timeline = order_timeline_value(order, ORDER_STATUS_STEPS, parse_iso_datetime_value)
+    deadlines = set()
+    if timeline is not None:
+        deadlines.update(timeline.starts)
+        deadlines.add(timeline.cycle_end)
+    if str(order.get("order_type") or "").strip().lower() == "delivery":
+        created_at = parse_iso_datetime_value(order.get("created_at"))
+        if created_at is not None:
+            try:
+                eta_minutes = int(order.get("delivery_eta_minutes", 20))
+            except (TypeError, ValueError):
+                eta_minutes = 20
+            # Overdue is a strict "ETA < now", so it flips one second later.
+            deadlines.add(epoch_seconds_value(created_at + timedelta(minutes=eta_minutes)) + 1)
+    return sorted(deadlines)
+
+
+class OrderDeadlineScheduler:
+    """Open orders in a min-heap by next deadline; due ones are re-evaluated and persisted in one batch."""
+
+    def __init__(
+        self,
+        *,
+        load_open_orders,
+        persist_updates,
+        resync_seconds: int = 300,
+        max_sleep_seconds: float = 30.0,
+        now=current_time_value,
+        monotonic=time.monotonic,
+    ):
+        self.load_open_orders = load_open_orders
+        self.persist_updates = persist_updates
+        self.resync_seconds = max(1, int(resync_seconds))
+        self.max_sleep_seconds = max(0.05, float(max_sleep_seconds))
+        self._now = now
+        self._monotonic = monotonic
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._heap = []
+        self._orders = {}
+        self._versions = {}
+        self._sequence = 0
+        self._next_resync_at = 0.0
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._orders)
+
+    def _push_locked(self, order_id: int, due_at: float):
+        self._sequence += 1
+        self._versions[order_id] = self._sequence
+        heapq.heappush(self._heap, (due_at, self._sequence, order_id))
+
+    def _next_due_at(self, order: dict, now_epoch: float):
+        if not isinstance(order, dict) or str(order.get("effective_status") or "").strip().lower() in FINAL_EFFECTIVE_STATUSES:
+            return None
+        return next((deadline for deadline in order_deadlines_value(order) if deadline > now_epoch), None)
+
+    def _fields_changed(self, order: dict, fields: dict) -> bool:
+        return (
+            str(order.get("effective_status") or "") != str(fields.get("effective_status") or "")
+            or bool(order.get("is_delivery_overdue")) != bool(fields.get("is_delivery_overdue"))
+        )
+
+    def track(self, order: dict):
+        try:
+            order_id = int((order or {}).get("id"))
+        except (TypeError, ValueError):
+            return
+        now = self._now()
+        now_epoch = epoch_seconds_value(now)
+        stale = self._fields_changed(order, build_persisted_status_fields_value(order, now))
+        due_at = now_epoch if stale else self._next_due_at(order, now_epoch)
+        with self._lock:
+            if due_at is None:
+                self._orders.pop(order_id, None)
+                self._versions.pop(order_id, None)
+                return
+            self._orders[order_id] = dict(order)
+            self._push_locked(order_id, due_at)
+        self._wake.set()
+
+    def forget(self, order_id: int):
+        with self._lock:
+            self._orders.pop(int(order_id), None)
+            self._versions.pop(int(order_id), None)
+
+    def reload(self, order_ids: list[int]):
+        normalized_ids = [int(order_id) for order_id in order_ids or []]
+        if not normalized_ids:
+            return
+        orders = self.load_open_orders(order_ids=normalized_ids)
+        for order_id in normalized_ids:
+            self.forget(order_id)
+        for order in orders or []:
+            self.track(order)
+
+    def track_untracked(self) -> int:
+        """Pick up open orders this process has not seen, e.g. ones created on another worker."""
+        with self._lock:
+            known_ids = set(self._orders)
+        added = 0
+        for order in self.load_open_orders() or []:
+            try:
+                order_id = int((order or {}).get("id"))
+            except (TypeError, ValueError):
+                continue
+            if order_id not in known_ids:
+                self.track(order)
+                added += 1
+        return added
+
+    def resync(self):
+        orders = self.load_open_orders()
+        with self._lock:
+            self._heap = []
+            self._orders = {}
+            self._versions = {}
+        for order in orders or []:
+            self.track(order)
+        self._next_resync_at = self._monotonic() + self.resync_seconds
+
+    def run_due(self) -> int:
+        now = self._now()
+        now_epoch = epoch_seconds_value(now)
+        due_orders = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now_epoch:
+                _due_at, sequence, order_id = heapq.heappop(self._heap)
+                if self._versions.get(order_id) != sequence:
+                    continue
+                order = self._orders.get(order_id)
+                if order is not None:
+                    due_orders.append(order)
+
+        updates = []
+        for order in due_orders:
+            fields = build_persisted_status_fields_value(order, now)
+            if self._fields_changed(order, fields):
+                updates.append({"id": int(order["id"]), "status": order.get("status"), **fields})
+                order.update(fields)
+        if updates:
+            self.persist_updates(updates)
+
+        with self._lock:
+            for order in due_orders:
+                order_id = int(order["id"])
+                if self._orders.get(order_id) is not order:
+                    continue
+                due_at = self._next_due_at(order, now_epoch)
+                if due_at is None:
+                    self._orders.pop(order_id, None)
+                    self._versions.pop(order_id, None)
+                else:
+                    self._push_locked(order_id, due_at)
+        return len(updates)
+
+    def seconds_until_next_due(self) -> float:
+        now_epoch = epoch_seconds_value(self._now())
+        with self._lock:
+            next_due = self._heap[0][0] if self._heap else None
+        wait = self.max_sleep_seconds
+        if next_due is not None:
+            wait = min(wait, max(0.0, next_due - now_epoch))
+        wait = min(wait, max(0.0, self._next_resync_at - self._monotonic()))
+        return max(0.05, wait)
+
+    def _run_forever(self):
+        while not self._stop.is_set():
+            try:
+                if self._monotonic() >= self._next_resync_at:
+                    self.resync()
+                persisted = self.run_due()
+                if persisted:
+                    print(f"[order-deadlines] persisted {persisted} status change(s)")
+            except Exception as exc:
+                print(f"[order-deadlines] tick failed ({exc})")
+                self._next_resync_at = self._monotonic() + min(self.resync_seconds, 30)
+            self._wake.wait(timeout=self.seconds_until_next_due())
+            self._wake.clear()
+
+    def start(self):
+        if self.running:
+            if not self._stop.is_set():
+                return
+            self._thread.join(timeout=self.max_sleep_seconds)
+        self._stop.clear()
+        # A restarted scheduler (e.g. after leadership came back) starts from a full resync.
+        self._next_resync_at = 0.0
+        self._thread = threading.Thread(target=self._run_forever, name="order-deadlines", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            self._heap = []
+            self._orders = {}
+            self._versions = {}
+
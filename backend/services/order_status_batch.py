@@ -0,0 +1,106 @@
+import hashlib
+import threading
+import time
+
+from services.business_logic import current_time_value
+from services.order_status import runtime_effective_status_value
+
+
+ORDER_STATUS_BATCH_FIELDS = ("order_id", "status", "phase", "phase_ends_at", "cycle_ends_at")
+
+
+def parse_order_ids_value(raw_value, limit: int = 50):
+    order_ids = []
+    for chunk in str(raw_value or "").split(","):
+        chunk = chunk.strip()
+        if not chunk:
+            continue
+        try:
+            order_id = int(chunk)
+        except ValueError:
+            return None
+        if order_id <= 0:
+            return None
+        if order_id not in order_ids:
+            order_ids.append(order_id)
+    if not order_ids or len(order_ids) > limit:
+        return None
+    return order_ids
+
+
+class OrderStatusBatch:
+    """Per-user status version plus a short-lived cache of the orders a client is watching."""
+
+    def __init__(self, *, load_user_orders, statuses_at, ttl_seconds: int = 10, now=current_time_value, monotonic=time.monotonic):
+        self.load_user_orders = load_user_orders
+        self.statuses_at = statuses_at
+        self.ttl_seconds = max(0, int(ttl_seconds or 0))
+        self._now = now
+        self._monotonic = monotonic
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._orders = {}
+
+    def bump(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._orders.clear()
+                for key in self._versions:
+                    self._versions[key] += 1
+                return
+            try:
+                normalized_user_id = int(user_id)
+            except (TypeError, ValueError):
+                return
+            self._versions[normalized_user_id] = self._versions.get(normalized_user_id, 0) + 1
+            self._orders.pop(normalized_user_id, None)
+
+    def version(self, user_id) -> int:
+        with self._lock:
+            return self._versions.get(int(user_id), 0)
+
+    def _user_orders(self, user_id: int, order_ids: list[int], version: int) -> dict:
+        now = self._monotonic()
+        with self._lock:
+            cached = self._orders.get(user_id)
+        if cached is not None and cached[0] == version and cached[1] > now and set(order_ids) <= cached[2].keys():
+            return cached[2]
+        loaded = {}
+        for order in self.load_user_orders(user_id, sorted(set(order_ids))) or []:
+            try:
+                loaded[int(order.get("id"))] = order
+            except (TypeError, ValueError):
+                continue
+        # Only the ids of this request are cached, so an entry never outgrows the per-request id limit.
+        # Ids the user does not own are remembered as missing so they do not force a reload.
+        orders = {order_id: loaded.get(order_id) for order_id in order_ids}
+        if self.ttl_seconds:
+            with self._lock:
+                for expired_user_id in [key for key, entry in self._orders.items() if entry[1] <= now]:
+                    self._orders.pop(expired_user_id, None)
+                if self._versions.get(user_id, 0) == version:
+                    self._orders[user_id] = (version, now + self.ttl_seconds, orders)
+        return orders
+
+    def snapshot(self, user_id, order_ids: list[int]) -> dict:
+        normalized_user_id = int(user_id)
+        version = self.version(normalized_user_id)
+        orders_by_id = self._user_orders(normalized_user_id, order_ids, version)
+        present = [orders_by_id[order_id] for order_id in order_ids if orders_by_id.get(order_id) is not None]
+        now = self._now()
+        rows = []
+        for order, status in zip(present, self.statuses_at(present, now)):
+            rows.append(
+                [
+                    int(order["id"]),
+                    runtime_effective_status_value(order, now),
+                    status.get("phase") if status else None,
+                    status.get("phase_ends_at") if status else None,
+                    status.get("cycle_ends_at") if status else None,
+                ]
+            )
+        missing = [order_id for order_id in order_ids if orders_by_id.get(order_id) is None]
+        signature = "|".join(":".join(str(value) for value in row) for row in rows)
+        payload = f"{normalized_user_id}|{version}|{signature}|{','.join(map(str, missing))}"
+        digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+        return {"version": version, "etag": f"v{version}-{digest}", "orders": rows, "missing": missing}
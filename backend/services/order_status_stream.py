@@ -0,0 +1,148 @@
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime
+
+from services.business_logic import current_time_value
+
+
+def _parse_phase_end(value):
+    try:
+        parsed = datetime.fromisoformat(str(value or ""))
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=None)
+
+
+def status_event_id(statuses: list[dict]) -> str:
+    signature = "|".join(
+        f"{item.get('order_id')}:{item.get('phase')}:{item.get('phase_ends_at')}"
+        for item in statuses or []
+    )
+    return hashlib.sha1(signature.encode("utf-8")).hexdigest()[:16]
+
+
+def stream_capacity_value(configured: int, threads: int, *, reserved_threads: int = 2) -> int:
+    """Open streams allowed per process: each holds a worker thread, and `reserved_threads` stay free for plain requests."""
+    return max(0, min(int(configured), int(threads) - reserved_threads))
+
+
+def format_sse_event(event: str, payload: dict, event_id: str) -> str:
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+class OrderStatusStream:
+    """SSE feed of a user's order phases.
+
+    Orders are loaded once and phases are recomputed from them at each `phase_ends_at`; the storage is read again
+    only when the user's version moves (`invalidate_user_notifications`) or every `reload_seconds` as a fallback
+    for changes made on other workers.
+    """
+
+    def __init__(
+        self,
+        *,
+        load_orders,
+        statuses_for,
+        version=lambda user_id: 0,
+        max_streams: int = 50,
+        heartbeat_seconds: int = 20,
+        reload_seconds: int = 300,
+        max_stream_seconds: int = 600,
+        retry_ms: int = 3000,
+        sleep=time.sleep,
+        monotonic=time.monotonic,
+        now=current_time_value,
+    ):
+        self.load_orders = load_orders
+        self.statuses_for = statuses_for
+        self.version = version
+        self.max_streams = max(0, int(max_streams))
+        self.heartbeat_seconds = max(1, int(heartbeat_seconds))
+        self.reload_seconds = max(1, int(reload_seconds))
+        self.max_stream_seconds = max(1, int(max_stream_seconds))
+        self.retry_ms = max(100, int(retry_ms))
+        self._sleep = sleep
+        self._monotonic = monotonic
+        self._now = now
+        self._lock = threading.Lock()
+        self._open_streams = 0
+
+    @property
+    def open_streams(self) -> int:
+        with self._lock:
+            return self._open_streams
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._open_streams >= self.max_streams:
+                return False
+            self._open_streams += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._open_streams = max(0, self._open_streams - 1)
+
+    def seconds_until_next_phase(self, statuses: list[dict]) -> float | None:
+        now = self._now()
+        waits = []
+        for item in statuses or []:
+            phase_end = _parse_phase_end(item.get("phase_ends_at"))
+            if phase_end is not None:
+                waits.append(max(0.0, (phase_end - now).total_seconds()))
+        if not waits:
+            return None
+        return min(waits) + 1.0
+
+    def events(self, user_id: int, last_event_id: str = ""):
+        yield f"retry: {self.retry_ms}\n\n"
+        sent_event_id = str(last_event_id or "").strip()
+        started_at = self._monotonic()
+        last_write_at = started_at
+        orders = None
+        loaded_version = None
+        reload_at = started_at
+        next_check_at = started_at
+        while True:
+            current = self._monotonic()
+            if current - started_at >= self.max_stream_seconds:
+                return
+            version = self.version(user_id)
+            if orders is None or version != loaded_version or current >= reload_at:
+                # The version is read before the load, so a change during the load triggers another one.
+                loaded_version = version
+                orders = self.load_orders(user_id)
+                reload_at = current + self.reload_seconds
+                next_check_at = current
+            if current >= next_check_at:
+                statuses = self.statuses_for(orders)
+                event_id = status_event_id(statuses)
+                if event_id != sent_event_id:
+                    yield format_sse_event(
+                        "order-statuses",
+                        {
+                            "ok": True,
+                            "order_statuses": statuses,
+                            "server_time": datetime.now().isoformat(timespec="seconds"),
+                        },
+                        event_id,
+                    )
+                    sent_event_id = event_id
+                    last_write_at = self._monotonic()
+                wait = self.seconds_until_next_phase(statuses)
+                next_check_at = reload_at if wait is None else self._monotonic() + wait
+            current = self._monotonic()
+            if current - last_write_at >= self.heartbeat_seconds:
+                yield ": ping\n\n"
+                last_write_at = current
+            # Heartbeats also bound how long a version bump waits to be noticed.
+            wake_at = min(
+                next_check_at,
+                reload_at,
+                last_write_at + self.heartbeat_seconds,
+                started_at + self.max_stream_seconds,
+            )
+            self._sleep(max(0.05, wake_at - current))
@@ -0,0 +1,317 @@
+import math
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+
+
+ORDER_TIMELINE_VERSION = 1
+_UTC = timezone.utc
+
+
+def epoch_seconds_value(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=_UTC)
+    return value.timestamp()
+
+
+def steps_signature_value(order_status_steps) -> str:
+    return ",".join(f"{step.get('key')}:{int(step.get('duration_seconds', 0) or 0)}" for step in order_status_steps)
+
+
+def _iso(value: datetime) -> str:
+    return value.isoformat(timespec="seconds")
+
+
+class OrderTimeline:
+    """Absolute phase boundaries of one order; status lookups are a bisect over `starts`."""
+
+    __slots__ = (
+        "order_id",
+        "order_type",
+        "flow",
+        "steps_signature",
+        "keys",
+        "starts",
+        "ends",
+        "start_isos",
+        "end_isos",
+        "cycle_start",
+        "cycle_started_at",
+        "cycle_end",
+        "cycle_ends_at",
+        "target_at",
+        "eta_total_seconds",
+    )
+
+    def __init__(
+        self,
+        *,
+        order_id,
+        order_type: str,
+        flow: str,
+        steps_signature: str,
+        keys: list[str],
+        starts: list[float],
+        ends: list[float],
+        start_isos: list[str],
+        end_isos: list[str],
+        cycle_start: float,
+        cycle_started_at: str,
+        cycle_end: float,
+        cycle_ends_at: str,
+        target_at: float,
+        eta_total_seconds: int = 0,
+    ):
+        self.order_id = order_id
+        self.order_type = order_type
+        self.flow = flow
+        self.steps_signature = steps_signature
+        self.keys = keys
+        self.starts = starts
+        self.ends = ends
+        self.start_isos = start_isos
+        self.end_isos = end_isos
+        self.cycle_start = cycle_start
+        self.cycle_started_at = cycle_started_at
+        self.cycle_end = cycle_end
+        self.cycle_ends_at = cycle_ends_at
+        self.target_at = target_at
+        self.eta_total_seconds = eta_total_seconds
+
+    @classmethod
+    def _from_segments(cls, order, *, order_type, flow, steps_signature, anchor: datetime, segments, cycle_start: datetime, target_at: datetime, eta_total_seconds: int = 0):
+        keys, starts, ends, start_isos, end_isos = [], [], [], [], []
+        for key, start, end in segments:
+            keys.append(key)
+            starts.append(epoch_seconds_value(start))
+            ends.append(epoch_seconds_value(end))
+            start_isos.append(_iso(start))
+            end_isos.append(_iso(end))
+        cycle_end = segments[-1][2]
+        return cls(
+            order_id=order.get("id"),
+            order_type=order_type,
+            flow=flow,
+            steps_signature=steps_signature,
+            keys=keys,
+            starts=starts,
+            ends=ends,
+            start_isos=start_isos,
+            end_isos=end_isos,
+            cycle_start=epoch_seconds_value(anchor),
+            cycle_started_at=_iso(cycle_start),
+            cycle_end=epoch_seconds_value(cycle_end),
+            cycle_ends_at=_iso(cycle_end),
+            target_at=epoch_seconds_value(target_at),
+            eta_total_seconds=eta_total_seconds,
+        )
+
+    @classmethod
+    def compile(cls, order, order_status_steps, parse_iso_datetime_fn, parse_datetime_fn, compute_serve_datetime_fn):
+        created_at = parse_iso_datetime_fn(order.get("created_at"))
+        if created_at is None:
+            return None
+        signature = steps_signature_value(order_status_steps)
+        order_type = str(order.get("order_type") or "").strip().lower()
+
+        if order_type == "delivery":
+            cooking_seconds = 15 * 60
+            courier_sent_seconds = 60
+            eta_minutes = int(order.get("delivery_eta_minutes", 20) or 20)
+            eta_total_seconds = max(cooking_seconds + courier_sent_seconds, eta_minutes * 60)
+            delivering_seconds = max(0, eta_total_seconds - cooking_seconds - courier_sent_seconds)
+            segments = []
+            offset = 0
+            for key, duration in (
+                ("cooking", cooking_seconds),
+                ("courier_sent", courier_sent_seconds),
+                ("delivering", delivering_seconds),
+                ("delivered", 60),
+            ):
+                segments.append((key, created_at + timedelta(seconds=offset), created_at + timedelta(seconds=offset + duration)))
+                offset += duration
+            return cls._from_segments(
+                order,
+                order_type="delivery",
+                flow="delivery",
+                steps_signature=signature,
+                anchor=created_at,
+                segments=segments,
+                cycle_start=created_at,
+                target_at=created_at + timedelta(seconds=eta_total_seconds),
+                eta_total_seconds=eta_total_seconds,
+            )
+
+        steps_index = {step.get("key"): int(step.get("duration_seconds", 0) or 0) for step in order_status_steps}
+        booking = order.get("booking") or {}
+        booking_dt = parse_datetime_fn(booking.get("date"), booking.get("time"))
+        if booking_dt:
+            cooking_seconds = max(0, steps_index.get("preparing", 15 * 60))
+            delivering_seconds = max(0, steps_index.get("delivering", 60))
+            delivered_seconds = max(0, steps_index.get("served", 60))
+            serve_dt = compute_serve_datetime_fn(order, booking_dt, parse_datetime_fn) or booking_dt
+            if serve_dt < booking_dt:
+                serve_dt = booking_dt
+            planned_cook_start = serve_dt - timedelta(seconds=cooking_seconds + delivering_seconds)
+            cook_start = max(created_at, planned_cook_start)
+            delivering_start = cook_start + timedelta(seconds=cooking_seconds)
+            delivered_start = delivering_start + timedelta(seconds=delivering_seconds)
+            cycle_end = delivered_start + timedelta(seconds=delivered_seconds)
+            return cls._from_segments(
+                order,
+                order_type="dine_in",
+                flow="booking",
+                steps_signature=signature,
+                anchor=created_at,
+                segments=[
+                    ("waiting", created_at, cook_start),
+                    ("preparing", cook_start, delivering_start),
+                    ("delivering", delivering_start, delivered_start),
+                    ("served", delivered_start, cycle_end),
+                ],
+                cycle_start=cook_start,
+                target_at=delivered_start,
+            )
+
+        segments = []
+        offset = 0
+        serving_start_offset = None
+        for step in order_status_steps:
+            duration = step["duration_seconds"]
+            if step.get("key") == "served" and serving_start_offset is None:
+                serving_start_offset = offset
+            segments.append((step["key"], created_at + timedelta(seconds=offset), created_at + timedelta(seconds=offset + duration)))
+            offset += duration
+        if serving_start_offset is None:
+            serving_start_offset = sum(int(step.get("duration_seconds", 0) or 0) for step in order_status_steps)
+        if not segments:
+            return None
+        return cls._from_segments(
+            order,
+            order_type="dine_in",
+            flow="steps",
+            steps_signature=signature,
+            anchor=created_at,
+            segments=segments,
+            cycle_start=created_at,
+            target_at=created_at + timedelta(seconds=serving_start_offset),
+        )
+
+    def to_payload(self) -> dict:
+        return {
+            "v": ORDER_TIMELINE_VERSION,
+            "order_type": self.order_type,
+            "flow": self.flow,
+            "steps": self.steps_signature,
+            "keys": list(self.keys),
+            "starts": list(self.starts),
+            "ends": list(self.ends),
+            "start_isos": list(self.start_isos),
+            "end_isos": list(self.end_isos),
+            "cycle_start": self.cycle_start,
+            "cycle_started_at": self.cycle_started_at,
+            "cycle_end": self.cycle_end,
+            "cycle_ends_at": self.cycle_ends_at,
+            "target_at": self.target_at,
+            "eta_total_seconds": self.eta_total_seconds,
+        }
+
+    @classmethod
+    def from_payload(cls, payload, *, order_id=None, steps_signature: str | None = None):
+        if not isinstance(payload, dict) or payload.get("v") != ORDER_TIMELINE_VERSION:
+            return None
+        if steps_signature is not None and payload.get("steps") != steps_signature:
+            return None
+        try:
+            keys = [str(key) for key in payload["keys"]]
+            starts = [float(value) for value in payload["starts"]]
+            ends = [float(value) for value in payload["ends"]]
+            start_isos = [str(value) for value in payload["start_isos"]]
+            end_isos = [str(value) for value in payload["end_isos"]]
+            if not keys or not len(keys) == len(starts) == len(ends) == len(start_isos) == len(end_isos):
+                return None
+            return cls(
+                order_id=order_id,
+                order_type=str(payload["order_type"]),
+                flow=str(payload["flow"]),
+                steps_signature=str(payload.get("steps") or ""),
+                keys=keys,
+                starts=starts,
+                ends=ends,
+                start_isos=start_isos,
+                end_isos=end_isos,
+                cycle_start=float(payload["cycle_start"]),
+                cycle_started_at=str(payload["cycle_started_at"]),
+                cycle_end=float(payload["cycle_end"]),
+                cycle_ends_at=str(payload["cycle_ends_at"]),
+                target_at=float(payload["target_at"]),
+                eta_total_seconds=int(payload.get("eta_total_seconds") or 0),
+            )
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def active_until(self) -> float:
+        # The user-facing lists drop a delivery once it reaches "delivered".
+        if self.flow == "delivery" and "delivered" in self.keys:
+            return self.starts[self.keys.index("delivered")]
+        return self.cycle_end
+
+    def status_at(self, now: float):
+        if self.flow == "booking":
+            return self._booking_status_at(now)
+        elapsed = max(0, int(now - self.cycle_start))
+        if self.cycle_start + elapsed >= self.cycle_end:
+            return None
+        index = max(0, bisect_right(self.starts, self.cycle_start + elapsed) - 1)
+        phase_offset = int(self.starts[index] - self.cycle_start)
+        phase_duration = int(self.ends[index] - self.starts[index])
+        phase_elapsed = elapsed - phase_offset
+        status = {
+            "order_id": self.order_id,
+            "order_type": self.order_type,
+            "phase": self.keys[index],
+            "phase_elapsed_seconds": phase_elapsed,
+            "phase_remaining_seconds": max(0, phase_duration - phase_elapsed),
+            "phase_duration_seconds": phase_duration,
+            "phase_progress_ratio": (phase_elapsed / phase_duration) if phase_duration else 1.0,
+            "cycle_started_at": self.cycle_started_at,
+            "phase_started_at": self.start_isos[index],
+            "phase_ends_at": self.end_isos[index],
+            "cycle_ends_at": self.cycle_ends_at,
+        }
+        if self.flow == "delivery":
+            eta_remaining = max(0, math.ceil(self.target_at - now))
+            status["eta_total_seconds"] = self.eta_total_seconds
+            status["eta_remaining_seconds"] = eta_remaining
+            status["time_to_target_seconds"] = eta_remaining
+        else:
+            status["time_to_target_seconds"] = max(0, int(self.target_at - now))
+        return status
+
+    def _booking_status_at(self, now: float):
+        if now >= self.cycle_end:
+            return None
+        index = max(0, bisect_right(self.starts, now) - 1)
+        if now < self.ends[0]:
+            index = 0
+        phase_start = self.starts[index]
+        phase_end = self.ends[index]
+        phase_duration = max(1, math.ceil(phase_end - phase_start))
+        phase_elapsed = min(phase_duration, max(0, math.floor(now - phase_start)))
+        return {
+            "order_id": self.order_id,
+            "order_type": self.order_type,
+            "phase": self.keys[index],
+            "phase_elapsed_seconds": phase_elapsed,
+            "phase_remaining_seconds": max(0, math.ceil(phase_end - now)),
+            "phase_duration_seconds": phase_duration,
+            "phase_progress_ratio": (phase_elapsed / phase_duration),
+            "cycle_started_at": self.start_isos[0] if index == 0 else self.cycle_started_at,
+            "phase_started_at": self.start_isos[index],
+            "phase_ends_at": self.end_isos[index],
+            "cycle_ends_at": self.cycle_ends_at,
+            "time_to_target_seconds": max(0, math.ceil(self.target_at - now)),
+        }
+
+    @staticmethod
+    def statuses_at(timelines, now: float) -> list:
+        return [timeline.status_at(now) if timeline is not None else None for timeline in timelines]
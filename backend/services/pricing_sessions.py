@@ -0,0 +1,141 @@
+import secrets
+import threading
+import time
+from dataclasses import dataclass, field, replace
+
+
+def _cart_line_value(menu_item: dict, qty: int) -> dict:
+    return {
+        "id": menu_item["id"],
+        "name": menu_item.get("name", ""),
+        "price": menu_item.get("price", 0),
+        "qty": qty,
+        "type": menu_item.get("type", ""),
+        "photo": menu_item.get("photo"),
+    }
+
+
+def normalize_cart_delta_value(raw_delta) -> list[tuple[int, int]]:
+    """`[{"id", "qty"}]` with the new absolute quantity per item; qty 0 removes the line."""
+    changes = []
+    for item in raw_delta if isinstance(raw_delta, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            item_id = int(item.get("id"))
+            qty = int(item.get("qty"))
+        except (TypeError, ValueError):
+            continue
+        if item_id > 0:
+            changes.append((item_id, max(0, qty)))
+    return changes
+
+
+@dataclass
+class PricingContext:
+    session_id: str
+    user_id: int
+    menu_items: list
+    promo_items: list
+    usage_counts: dict
+    expires_at: float
+    revision: int = 0
+    menu_index: dict = field(default_factory=dict)
+    lines: dict = field(default_factory=dict)
+
+    def refresh(self, *, menu_items: list, promo_items: list):
+        # Both lists come from the menu content cache, so identity changes only when the content is reloaded.
+        self.promo_items = promo_items
+        if menu_items is self.menu_items and self.menu_index:
+            return
+        self.menu_items = menu_items
+        self.menu_index = {int(menu_item["id"]): menu_item for menu_item in menu_items or []}
+        self.lines = {
+            item_id: _cart_line_value(self.menu_index[item_id], line["qty"])
+            for item_id, line in self.lines.items()
+            if item_id in self.menu_index
+        }
+
+    def apply_delta(self, changes: list[tuple[int, int]]):
+        for item_id, qty in changes:
+            menu_item = self.menu_index.get(item_id)
+            if qty <= 0 or menu_item is None:
+                self.lines.pop(item_id, None)
+            elif item_id in self.lines:
+                self.lines[item_id]["qty"] = qty
+            else:
+                self.lines[item_id] = _cart_line_value(menu_item, qty)
+        self.revision += 1
+
+    def items(self) -> list[dict]:
+        return [dict(line) for line in self.lines.values()]
+
+
+class CheckoutPricingSessions:
+    """Short-lived per-user pricing contexts for the checkout cart: later previews send only the changed lines."""
+
+    def __init__(self, *, ttl_seconds: int = 600, max_sessions: int = 4096, monotonic=time.monotonic):
+        self.ttl_seconds = max(30, int(ttl_seconds or 0))
+        self.max_sessions = max(1, int(max_sessions))
+        self._monotonic = monotonic
+        self._lock = threading.Lock()
+        self._contexts = {}
+        self._user_sessions = {}
+
+    def _purge_expired(self, now: float):
+        for session_id in [session_id for session_id, context in self._contexts.items() if context.expires_at <= now]:
+            self._drop(session_id)
+
+    def _drop(self, session_id: str):
+        context = self._contexts.pop(session_id, None)
+        if context is not None and self._user_sessions.get(context.user_id) == session_id:
+            self._user_sessions.pop(context.user_id, None)
+
+    def open(self, *, user_id: int, items: list[dict], menu_items: list, promo_items: list, usage_counts: dict) -> PricingContext:
+        now = self._monotonic()
+        context = PricingContext(
+            session_id=secrets.token_urlsafe(16),
+            user_id=int(user_id),
+            menu_items=None,
+            promo_items=promo_items,
+            usage_counts=dict(usage_counts or {}),
+            expires_at=now + self.ttl_seconds,
+        )
+        context.refresh(menu_items=menu_items, promo_items=promo_items)
+        context.apply_delta([(int(item["id"]), int(item["qty"])) for item in items or []])
+        with self._lock:
+            self._purge_expired(now)
+            # One live context per user: a full preview replaces the previous one.
+            previous = self._user_sessions.get(context.user_id)
+            if previous:
+                self._drop(previous)
+            while len(self._contexts) >= self.max_sessions:
+                self._drop(next(iter(self._contexts)))
+            self._contexts[context.session_id] = context
+            self._user_sessions[context.user_id] = context.session_id
+        return context
+
+    def advance(self, session_id: str, *, user_id: int, revision: int, changes, menu_items: list, promo_items: list):
+        """Apply a delta on top of `revision`; None when the context is gone or the client is out of sync."""
+        now = self._monotonic()
+        with self._lock:
+            context = self._contexts.get(str(session_id or ""))
+            if context is None or context.expires_at <= now or context.user_id != int(user_id):
+                return None
+            if context.revision != revision:
+                return None
+            context.refresh(menu_items=menu_items, promo_items=promo_items)
+            context.apply_delta(changes)
+            context.expires_at = now + self.ttl_seconds
+            # A copy, so a concurrent delta cannot change the cart or revision while this one is priced.
+            return replace(context, lines={item_id: dict(line) for item_id, line in context.lines.items()})
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._contexts.clear()
+                self._user_sessions.clear()
+                return
+            session_id = self._user_sessions.get(int(user_id))
+            if session_id:
+                self._drop(session_id)
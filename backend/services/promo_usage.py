@@ -0,0 +1,175 @@
+import threading
+import time
+from datetime import datetime
+
+from services.business_logic import APP_TIMEZONE, UTC, current_local_datetime_value, parse_iso_datetime_value
+
+
+def local_day_value(applied_at=None) -> str:
+    if applied_at is None:
+        return current_local_datetime_value().date().isoformat()
+    if isinstance(applied_at, str):
+        applied_at = parse_iso_datetime_value(applied_at)
+        if applied_at is None:
+            return current_local_datetime_value().date().isoformat()
+    if applied_at.tzinfo is None:
+        # Order timestamps are stored as naive UTC.
+        applied_at = applied_at.replace(tzinfo=UTC)
+    return applied_at.astimezone(APP_TIMEZONE).date().isoformat()
+
+
+def count_day_applications_value(orders: list[dict], *, user_id: int, day: str) -> dict[int, int]:
+    counts = {}
+    for order in orders or []:
+        if not isinstance(order, dict) or int(order.get("user_id") or 0) != int(user_id):
+            continue
+        if local_day_value(order.get("created_at")) != day:
+            continue
+        for applied in order.get("promotions_applied", []) or []:
+            try:
+                promo_id = int((applied or {}).get("promo_id") or 0)
+                applied_count = max(0, int((applied or {}).get("applied_count") or 0))
+            except (TypeError, ValueError):
+                continue
+            if promo_id > 0 and applied_count > 0:
+                counts[promo_id] = counts.get(promo_id, 0) + applied_count
+    return counts
+
+
+class PromoUsageCounter:
+    """Per-user, per-local-day promotion usage: optional Redis hash, origin on a miss.
+
+    The per-process memory entry (TTL) is only used without Redis and only for `counts()`; `fresh_counts()`
+    always reads Redis or the origin, so limits checked at payment see applications from other workers.
+    """
+
+    def __init__(
+        self,
+        *,
+        load_counts=None,
+        load_user_orders=None,
+        redis_client_fn=None,
+        redis_key_prefix: str = "promo:usage:v1",
+        ttl_seconds: int = 300,
+        monotonic=time.monotonic,
+    ):
+        self.load_counts = load_counts
+        self.load_user_orders = load_user_orders
+        self.redis_client_fn = redis_client_fn
+        self.redis_key_prefix = redis_key_prefix
+        self.ttl_seconds = max(0, int(ttl_seconds or 0))
+        self._monotonic = monotonic
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _redis_key(self, user_id: int, day: str) -> str:
+        return f"{self.redis_key_prefix}:{day}:{int(user_id)}"
+
+    def _redis_client(self):
+        if not callable(self.redis_client_fn):
+            return None
+        try:
+            return self.redis_client_fn()
+        except Exception:
+            return None
+
+    def _load_origin(self, user_id: int, day: str) -> dict[int, int]:
+        if callable(self.load_counts):
+            return {int(promo_id): int(count) for promo_id, count in (self.load_counts(user_id=user_id) or {}).items()}
+        if callable(self.load_user_orders):
+            return count_day_applications_value(self.load_user_orders(user_id), user_id=user_id, day=day)
+        return {}
+
+    def counts(self, *, user_id, at=None, fresh: bool = False) -> dict[int, int]:
+        if not user_id:
+            return {}
+        user_id = int(user_id)
+        day = local_day_value(at)
+        now = self._monotonic()
+        client = self._redis_client()
+        # Redis is shared by all workers and updated on every save, so it stays the authority when configured.
+        if client is None and not fresh:
+            with self._lock:
+                entry = self._entries.get((user_id, day))
+                if entry is not None and entry[0] > now:
+                    return dict(entry[1])
+
+        counts = None
+        if client is not None:
+            try:
+                cached = client.hgetall(self._redis_key(user_id, day))
+                if cached:
+                    counts = {int(promo_id): int(count) for promo_id, count in cached.items() if str(promo_id).isdigit()}
+            except Exception as exc:
+                print(f"[cache] redis promo usage read failed ({exc}), fallback=origin")
+        if counts is None:
+            counts = self._load_origin(user_id, day)
+            if client is not None:
+                try:
+                    key = self._redis_key(user_id, day)
+                    pipe = client.pipeline()
+                    # An empty hash cannot be stored, so a marker field keeps "no usage yet" cacheable.
+                    pipe.hset(key, mapping={"_": 0, **{str(promo_id): count for promo_id, count in counts.items()}})
+                    pipe.expire(key, 2 * 24 * 3600)
+                    pipe.execute()
+                except Exception as exc:
+                    print(f"[cache] redis promo usage write failed ({exc})")
+        if self.ttl_seconds and client is None:
+            with self._lock:
+                self._entries[(user_id, day)] = (now + self.ttl_seconds, dict(counts))
+        return counts
+
+    def fresh_counts(self, *, user_id, at=None) -> dict[int, int]:
+        return self.counts(user_id=user_id, at=at, fresh=True)
+
+    def record(self, *, user_id, applied_promotions: list[dict], applied_at: datetime | None = None):
+        if not user_id:
+            return
+        increments = {}
+        for applied in applied_promotions or []:
+            try:
+                promo_id = int((applied or {}).get("promo_id") or 0)
+                applied_count = max(0, int((applied or {}).get("applied_count") or 0))
+            except (TypeError, ValueError):
+                continue
+            if promo_id > 0 and applied_count > 0:
+                increments[promo_id] = increments.get(promo_id, 0) + applied_count
+        if not increments:
+            return
+        user_id = int(user_id)
+        day = local_day_value(applied_at)
+        with self._lock:
+            entry = self._entries.get((user_id, day))
+            if entry is not None:
+                for promo_id, applied_count in increments.items():
+                    entry[1][promo_id] = entry[1].get(promo_id, 0) + applied_count
+        client = self._redis_client()
+        if client is None:
+            return
+        key = self._redis_key(user_id, day)
+        try:
+            # Only a hash that was filled from the origin is updated; a missing one is rebuilt on the next read.
+            if client.exists(key):
+                pipe = client.pipeline()
+                for promo_id, applied_count in increments.items():
+                    pipe.hincrby(key, str(promo_id), applied_count)
+                pipe.execute()
+        except Exception as exc:
+            print(f"[cache] redis promo usage write failed ({exc})")
+            try:
+                client.delete(key)
+            except Exception:
+                pass
+
+    def save_applications(self, save_fn, *, order_id: int, user_id: int, applied_promotions: list[dict], applied_at: datetime | None = None):
+        result = save_fn(order_id=order_id, user_id=user_id, applied_promotions=applied_promotions, applied_at=applied_at)
+        self.record(user_id=user_id, applied_promotions=applied_promotions, applied_at=applied_at)
+        return result
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == int(user_id)]:
+                self._entries.pop(key, None)
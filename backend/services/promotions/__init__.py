@@ -1,30 +1,58 @@
 from .applier import PromotionApplicationState, apply_reward
 from .checkout import build_priced_order_preview
+from .compiler import build_order_features, compile_promotion
 from .engine import (
     apply_promotions_to_order,
     build_dsl_text_from_promo_item,
     build_validation_context,
     collect_runtime_promotions,
+    compiled_promotions,
+    configure_discount_policy,
     count_user_day_applications,
+    current_discount_policy,
+    invalidate_compiled_promotions,
     parse_and_validate_promo_source,
 )
-from .evaluator import evaluate_condition, evaluate_promotion
+from .evaluator import evaluate_compiled_promotion, evaluate_condition, evaluate_promotion
+from .index import PromotionIndex
 from .parser import parse_promotion
+from .runtime import CompiledPromotionCache
+from .schedule import PromotionSchedule
+from .serialization import AST_FORMAT_VERSION, load_promotion_rules, serialize_promo_source
+from .simulation import PromotionSimulation
+from .solver import DISCOUNT_MODES, DiscountPolicy, solve_discounts
 from .validator import PromotionValidationError, validate_promotion
 
 __all__ = [
+    "AST_FORMAT_VERSION",
+    "CompiledPromotionCache",
+    "DISCOUNT_MODES",
+    "DiscountPolicy",
     "PromotionApplicationState",
+    "PromotionIndex",
+    "PromotionSchedule",
+    "PromotionSimulation",
     "PromotionValidationError",
     "apply_reward",
     "apply_promotions_to_order",
+    "build_order_features",
     "build_priced_order_preview",
     "build_dsl_text_from_promo_item",
     "build_validation_context",
     "collect_runtime_promotions",
+    "compile_promotion",
+    "compiled_promotions",
+    "configure_discount_policy",
     "count_user_day_applications",
+    "current_discount_policy",
+    "evaluate_compiled_promotion",
     "evaluate_condition",
     "evaluate_promotion",
+    "invalidate_compiled_promotions",
+    "load_promotion_rules",
     "parse_and_validate_promo_source",
     "parse_promotion",
+    "serialize_promo_source",
+    "solve_discounts",
     "validate_promotion",
 ]
@@ -13,6 +13,7 @@ class PromotionApplicationState:
     awarded_points: int = 0
     notifications: list[str] = field(default_factory=list)
     best_discount: dict | None = None
+    discount_candidates: list[dict] = field(default_factory=list)
 
 
 def apply_reward(
@@ -34,6 +35,8 @@ def apply_reward(
         _apply_gift(definition, state.order, reward.item_id, reward.qty, applied_count)
     elif reward.kind in {"DISCOUNT_PERCENT", "DISCOUNT_RUB", "CHEAPEST_FREE_FROM_GROUP"}:
         candidate = _build_discount_candidate(definition, state.order, applied_count)
+        if candidate is not None:
+            state.discount_candidates.append(candidate)
         if candidate is not None and (
             state.best_discount is None or candidate["priority"] > state.best_discount["priority"]
         ):
@@ -25,7 +25,8 @@ def build_priced_order_preview(
         order={"items": items},
         promo_items=promo_items,
         menu_items=menu_items,
-        prior_orders=load_orders_fn(),
+        # Order history is only scanned when no usage counts are available.
+        prior_orders=load_orders_fn() if prior_application_counts is None else None,
         prior_application_counts=prior_application_counts,
         user_id=user_id,
     )
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import operator
+from dataclasses import dataclass, field
+
+from .ast import Comparison, ConditionGroup, ConditionNot, MetricRef, PromotionDefinition
+
+
+_COMPARATORS = {
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+}
+
+
+@dataclass
+class OrderFeatures:
+    item_qty: dict[int, int] = field(default_factory=dict)
+    item_sum: dict[int, int] = field(default_factory=dict)
+    type_qty: dict[str, int] = field(default_factory=dict)
+    type_sum: dict[str, int] = field(default_factory=dict)
+    type_unique: dict[str, set] = field(default_factory=dict)
+    total_qty: int = 0
+    subtotal: int = 0
+    unique_ids: set = field(default_factory=set)
+
+
+def build_order_features(order: dict) -> OrderFeatures:
+    """One pass over the user items (gifts excluded), aggregated the way `resolve_metric_value` reads them."""
+    features = OrderFeatures()
+    for item in (order or {}).get("items", []) or []:
+        if not isinstance(item, dict) or bool(item.get("is_gift") or item.get("gift")):
+            continue
+        item_id = _safe_int(item.get("id"))
+        qty = max(0, _safe_int(item.get("qty")))
+        line_sum = max(0, _safe_int(item.get("price"))) * qty
+        item_type = str(item.get("type") or "").strip()
+        features.item_qty[item_id] = features.item_qty.get(item_id, 0) + qty
+        features.item_sum[item_id] = features.item_sum.get(item_id, 0) + line_sum
+        features.type_qty[item_type] = features.type_qty.get(item_type, 0) + qty
+        features.type_sum[item_type] = features.type_sum.get(item_type, 0) + line_sum
+        features.total_qty += qty
+        features.subtotal += line_sum
+        if qty > 0:
+            features.unique_ids.add(max(0, item_id))
+            features.type_unique.setdefault(item_type, set()).add(max(0, item_id))
+    return features
+
+
+@dataclass(frozen=True)
+class CompiledPromotion:
+    condition: object
+    per_match_metric: object | None
+    required_keys: frozenset | None = None
+
+
+def compile_metric(metric: MetricRef):
+    if metric.target == "order":
+        return lambda features: features.subtotal
+    if metric.target == "all_items":
+        if metric.field == "QTY":
+            return lambda features: features.total_qty
+        if metric.field == "UNIQUE_QTY":
+            return lambda features: len(features.unique_ids)
+        return lambda features: features.subtotal
+    if metric.target == "item":
+        item_id = metric.item_id
+        if metric.field == "QTY":
+            return lambda features: features.item_qty.get(item_id, 0)
+        if metric.field == "UNIQUE_QTY":
+            return lambda features: 1 if features.item_qty.get(item_id, 0) > 0 else 0
+        return lambda features: features.item_sum.get(item_id, 0)
+    if metric.target == "type":
+        item_type = str(metric.item_type)
+        if metric.field == "QTY":
+            return lambda features: features.type_qty.get(item_type, 0)
+        if metric.field == "UNIQUE_QTY":
+            return lambda features: len(features.type_unique.get(item_type, ()))
+        return lambda features: features.type_sum.get(item_type, 0)
+    if metric.target == "group":
+        group_ids = tuple(sorted(set(metric.group_ids)))
+        if metric.field == "QTY":
+            return lambda features: sum(features.item_qty.get(item_id, 0) for item_id in group_ids)
+        if metric.field == "UNIQUE_QTY":
+            return lambda features: len(
+                {max(0, item_id) for item_id in group_ids if features.item_qty.get(item_id, 0) > 0}
+            )
+        return lambda features: sum(features.item_sum.get(item_id, 0) for item_id in group_ids)
+    return lambda features: 0
+
+
+def compile_condition(node):
+    if isinstance(node, ConditionGroup):
+        left = compile_condition(node.left)
+        right = compile_condition(node.right)
+        if node.operator == "AND":
+            return lambda features: left(features) and right(features)
+        return lambda features: left(features) or right(features)
+    if isinstance(node, ConditionNot):
+        operand = compile_condition(node.operand)
+        return lambda features: not operand(features)
+    if isinstance(node, Comparison):
+        metric = compile_metric(node.metric)
+        compare = _COMPARATORS.get(node.operator)
+        if compare is None:
+            return lambda features: False
+        value = node.value
+        return lambda features: compare(metric(features), value)
+    return lambda features: False
+
+
+def required_keys_value(node) -> frozenset | None:
+    """Cart keys of which at least one must be present for `node` to hold; None when it can hold on any cart."""
+    if isinstance(node, ConditionGroup):
+        left = required_keys_value(node.left)
+        right = required_keys_value(node.right)
+        if node.operator == "AND":
+            if left is None or right is None:
+                return left if right is None else right
+            return left if len(left) <= len(right) else right
+        if left is None or right is None:
+            return None
+        return left | right
+    if not isinstance(node, Comparison):
+        return None
+    compare = _COMPARATORS.get(node.operator)
+    # A comparison that already holds at metric 0 (`< 2`, `!= 3`, `NOT ...`) says nothing about the cart.
+    if compare is None or compare(0, node.value):
+        return None
+    metric = node.metric
+    if metric.target == "item":
+        return frozenset({("item", metric.item_id)})
+    if metric.target == "type":
+        return frozenset({("type", str(metric.item_type))})
+    if metric.target == "group" and metric.group_ids:
+        return frozenset(("item", item_id) for item_id in metric.group_ids)
+    return None
+
+
+def compile_promotion(definition: PromotionDefinition) -> CompiledPromotion:
+    per_match_metric = None
+    if definition.reward_mode != "once" and isinstance(definition.condition, Comparison):
+        per_match_metric = compile_metric(definition.condition.metric)
+    return CompiledPromotion(
+        condition=compile_condition(definition.condition),
+        per_match_metric=per_match_metric,
+        required_keys=required_keys_value(definition.condition),
+    )
+
+
+def _safe_int(value) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
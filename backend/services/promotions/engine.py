@@ -6,9 +6,13 @@ from datetime import datetime
 from services.business_logic import APP_TIMEZONE, UTC, current_local_datetime_value, parse_iso_datetime_value
 
 from .applier import PromotionApplicationState, apply_reward
-from .evaluator import evaluate_promotion
+from .compiler import CompiledPromotion, build_order_features, compile_promotion
+from .evaluator import evaluate_compiled_promotion, order_user_items_total
 from .parser import parse_promotion
 from .ast import PromotionDslError
+from .runtime import CompiledPromotionCache
+from .serialization import load_promotion_rules
+from .solver import DiscountPolicy, combined_discount_value, solve_discounts
 from .validator import PromotionValidationError, validate_promotion
 
 
@@ -16,6 +20,7 @@ from .validator import PromotionValidationError, validate_promotion
 class PromotionRuntimeEntry:
     source: dict
     definition: object
+    compiled: CompiledPromotion | None = None
 
 
 def build_validation_context(menu_items: list[dict]) -> dict[str, set]:
@@ -41,7 +46,13 @@ def build_validation_context(menu_items: list[dict]) -> dict[str, set]:
 
 
 def parse_and_validate_promo_source(promo_item: dict, *, menu_items: list[dict]):
-    definition = parse_promotion(build_dsl_text_from_promo_item(promo_item))
+    rules = load_promotion_rules(
+        promo_item.get("dsl_ast"),
+        condition=str(promo_item.get("condition") or "").strip(),
+        reward=str(promo_item.get("reward") or "").strip(),
+        dsl_version=promo_item.get("dsl_version"),
+    )
+    definition = parse_promotion(build_dsl_text_from_promo_item(promo_item), rules=rules)
     return validate_promotion(definition, **build_validation_context(menu_items))
 
 
@@ -82,11 +93,30 @@ def collect_runtime_promotions(promo_items: list[dict], *, menu_items: list[dict
             definition = parse_and_validate_promo_source(promo_item, menu_items=menu_items)
         except (PromotionValidationError, PromotionDslError):
             continue
-        runtime_entries.append(PromotionRuntimeEntry(source=promo_item, definition=definition))
+        runtime_entries.append(
+            PromotionRuntimeEntry(source=promo_item, definition=definition, compiled=compile_promotion(definition))
+        )
     runtime_entries.sort(key=lambda entry: (-int(entry.source.get("priority", 0) or 0), int(entry.source.get("id", 0) or 0)))
     return runtime_entries
 
 
+compiled_promotions = CompiledPromotionCache(compile_fn=collect_runtime_promotions)
+_discount_policy = DiscountPolicy()
+
+
+def configure_discount_policy(policy: DiscountPolicy):
+    global _discount_policy
+    _discount_policy = policy
+
+
+def current_discount_policy() -> DiscountPolicy:
+    return _discount_policy
+
+
+def invalidate_compiled_promotions():
+    compiled_promotions.invalidate()
+
+
 def apply_promotions_to_order(
     *,
     order: dict,
@@ -96,12 +126,16 @@ def apply_promotions_to_order(
     prior_application_counts: dict[int, int] | None = None,
     user_id: int | None = None,
     at: datetime | None = None,
+    discount_policy: DiscountPolicy | None = None,
 ) -> dict:
-    runtime_entries = collect_runtime_promotions(promo_items, menu_items=menu_items)
+    policy = discount_policy or _discount_policy
+    promotion_set = compiled_promotions.get_set(promo_items, menu_items=menu_items)
     state = PromotionApplicationState(order={"items": [dict(item) for item in (order or {}).get("items", [])]})
     applied_promotions = []
+    # Rewards only append gift lines, which the features skip, so one pass over the items serves every promotion.
+    features = build_order_features(state.order)
 
-    for entry in runtime_entries:
+    for entry in promotion_set.index.candidates(features):
         promo_id = _safe_int(entry.source.get("id"))
         if prior_application_counts is not None:
             prior_count = _safe_int((prior_application_counts or {}).get(promo_id), 0)
@@ -112,9 +146,10 @@ def apply_promotions_to_order(
                 promo_id=promo_id,
                 at=at,
             )
-        evaluation = evaluate_promotion(
+        evaluation = evaluate_compiled_promotion(
             entry.definition,
-            state.order,
+            entry.compiled or compile_promotion(entry.definition),
+            features,
             user_day_applied_count=prior_count,
             at=at,
         )
@@ -132,6 +167,10 @@ def apply_promotions_to_order(
             }
         )
 
+    if policy.mode == "optimal" and state.discount_candidates:
+        solution = solve_discounts(state.discount_candidates, policy, cap=order_user_items_total(state.order))
+        state.best_discount = combined_discount_value(solution)
+
     return {
         "items": state.order.get("items", []),
         "awarded_points": state.awarded_points,
@@ -4,6 +4,7 @@ from dataclasses import dataclass
 from datetime import datetime
 
 from .ast import ConditionGroup, ConditionNot, MetricRef, PromotionDefinition
+from .compiler import CompiledPromotion, OrderFeatures
 
 
 @dataclass(frozen=True)
@@ -73,6 +74,40 @@ def evaluate_promotion(
     )
 
 
+def evaluate_compiled_promotion(
+    definition: PromotionDefinition,
+    compiled: CompiledPromotion,
+    features: OrderFeatures,
+    *,
+    user_day_applied_count: int = 0,
+    at: datetime | None = None,
+) -> PromotionEvaluationResult:
+    if not is_promotion_active(definition, at=at):
+        return PromotionEvaluationResult(False, False, 0, 0, None)
+    if not compiled.condition(features):
+        return PromotionEvaluationResult(False, True, 0, 0, None)
+
+    if definition.reward_mode == "once":
+        base_count = 1
+    elif compiled.per_match_metric is None or definition.condition.value <= 0:
+        base_count = 0
+    else:
+        base_count = compiled.per_match_metric(features) // definition.condition.value
+    applied_count = apply_limits(
+        base_count,
+        limit_per_order=definition.limit_per_order,
+        limit_per_user_per_day=definition.limit_per_user_per_day,
+        user_day_applied_count=user_day_applied_count,
+    )
+    return PromotionEvaluationResult(
+        matched=applied_count > 0,
+        active=True,
+        base_count=base_count,
+        applied_count=applied_count,
+        notify=definition.notify if applied_count > 0 else None,
+    )
+
+
 def is_promotion_active(definition: PromotionDefinition, *, at: datetime | None = None) -> bool:
     if not definition.active:
         return False
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from .compiler import OrderFeatures
+
+
+class PromotionIndex:
+    """Runtime entries keyed by the items and types their conditions need; the rest are always candidates."""
+
+    def __init__(self, entries):
+        self.entries = tuple(entries or ())
+        self.always = []
+        self.by_key = {}
+        for position, entry in enumerate(self.entries):
+            required_keys = getattr(entry.compiled, "required_keys", None)
+            if not required_keys:
+                self.always.append(position)
+                continue
+            for key in required_keys:
+                self.by_key.setdefault(key, []).append(position)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def candidates(self, features: OrderFeatures) -> list:
+        positions = set(self.always)
+        for item_id, qty in features.item_qty.items():
+            if qty > 0:
+                positions.update(self.by_key.get(("item", item_id), ()))
+        for item_type, qty in features.type_qty.items():
+            if qty > 0:
+                positions.update(self.by_key.get(("type", item_type), ()))
+        # Positions follow the priority order of `entries`, which rewards are applied in.
+        return [self.entries[position] for position in sorted(positions)]
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 
 from .ast import (
     Comparison,
@@ -55,7 +56,8 @@ class Token:
     position: int
 
 
-def parse_promotion(raw_text: str) -> PromotionDefinition:
+def parse_promotion(raw_text: str, *, rules: tuple | None = None) -> PromotionDefinition:
+    """`rules` is a pre-parsed (condition, reward) pair, e.g. from the stored AST, which skips tokenizing."""
     fields = _parse_fields(raw_text)
     if "condition" not in fields:
         raise PromotionDslError("Missing required field: condition")
@@ -79,8 +81,8 @@ def parse_promotion(raw_text: str) -> PromotionDefinition:
         dsl_version=dsl_version,
         active=_parse_bool(fields.get("active", "true"), "active"),
         priority=_parse_int(fields.get("priority", "0"), "priority", allow_zero=True),
-        condition=parse_condition(fields["condition"], dsl_version=dsl_version),
-        reward=parse_reward(fields["reward"], dsl_version=dsl_version),
+        condition=rules[0] if rules else _parse_condition_memo(fields["condition"], dsl_version),
+        reward=rules[1] if rules else _parse_reward_memo(fields["reward"], dsl_version),
         notify=notify,
         reward_mode=_parse_reward_mode(fields.get("reward_mode", "once")),
         limit_per_order=_parse_optional_int(fields.get("limit_per_order"), "limit_per_order"),
@@ -102,6 +104,17 @@ def parse_condition(text: str, *, dsl_version: int = 1):
     return result
 
 
+# AST nodes are frozen, so parses of the same text can be shared.
+@lru_cache(maxsize=1024)
+def _parse_condition_memo(text: str, dsl_version: int):
+    return parse_condition(text, dsl_version=dsl_version)
+
+
+@lru_cache(maxsize=1024)
+def _parse_reward_memo(text: str, dsl_version: int) -> Reward:
+    return parse_reward(text, dsl_version=dsl_version)
+
+
 def parse_reward(text: str, *, dsl_version: int = 1) -> Reward:
     source = (text or "").strip()
     if not source:
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+
+from .index import PromotionIndex
+
+
+@dataclass(frozen=True)
+class CompiledPromotionSet:
+    version: int
+    entries: tuple
+    promo_sources: tuple
+    menu_items: object
+    index: PromotionIndex
+
+
+class CompiledPromotionCache:
+    """Parsed and validated promotions, shared across requests until the promo/menu content changes."""
+
+    def __init__(self, *, compile_fn, max_entries: int = 8):
+        self.compile_fn = compile_fn
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._version = 0
+        self._entries = {}
+        self.builds = 0
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            return self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def get(self, promo_items: list[dict], *, menu_items: list[dict]) -> tuple:
+        return self.get_set(promo_items, menu_items=menu_items).entries
+
+    def get_set(self, promo_items: list[dict], *, menu_items: list[dict]) -> CompiledPromotionSet:
+        promo_sources = tuple(
+            promo_item
+            for promo_item in promo_items or []
+            if isinstance(promo_item, dict) and str(promo_item.get("class") or "").strip().lower() == "akciya"
+        )
+        # Promo dicts and the menu list come from the menu content cache, so object identity tracks reloads.
+        key = (tuple(id(promo_item) for promo_item in promo_sources), id(menu_items))
+        with self._lock:
+            version = self._version
+            compiled = self._entries.get(key)
+        if compiled is not None and compiled.version == version:
+            return compiled
+
+        entries = tuple(self.compile_fn(list(promo_sources), menu_items=menu_items))
+        compiled = CompiledPromotionSet(version, entries, promo_sources, menu_items, PromotionIndex(entries))
+        with self._lock:
+            self.builds += 1
+            if self._version == version:
+                if len(self._entries) >= self.max_entries:
+                    self._entries.pop(next(iter(self._entries)))
+                # The set keeps references to its sources so their ids cannot be reused while it is cached.
+                self._entries[key] = compiled
+        return compiled
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from services.business_logic import APP_TIMEZONE
+
+
+# Windows are inclusive of `end_at`; timestamps have microsecond resolution, so the promo drops out one tick later.
+_END_TICK = timedelta(microseconds=1)
+
+
+def _parse_window_value(value) -> datetime | None:
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        text = str(value or "").strip()
+        if not text:
+            return None
+        try:
+            parsed = datetime.fromisoformat(text)
+        except ValueError:
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(APP_TIMEZONE).replace(tzinfo=None)
+    return parsed
+
+
+def promo_window_value(promo_item: dict) -> tuple[datetime | None, datetime | None]:
+    return _parse_window_value(promo_item.get("start_at")), _parse_window_value(promo_item.get("end_at"))
+
+
+def is_in_window_value(start_at: datetime | None, end_at: datetime | None, at: datetime) -> bool:
+    if start_at and at < start_at:
+        return False
+    if end_at and at > end_at:
+        return False
+    return True
+
+
+class PromotionSchedule:
+    """Promo items split into time segments at their start/end boundaries; the active list for a moment is a bisect away.
+
+    Each segment's list is built once and returned as the same object until the next boundary, so caches keyed by
+    the identity of the promo set (the compiled promotion runtime) switch exactly when a window opens or closes.
+    """
+
+    def __init__(self, promo_items):
+        self.items = tuple(promo_items or ())
+        windows = [promo_window_value(promo_item) for promo_item in self.items]
+        boundaries = set()
+        for start_at, end_at in windows:
+            if start_at:
+                boundaries.add(start_at)
+            if end_at:
+                boundaries.add(end_at + _END_TICK)
+        self.boundaries = sorted(boundaries)
+        # Segment 0 is everything before the first boundary; segment i starts at boundaries[i - 1].
+        self.segments = []
+        for index in range(len(self.boundaries) + 1):
+            moment = self.boundaries[index - 1] if index else None
+            self.segments.append(
+                [
+                    promo_item
+                    for promo_item, (start_at, end_at) in zip(self.items, windows)
+                    if (start_at is None if moment is None else is_in_window_value(start_at, end_at, moment))
+                ]
+            )
+
+    def _segment_index(self, at: datetime) -> int:
+        return bisect_right(self.boundaries, at)
+
+    def active_at(self, at: datetime) -> list[dict]:
+        return self.segments[self._segment_index(at)]
+
+    def next_boundary(self, at: datetime) -> datetime | None:
+        index = self._segment_index(at)
+        return self.boundaries[index] if index < len(self.boundaries) else None
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import hashlib
+import json
+
+from .ast import Comparison, ConditionGroup, ConditionNot, MetricRef, PromotionDslError, Reward
+from .parser import parse_promotion
+
+
+# Bump when the encoding below changes; stored payloads with another version are re-parsed from source.
+AST_FORMAT_VERSION = 1
+
+
+def rules_source_hash(condition: str, reward: str, dsl_version) -> str:
+    source = f"{str(dsl_version or '').strip()}\n{str(condition or '').strip()}\n{str(reward or '').strip()}"
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+
+
+def _encode_condition(node):
+    if isinstance(node, ConditionGroup):
+        return ["a" if node.operator == "AND" else "o", _encode_condition(node.left), _encode_condition(node.right)]
+    if isinstance(node, ConditionNot):
+        return ["n", _encode_condition(node.operand)]
+    metric = node.metric
+    return ["c", node.operator, node.value, metric.target, metric.field, metric.item_id, metric.item_type, list(metric.group_ids)]
+
+
+def _decode_condition(payload):
+    tag = payload[0]
+    if tag in ("a", "o"):
+        return ConditionGroup(
+            operator="AND" if tag == "a" else "OR",
+            left=_decode_condition(payload[1]),
+            right=_decode_condition(payload[2]),
+        )
+    if tag == "n":
+        return ConditionNot(operand=_decode_condition(payload[1]))
+    if tag != "c":
+        raise ValueError(f"Unknown condition tag: {tag}")
+    _tag, operator, value, target, field, item_id, item_type, group_ids = payload
+    return Comparison(
+        metric=MetricRef(
+            target=target,
+            field=field,
+            item_id=None if item_id is None else int(item_id),
+            item_type=item_type,
+            group_ids=tuple(int(group_id) for group_id in group_ids),
+        ),
+        operator=operator,
+        value=int(value),
+    )
+
+
+def _encode_reward(reward: Reward):
+    return [reward.kind, reward.amount, reward.item_id, reward.qty, reward.target_kind, list(reward.target_group_ids)]
+
+
+def _decode_reward(payload) -> Reward:
+    kind, amount, item_id, qty, target_kind, target_group_ids = payload
+    return Reward(
+        kind=kind,
+        amount=amount,
+        item_id=item_id,
+        qty=qty,
+        target_kind=target_kind,
+        target_group_ids=tuple(int(group_id) for group_id in target_group_ids),
+    )
+
+
+def dump_promotion_rules(definition, *, condition: str, reward: str, dsl_version) -> str:
+    return json.dumps(
+        {
+            "v": AST_FORMAT_VERSION,
+            "src": rules_source_hash(condition, reward, dsl_version),
+            "c": _encode_condition(definition.condition),
+            "r": _encode_reward(definition.reward),
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def load_promotion_rules(raw_payload, *, condition: str, reward: str, dsl_version):
+    """(condition, reward) nodes from a stored payload, or None when it is missing, stale or of another version."""
+    if not raw_payload:
+        return None
+    try:
+        payload = json.loads(raw_payload) if isinstance(raw_payload, str) else raw_payload
+        if payload.get("v") != AST_FORMAT_VERSION:
+            return None
+        if payload.get("src") != rules_source_hash(condition, reward, dsl_version):
+            return None
+        return _decode_condition(payload["c"]), _decode_reward(payload["r"])
+    except (TypeError, ValueError, KeyError, IndexError, AttributeError):
+        return None
+
+
+def serialize_promo_source(promo_item: dict) -> str:
+    if str(promo_item.get("class") or promo_item.get("class_name") or "akciya").strip().lower() != "akciya":
+        return ""
+    condition = str(promo_item.get("condition") or "").strip()
+    reward = str(promo_item.get("reward") or "").strip()
+    if not condition or not reward:
+        return ""
+    dsl_version = str(promo_item.get("dsl_version") or "").strip()
+    lines = [f"condition={condition}", f"reward={reward}"]
+    if dsl_version:
+        lines.append(f"dsl_version={dsl_version}")
+    try:
+        definition = parse_promotion("\n".join(lines))
+    except PromotionDslError:
+        return ""
+    return dump_promotion_rules(definition, condition=condition, reward=reward, dsl_version=dsl_version)
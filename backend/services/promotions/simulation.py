@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+
+from services.business_logic import APP_TIMEZONE, UTC
+
+from .applier import PromotionApplicationState, apply_reward
+from .ast import PromotionDefinition
+from .compiler import build_order_features, compile_promotion
+from .evaluator import evaluate_compiled_promotion
+
+
+@dataclass
+class PromotionSimulation:
+    """Replays one promotion over historical carts; feed it chunks with `add_carts` and read `summary`."""
+
+    definition: PromotionDefinition
+    orders_scanned: int = 0
+    orders_hit: int = 0
+    applications: int = 0
+    discount_total: int = 0
+    points_total: int = 0
+    gift_units: int = 0
+    revenue_total: int = 0
+    _user_day_counts: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        # "What would it have done": the draft is replayed even if it is saved as hidden.
+        self.definition = replace(self.definition, active=True)
+        self._compiled = compile_promotion(self.definition)
+
+    def add_carts(self, carts):
+        for cart in carts or []:
+            self.add_cart(cart)
+
+    def add_cart(self, cart: dict):
+        items = cart.get("items") or []
+        features = build_order_features({"items": items})
+        self.orders_scanned += 1
+        self.revenue_total += features.subtotal
+        required_keys = self._compiled.required_keys
+        if required_keys and not any(_cart_has_key(features, key) for key in required_keys):
+            return
+
+        created_at = cart.get("created_at")
+        local_created_at = created_at.replace(tzinfo=UTC).astimezone(APP_TIMEZONE).replace(tzinfo=None) if isinstance(created_at, datetime) else None
+        day_key = (cart.get("user_id"), local_created_at.date() if local_created_at else None)
+        evaluation = evaluate_compiled_promotion(
+            self.definition,
+            self._compiled,
+            features,
+            user_day_applied_count=self._user_day_counts.get(day_key, 0),
+            at=local_created_at,
+        )
+        if evaluation.applied_count <= 0:
+            return
+        self._user_day_counts[day_key] = self._user_day_counts.get(day_key, 0) + evaluation.applied_count
+        state = apply_reward(
+            self.definition,
+            {"items": items},
+            applied_count=evaluation.applied_count,
+            state=PromotionApplicationState(order={"items": list(items)}),
+        )
+        self.orders_hit += 1
+        self.applications += evaluation.applied_count
+        self.points_total += state.awarded_points
+        self.discount_total += int((state.best_discount or {}).get("amount") or 0)
+        self.gift_units += sum(int(item.get("qty") or 0) for item in state.order["items"] if item.get("is_gift"))
+
+    def summary(self) -> dict:
+        return {
+            "orders_scanned": self.orders_scanned,
+            "orders_hit": self.orders_hit,
+            "hit_rate": round(self.orders_hit / self.orders_scanned, 4) if self.orders_scanned else 0.0,
+            "applications": self.applications,
+            "discount_total": self.discount_total,
+            "avg_discount": round(self.discount_total / self.orders_hit, 2) if self.orders_hit else 0.0,
+            "points_total": self.points_total,
+            "gift_units": self.gift_units,
+            "revenue_total": self.revenue_total,
+            "revenue_after_discount": self.revenue_total - self.discount_total,
+            "revenue_impact_percent": round(-100.0 * self.discount_total / self.revenue_total, 2) if self.revenue_total else 0.0,
+        }
+
+
+def _cart_has_key(features, key) -> bool:
+    kind, value = key
+    if kind == "item":
+        return features.item_qty.get(value, 0) > 0
+    return features.type_qty.get(value, 0) > 0
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+
+DISCOUNT_MODES = ("priority", "optimal")
+
+
+@dataclass(frozen=True)
+class DiscountPolicy:
+    """How competing discount candidates are combined.
+
+    `priority` keeps the historical behaviour: one discount, chosen by promotion priority.
+    `optimal` picks the combination with the largest total under the stacking rules.
+    """
+
+    mode: str = "priority"
+    max_stacked: int = 1
+    exclusive_kinds: frozenset = field(default_factory=frozenset)
+    allow_overlapping_targets: bool = False
+    candidate_budget: int = 16
+    node_budget: int = 20000
+
+
+@dataclass
+class DiscountSolution:
+    discounts: list
+    amount: int
+    nodes: int = 0
+    exhaustive: bool = True
+
+
+def _candidate_items(candidate: dict):
+    # None stands for the whole order, which overlaps every other target.
+    if str(candidate.get("target_kind") or "ORDER").upper() != "GROUP":
+        return None
+    return frozenset(int(item_id) for item_id in candidate.get("target_group_ids") or ())
+
+
+def _conflicts(left: dict, right: dict, policy: DiscountPolicy) -> bool:
+    if left.get("kind") in policy.exclusive_kinds or right.get("kind") in policy.exclusive_kinds:
+        return True
+    if policy.allow_overlapping_targets:
+        return False
+    left_items = _candidate_items(left)
+    right_items = _candidate_items(right)
+    if left_items is None or right_items is None:
+        return True
+    return bool(left_items & right_items)
+
+
+def priority_discount(candidates: list[dict]) -> dict | None:
+    best = None
+    for candidate in candidates or []:
+        if best is None or candidate["priority"] > best["priority"]:
+            best = candidate
+    return best
+
+
+def _greedy(candidates: list[dict], policy: DiscountPolicy, cap: int) -> list[dict]:
+    chosen = []
+    total = 0
+    for candidate in sorted(candidates, key=lambda item: (-int(item["amount"]), -int(item["priority"]))):
+        if len(chosen) >= policy.max_stacked or total >= cap:
+            break
+        if any(_conflicts(candidate, other, policy) for other in chosen):
+            continue
+        chosen.append(candidate)
+        total += int(candidate["amount"])
+    return chosen
+
+
+def solve_discounts(candidates: list[dict], policy: DiscountPolicy, *, cap: int) -> DiscountSolution:
+    """Best legal combination by branch-and-bound; over `candidate_budget` it falls back to the priority pick."""
+    candidates = [candidate for candidate in candidates or [] if int(candidate.get("amount") or 0) > 0]
+    cap = max(0, int(cap))
+    if not candidates or cap <= 0:
+        return DiscountSolution([], 0)
+    if len(candidates) > policy.candidate_budget:
+        best = priority_discount(candidates)
+        return DiscountSolution([best], min(cap, int(best["amount"])), exhaustive=False)
+
+    ordered = sorted(candidates, key=lambda item: (-int(item["amount"]), -int(item["priority"])))
+    amounts = [int(candidate["amount"]) for candidate in ordered]
+    count = len(ordered)
+    slots = max(1, int(policy.max_stacked))
+    conflicts = [
+        [index != other and _conflicts(ordered[index], ordered[other], policy) for other in range(count)]
+        for index in range(count)
+    ]
+
+    greedy = _greedy(ordered, policy, cap)
+    best = {"value": min(cap, sum(int(item["amount"]) for item in greedy)), "chosen": [ordered.index(item) for item in greedy]}
+    state = {"nodes": 0, "exhausted": False}
+
+    def bound(start: int, free_slots: int) -> int:
+        # Amounts are sorted, so the next `free_slots` candidates are the most that can still be added.
+        return sum(amounts[start:start + free_slots])
+
+    def search(start: int, chosen: list[int], value: int):
+        if state["nodes"] >= policy.node_budget:
+            state["exhausted"] = True
+            return
+        state["nodes"] += 1
+        if min(cap, value) > best["value"]:
+            best["value"] = min(cap, value)
+            best["chosen"] = list(chosen)
+        free_slots = slots - len(chosen)
+        if free_slots <= 0 or start >= count or best["value"] >= cap:
+            return
+        if min(cap, value + bound(start, free_slots)) <= best["value"]:
+            return
+        for index in range(start, count):
+            if any(conflicts[index][other] for other in chosen):
+                continue
+            chosen.append(index)
+            search(index + 1, chosen, value + amounts[index])
+            chosen.pop()
+            if min(cap, value + bound(index + 1, free_slots)) <= best["value"]:
+                return
+
+    search(0, [], 0)
+    discounts = [ordered[index] for index in sorted(best["chosen"])]
+    return DiscountSolution(discounts, best["value"], nodes=state["nodes"], exhaustive=not state["exhausted"])
+
+
+def combined_discount_value(solution: DiscountSolution) -> dict | None:
+    if not solution.discounts:
+        return None
+    if len(solution.discounts) == 1:
+        return dict(solution.discounts[0], amount=solution.amount)
+    return {
+        "kind": "COMBINED",
+        "amount": solution.amount,
+        "priority": max(int(item["priority"]) for item in solution.discounts),
+        "promotion_name": " + ".join(str(item.get("promotion_name") or "") for item in solution.discounts),
+        "applied_count": sum(int(item.get("applied_count") or 0) for item in solution.discounts),
+        "target_kind": "ORDER",
+        "target_group_ids": [],
+        "components": [dict(item) for item in solution.discounts],
+    }
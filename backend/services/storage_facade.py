@@ -6,6 +6,9 @@ from contextlib import contextmanager
 from datetime import timedelta
 from pathlib import Path
 
+from services.order_status_batch import OrderStatusBatch
+from services.table_availability import BookingIntervalIndex, TableAvailabilityCache
+
 
 class StorageFacade:
     def __init__(
@@ -31,6 +34,13 @@ class StorageFacade:
         store_save_bookings,
         store_save_orders,
         store_save_users,
+        compile_order_timeline_fn=None,
+        order_statuses_at_fn=None,
+        notifications_count_ttl_seconds: int = 0,
+        table_ids=(),
+        availability_cache_ttl_seconds: int = 0,
+        background_housekeeping: bool = False,
+        order_status_batch_ttl_seconds: int = 0,
     ):
         self.active_storage = active_storage
         self.bookings_path = bookings_path
@@ -52,6 +62,26 @@ class StorageFacade:
         self.store_save_bookings = store_save_bookings
         self.store_save_orders = store_save_orders
         self.store_save_users = store_save_users
+        self.compile_order_timeline_fn = compile_order_timeline_fn
+        self.order_statuses_at_fn = order_statuses_at_fn
+        self.notifications_count_ttl_seconds = notifications_count_ttl_seconds
+        self.background_housekeeping = background_housekeeping
+        self._notification_counts = {}
+        self._notification_counts_lock = threading.Lock()
+        self.table_availability = TableAvailabilityCache(
+            load_bookings_between=self._load_bookings_between,
+            table_ids=table_ids,
+            booking_duration_minutes=booking_duration_minutes,
+            ttl_seconds=availability_cache_ttl_seconds,
+            parse_datetime_fn=parse_datetime_fn,
+        )
+        self.order_status_batch = OrderStatusBatch(
+            load_user_orders=self.list_user_orders_by_ids,
+            statuses_at=self._order_statuses_at,
+            ttl_seconds=order_status_batch_ttl_seconds,
+        )
+        self._booking_index = None
+        self._booking_index_lock = threading.RLock()
         self._process_locks = {}
         self._process_locks_guard = threading.RLock()
         self._order_prune_lock = threading.RLock()
@@ -70,7 +100,62 @@ class StorageFacade:
     def _phone_digits(self, value):
         return "".join(ch for ch in str(value or "") if ch.isdigit())
 
+    def invalidate_user_notifications(self, user_id=None):
+        self.order_status_batch.bump(user_id)
+        with self._notification_counts_lock:
+            if user_id is None:
+                self._notification_counts.clear()
+                return
+            try:
+                self._notification_counts.pop(int(user_id), None)
+            except (TypeError, ValueError):
+                return
+
+    def count_user_notifications(self, user_id, now=None):
+        normalized_user_id = int(user_id)
+        ttl = max(0, int(self.notifications_count_ttl_seconds or 0))
+        if ttl:
+            with self._notification_counts_lock:
+                cached = self._notification_counts.get(normalized_user_id)
+            if cached is not None and cached[0] > time.monotonic():
+                return cached[1]
+
+        pg_method = self._pg_method("count_user_notifications")
+        if pg_method is not None:
+            count = pg_method(normalized_user_id, now, booking_duration_minutes=self.booking_duration_minutes)
+        else:
+            now_dt = now or self.current_time_fn()
+            orders = [
+                order
+                for order in self.load_orders()
+                if isinstance(order, dict)
+                and order.get("user_id") == normalized_user_id
+                and str(order.get("status") or "").strip().lower() not in {"cancelled", "canceled"}
+            ]
+            active_orders = [
+                status
+                for status in self._order_statuses_at(orders, now_dt)
+                if status is not None
+                and not (status.get("order_type") == "delivery" and status.get("phase") == "delivered")
+            ]
+            count = {"bookings": len(self.list_user_bookings(normalized_user_id)), "orders": len(active_orders)}
+
+        if ttl:
+            with self._notification_counts_lock:
+                self._notification_counts[normalized_user_id] = (time.monotonic() + ttl, count)
+        return count
+
     def load_bookings(self):
+        if self.background_housekeeping:
+            # Expired rows are deleted by the housekeeping job; reads only filter them out.
+            now = self.current_time_fn()
+            duration = timedelta(minutes=self.booking_duration_minutes)
+            active = []
+            for booking in self.store_load_bookings_raw(self.bookings_path):
+                booking_dt = self.parse_datetime_fn(booking.get("date"), booking.get("time"))
+                if booking_dt is not None and booking_dt + duration > now:
+                    active.append(booking)
+            return active
         return self.store_load_bookings(
             self.bookings_path,
             self.parse_datetime_fn,
@@ -82,13 +167,28 @@ class StorageFacade:
 
     def save_bookings(self, bookings):
         self.store_save_bookings(self.bookings_path, bookings)
+        with self._booking_index_lock:
+            self._booking_index = None
+        self.invalidate_user_notifications()
+        self.invalidate_table_availability()
 
     def load_orders(self):
         orders = self.store_load_orders(self.orders_path)
+        if self.background_housekeeping:
+            return orders
         return self.prune_orders(orders)
 
     def save_orders(self, orders):
         self.store_save_orders(self.orders_path, orders)
+        self.invalidate_user_notifications()
+
+    def _order_statuses_at(self, orders, now_dt):
+        if self.order_statuses_at_fn is not None:
+            return self.order_statuses_at_fn(orders, now_dt)
+        return [
+            self.build_order_status_timeline_fn(order, now_dt) if isinstance(order, dict) else None
+            for order in orders
+        ]
 
     def prune_orders(self, orders):
         if self.order_retention_days <= 0:
@@ -100,12 +200,23 @@ class StorageFacade:
                 return orders
             self._last_order_prune_at = now_monotonic
 
+        cleaned, changed = self._apply_order_retention(orders)
+        if changed:
+            try:
+                self.store_save_orders(self.orders_path, cleaned)
+            except Exception:
+                return orders
+            return cleaned
+        return orders
+
+    def _apply_order_retention(self, orders):
         now_dt = self.current_time_fn()
         retention_delta = timedelta(days=self.order_retention_days)
         cleaned = []
         changed = False
+        statuses = self._order_statuses_at(orders, now_dt)
 
-        for order in orders:
+        for order, timeline in zip(orders, statuses):
             if not isinstance(order, dict):
                 changed = True
                 continue
@@ -115,7 +226,6 @@ class StorageFacade:
                 cleaned.append(order)
                 continue
 
-            timeline = self.build_order_status_timeline_fn(order, now_dt)
             is_active = timeline is not None
             is_fresh = (now_dt - created_at) <= retention_delta
 
@@ -124,13 +234,43 @@ class StorageFacade:
                 continue
             changed = True
 
-        if changed:
-            try:
+        return cleaned, changed
+
+    def prune_expired_orders(self) -> int:
+        if self.order_retention_days <= 0:
+            return 0
+        pg_method = self._pg_method("delete_expired_orders")
+        if pg_method is not None:
+            removed = pg_method(retention_days=self.order_retention_days)
+        else:
+            with self.storage_write_lock(self.orders_path):
+                orders = self.store_load_orders(self.orders_path)
+                cleaned, changed = self._apply_order_retention(orders)
+                if not changed:
+                    return 0
                 self.store_save_orders(self.orders_path, cleaned)
-            except Exception:
-                return orders
-            return cleaned
-        return orders
+            removed = len(orders) - len(cleaned)
+        if removed:
+            self.invalidate_user_notifications()
+        return removed
+
+    def expire_bookings(self) -> int:
+        pg_method = self._pg_method("delete_expired_bookings")
+        if pg_method is not None:
+            removed = pg_method(booking_duration_minutes=self.booking_duration_minutes)
+        else:
+            with self.storage_write_lock(self.bookings_path):
+                before = len(self.store_load_bookings_raw(self.bookings_path))
+                # The JSON store drops and rewrites expired entries as part of the load.
+                removed = before - len(
+                    self.store_load_bookings(self.bookings_path, self.parse_datetime_fn, self.booking_duration_minutes)
+                )
+        if removed:
+            with self._booking_index_lock:
+                self._booking_index = None
+            self.invalidate_user_notifications()
+            self.invalidate_table_availability()
+        return removed
 
     def filter_orders_by_retention(self, orders):
         if self.order_retention_days <= 0:
@@ -139,8 +279,9 @@ class StorageFacade:
         now_dt = self.current_time_fn()
         retention_delta = timedelta(days=self.order_retention_days)
         cleaned = []
+        statuses = self._order_statuses_at(orders, now_dt)
 
-        for order in orders:
+        for order, timeline in zip(orders, statuses):
             if not isinstance(order, dict):
                 continue
 
@@ -149,7 +290,6 @@ class StorageFacade:
                 cleaned.append(order)
                 continue
 
-            timeline = self.build_order_status_timeline_fn(order, now_dt)
             is_active = timeline is not None
             is_fresh = (now_dt - created_at) <= retention_delta
 
@@ -218,6 +358,25 @@ class StorageFacade:
         orders.sort(key=lambda order: (order.get("created_at", ""), order.get("id", 0)), reverse=True)
         return orders
 
+    def list_user_orders_by_ids(self, user_id, order_ids):
+        normalized_user_id = int(user_id)
+        normalized_order_ids = {int(order_id) for order_id in order_ids or []}
+        if not normalized_order_ids:
+            return []
+        pg_method = self._pg_method("list_user_orders_by_ids")
+        if pg_method is not None:
+            return pg_method(normalized_user_id, sorted(normalized_order_ids))
+        return [
+            order
+            for order in self.load_orders()
+            if isinstance(order, dict)
+            and order.get("user_id") == normalized_user_id
+            and order.get("id") in normalized_order_ids
+        ]
+
+    def order_status_snapshot(self, user_id, order_ids):
+        return self.order_status_batch.snapshot(user_id, order_ids)
+
     def get_user_order(self, user_id, order_id):
         normalized_user_id = int(user_id)
         normalized_order_id = int(order_id)
@@ -326,33 +485,54 @@ class StorageFacade:
             self.save_users(users)
             return {"user": dict(user), "removed": True}
 
-    def list_reserved_table_ids(self, date_str, time_str):
-        pg_method = self._pg_method("list_reserved_table_ids")
+    def _load_bookings_between(self, start_date, end_date):
+        pg_method = self._pg_method("list_bookings_between_dates")
         if pg_method is not None:
-            return pg_method(date_str, time_str, booking_duration_minutes=self.booking_duration_minutes)
-        selected_dt = self.parse_datetime_fn(date_str, time_str)
-        if selected_dt is None:
-            return []
-        return [
-            booking.get("table_id")
-            for booking in self.load_bookings()
-            if booking.get("table_id") is not None and self._booking_overlaps(booking, selected_dt)
-        ]
+            return pg_method(start_date, end_date)
+        with self._booking_index_lock:
+            return self._json_booking_index().between(
+                self.parse_datetime_fn(start_date.isoformat(), "00:00"),
+                self.parse_datetime_fn((end_date + timedelta(days=1)).isoformat(), "00:00"),
+            )
 
-    def _booking_overlaps(self, booking, selected_dt):
-        booking_dt = self.parse_datetime_fn(booking.get("date"), booking.get("time"))
-        if booking_dt is None or selected_dt is None:
-            return False
-        booking_end = booking_dt + timedelta(minutes=self.booking_duration_minutes)
-        selected_end = selected_dt + timedelta(minutes=self.booking_duration_minutes)
-        return booking_dt < selected_end and selected_dt < booking_end
+    def _bookings_file_signature(self):
+        try:
+            stat = Path(self.bookings_path).stat()
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _json_booking_index(self):
+        with self._booking_index_lock:
+            index = self._booking_index
+            signature = self._bookings_file_signature()
+            if index is not None and signature is not None and index.signature == signature:
+                return index
+            bookings = self.load_bookings()
+            index = BookingIntervalIndex.build(
+                bookings,
+                self.parse_datetime_fn,
+                duration_minutes=self.booking_duration_minutes,
+                signature=self._bookings_file_signature(),
+            )
+            self._booking_index = index
+            return index
+
+    def invalidate_table_availability(self, date_str=None):
+        self.table_availability.invalidate(date_str)
+
+    def get_day_availability(self, date_str):
+        return self.table_availability.day(date_str)
+
+    def list_reserved_table_ids(self, date_str, time_str):
+        return self.table_availability.reserved_table_ids(date_str, time_str)
 
     def create_booking_if_available(self, *, user_id, table_id, date_str, time_str, name, created_at):
         normalized_user_id = int(user_id)
         normalized_table_id = int(table_id)
         pg_method = self._pg_method("create_booking_if_available")
         if pg_method is not None:
-            return pg_method(
+            created = pg_method(
                 {
                     "user_id": normalized_user_id,
                     "table_id": normalized_table_id,
@@ -363,66 +543,89 @@ class StorageFacade:
                 },
                 booking_duration_minutes=self.booking_duration_minutes,
             )
+            self.invalidate_user_notifications(normalized_user_id)
+            if created:
+                self.invalidate_table_availability(date_str)
+            return created
         booking_dt = self.parse_datetime_fn(date_str, time_str)
         if booking_dt is None:
             return False
-        with self.storage_write_lock(self.bookings_path):
-            bookings = self.load_bookings()
-            if any(
-                booking.get("table_id") == normalized_table_id and self._booking_overlaps(booking, booking_dt)
-                for booking in bookings
-            ):
+        with self.storage_write_lock(self.bookings_path), self._booking_index_lock:
+            index = self._json_booking_index()
+            if index.overlaps(normalized_table_id, booking_dt):
                 return False
-            bookings.append(
-                {
-                    "table_id": normalized_table_id,
-                    "date": str(date_str or ""),
-                    "time": str(time_str or ""),
-                    "name": str(name or "").strip(),
-                    "user_id": normalized_user_id,
-                    "created_at": str(created_at or ""),
-                }
-            )
-            self.save_bookings(bookings)
-            return True
+            booking = {
+                "table_id": normalized_table_id,
+                "date": str(date_str or ""),
+                "time": str(time_str or ""),
+                "name": str(name or "").strip(),
+                "user_id": normalized_user_id,
+                "created_at": str(created_at or ""),
+            }
+            bookings = self.load_bookings_raw()
+            bookings.append(booking)
+            self.store_save_bookings(self.bookings_path, bookings)
+            index.add(booking, booking_dt)
+            index.signature = self._bookings_file_signature()
+        self.invalidate_user_notifications(normalized_user_id)
+        self.invalidate_table_availability(date_str)
+        return True
 
     def cancel_user_booking(self, *, user_id, table_id, date_str, time_str):
         normalized_user_id = int(user_id)
         normalized_table_id = int(table_id)
         pg_method = self._pg_method("delete_user_booking")
         if pg_method is not None:
-            return pg_method(normalized_user_id, normalized_table_id, str(date_str or ""), str(time_str or ""))
-        with self.storage_write_lock(self.bookings_path):
+            removed = pg_method(normalized_user_id, normalized_table_id, str(date_str or ""), str(time_str or ""))
+            self.invalidate_user_notifications(normalized_user_id)
+            if removed:
+                self.invalidate_table_availability(date_str)
+            return removed
+        with self.storage_write_lock(self.bookings_path), self._booking_index_lock:
+            index = self._booking_index
+            if index is not None and index.signature != self._bookings_file_signature():
+                index = None
             bookings = self.load_bookings()
             remaining = []
-            removed = False
+            removed_booking = None
             for booking in bookings:
                 if (
-                    not removed
+                    removed_booking is None
                     and booking.get("user_id") == normalized_user_id
                     and booking.get("table_id") == normalized_table_id
                     and booking.get("date") == date_str
                     and booking.get("time") == time_str
                 ):
-                    removed = True
+                    removed_booking = booking
                     continue
                 remaining.append(booking)
-            if removed:
-                self.save_bookings(remaining)
-            return removed
+            if removed_booking is None:
+                return False
+            self.store_save_bookings(self.bookings_path, remaining)
+            if index is not None and index.remove(removed_booking, self.parse_datetime_fn(date_str, time_str)):
+                index.signature = self._bookings_file_signature()
+            else:
+                self._booking_index = None
+        self.invalidate_user_notifications(normalized_user_id)
+        self.invalidate_table_availability(date_str)
+        return True
 
     def cancel_booking_with_orders(self, *, user_id, table_id, date_str, time_str, cancelled_at):
         normalized_user_id = int(user_id)
         normalized_table_id = int(table_id)
         pg_method = self._pg_method("cancel_booking_with_orders")
         if pg_method is not None:
-            return pg_method(
+            cancelled = pg_method(
                 normalized_user_id,
                 normalized_table_id,
                 str(date_str or ""),
                 str(time_str or ""),
                 str(cancelled_at or ""),
             )
+            self.invalidate_user_notifications(normalized_user_id)
+            if cancelled:
+                self.invalidate_table_availability(date_str)
+            return cancelled
         booking_removed = self.cancel_user_booking(
             user_id=normalized_user_id,
             table_id=normalized_table_id,
@@ -455,13 +658,23 @@ class StorageFacade:
                 self.save_orders(orders)
         return True
 
+    def _with_compiled_timeline(self, order: dict):
+        if self.compile_order_timeline_fn is None:
+            return order
+        timeline = self.compile_order_timeline_fn(order)
+        if timeline is not None:
+            order["status_timeline"] = timeline.to_payload()
+        return order
+
     def create_order(self, order: dict):
         pg_method = self._pg_method("create_order")
         if pg_method is not None:
-            return pg_method(dict(order or {}))
+            created_order = pg_method(self._with_compiled_timeline(dict(order or {})))
+            self.invalidate_user_notifications((order or {}).get("user_id"))
+            return created_order
         with self.storage_write_lock(self.orders_path):
             orders = self.load_orders()
-            new_order = dict(order or {})
+            new_order = self._with_compiled_timeline(dict(order or {}))
             new_order["id"] = self.next_order_id(orders)
             orders.append(new_order)
             self.save_orders(orders)
@@ -0,0 +1,236 @@
+import hashlib
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+
+
+SLOT_MINUTES = 15
+
+
+def slot_count_value(slot_minutes: int = SLOT_MINUTES) -> int:
+    return (24 * 60) // max(1, int(slot_minutes))
+
+
+def parse_day_value(date_str):
+    try:
+        return date.fromisoformat(str(date_str or "").strip())
+    except ValueError:
+        return None
+
+
+class DayOccupancy:
+    """Reserved tables for one date: a slot bitmap per table plus the raw booking intervals."""
+
+    __slots__ = ("day", "day_start", "slot_minutes", "duration", "intervals", "bitmaps", "version")
+
+    def __init__(self, *, day: date, day_start: datetime, slot_minutes: int, duration_minutes: int, intervals: dict, version: int = 0):
+        self.day = day
+        self.day_start = day_start
+        self.slot_minutes = slot_minutes
+        self.duration = timedelta(minutes=duration_minutes)
+        self.intervals = intervals
+        self.version = version
+        step = timedelta(minutes=slot_minutes)
+        slots = slot_count_value(slot_minutes)
+        self.bitmaps = {}
+        for table_id, table_intervals in intervals.items():
+            bitmap = 0
+            for start, end in table_intervals:
+                # Slot s is busy when a booking made at its start would overlap [start, end).
+                first = max(0, (start - self.duration - self.day_start) // step + 1)
+                last = min(slots - 1, -((self.day_start - end) // step) - 1)
+                if last >= first:
+                    bitmap |= ((1 << (last - first + 1)) - 1) << first
+            self.bitmaps[table_id] = bitmap
+
+    @property
+    def slots(self) -> int:
+        return slot_count_value(self.slot_minutes)
+
+    def reserved_table_ids(self, selected_dt: datetime) -> list[int]:
+        offset = selected_dt - self.day_start
+        if offset < timedelta(0) or offset >= timedelta(days=1):
+            return []
+        slot, remainder = divmod(offset, timedelta(minutes=self.slot_minutes))
+        if not remainder:
+            mask = 1 << int(slot)
+            return sorted(table_id for table_id, bitmap in self.bitmaps.items() if bitmap & mask)
+        selected_end = selected_dt + self.duration
+        return sorted(
+            table_id
+            for table_id, table_intervals in self.intervals.items()
+            if any(start < selected_end and selected_dt < end for start, end in table_intervals)
+        )
+
+    def bitmap_hex(self, table_id) -> str:
+        return format(self.bitmaps.get(table_id, 0), "x")
+
+    def busy_runs(self, table_id) -> list[list[int]]:
+        runs = []
+        bitmap = self.bitmaps.get(table_id, 0)
+        slot = 0
+        while bitmap:
+            # Skip to the lowest set bit, then measure the run of ones starting there.
+            skip = (bitmap & -bitmap).bit_length() - 1
+            bitmap >>= skip
+            slot += skip
+            length = (~bitmap & (bitmap + 1)).bit_length() - 1
+            runs.append([slot, length])
+            bitmap >>= length
+            slot += length
+        return runs
+
+    @property
+    def etag(self) -> str:
+        signature = ";".join(f"{table_id}:{self.bitmap_hex(table_id)}" for table_id in sorted(self.bitmaps))
+        payload = f"{self.day.isoformat()}|{self.slot_minutes}|{int(self.duration.total_seconds())}|{signature}"
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:20]
+
+
+class BookingIntervalIndex:
+    """Booking starts per table kept sorted, so an overlap check is one bisect instead of a scan of the file."""
+
+    def __init__(self, *, duration_minutes: int, signature=None):
+        self.duration = timedelta(minutes=max(1, int(duration_minutes or 60)))
+        self.signature = signature
+        self._starts = {}
+        self._bookings = {}
+
+    @classmethod
+    def build(cls, bookings, parse_datetime_fn, *, duration_minutes: int, signature=None):
+        index = cls(duration_minutes=duration_minutes, signature=signature)
+        for booking in bookings or []:
+            index.add(booking, parse_datetime_fn(booking.get("date"), booking.get("time")))
+        return index
+
+    def add(self, booking: dict, start: datetime | None):
+        try:
+            table_id = int(booking.get("table_id"))
+        except (TypeError, ValueError):
+            return
+        if start is None:
+            return
+        starts = self._starts.setdefault(table_id, [])
+        position = bisect_right(starts, start)
+        starts.insert(position, start)
+        self._bookings.setdefault(table_id, []).insert(position, booking)
+
+    def remove(self, booking: dict, start: datetime | None) -> bool:
+        try:
+            table_id = int(booking.get("table_id"))
+        except (TypeError, ValueError):
+            return False
+        starts = self._starts.get(table_id) or []
+        bookings = self._bookings.get(table_id) or []
+        position = bisect_left(starts, start) if start is not None else len(starts)
+        while position < len(starts) and starts[position] == start:
+            if bookings[position] is booking or bookings[position] == booking:
+                del starts[position]
+                del bookings[position]
+                return True
+            position += 1
+        return False
+
+    def overlaps(self, table_id: int, start: datetime) -> bool:
+        # Every booking lasts `duration`, so [start, start + d) hits one starting in (start - d, start + d).
+        starts = self._starts.get(int(table_id)) or []
+        position = bisect_right(starts, start - self.duration)
+        return position < len(starts) and starts[position] < start + self.duration
+
+    def between(self, start: datetime, end: datetime) -> list[dict]:
+        found = []
+        for table_id, starts in self._starts.items():
+            bookings = self._bookings[table_id]
+            found.extend(bookings[bisect_left(starts, start):bisect_left(starts, end)])
+        return found
+
+
+class TableAvailabilityCache:
+    """Per-date `DayOccupancy` entries, dropped when a booking for that date changes or the TTL runs out."""
+
+    def __init__(
+        self,
+        *,
+        load_bookings_between,
+        table_ids,
+        booking_duration_minutes: int,
+        ttl_seconds: int = 60,
+        slot_minutes: int = SLOT_MINUTES,
+        parse_datetime_fn,
+        monotonic=time.monotonic,
+    ):
+        self.load_bookings_between = load_bookings_between
+        self.table_ids = tuple(int(table_id) for table_id in table_ids or ())
+        self.booking_duration_minutes = max(1, int(booking_duration_minutes or 60))
+        self.ttl_seconds = max(0, int(ttl_seconds or 0))
+        self.slot_minutes = max(1, int(slot_minutes))
+        self.parse_datetime_fn = parse_datetime_fn
+        self._monotonic = monotonic
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._versions = {}
+
+    def invalidate(self, date_str=None):
+        day = parse_day_value(date_str) if date_str is not None else None
+        with self._lock:
+            if day is None:
+                self._entries.clear()
+                for key in self._versions:
+                    self._versions[key] += 1
+                return
+            # A booking near midnight also blocks slots of the neighbouring dates.
+            for key in (day - timedelta(days=1), day, day + timedelta(days=1)):
+                self._versions[key] = self._versions.get(key, 0) + 1
+                self._entries.pop(key, None)
+
+    def _build(self, day: date, version: int) -> DayOccupancy:
+        duration = timedelta(minutes=self.booking_duration_minutes)
+        # Booking datetimes come back from `parse_datetime_fn` in UTC, so the local midnight goes through it too.
+        day_start = self.parse_datetime_fn(day.isoformat(), "00:00")
+        window_start = day_start - duration
+        window_end = day_start + timedelta(days=1) + duration
+        intervals = {table_id: [] for table_id in self.table_ids}
+        bookings = self.load_bookings_between(day - timedelta(days=1), day + timedelta(days=1))
+        for booking in bookings or []:
+            booking_dt = self.parse_datetime_fn(booking.get("date"), booking.get("time"))
+            try:
+                table_id = int(booking.get("table_id"))
+            except (TypeError, ValueError):
+                continue
+            if booking_dt is None or table_id <= 0 or not (window_start < booking_dt < window_end):
+                continue
+            intervals.setdefault(table_id, []).append((booking_dt, booking_dt + duration))
+        return DayOccupancy(
+            day=day,
+            day_start=day_start,
+            slot_minutes=self.slot_minutes,
+            duration_minutes=self.booking_duration_minutes,
+            intervals=intervals,
+            version=version,
+        )
+
+    def day(self, date_str):
+        day = parse_day_value(date_str)
+        if day is None:
+            return None
+        now = self._monotonic()
+        with self._lock:
+            version = self._versions.setdefault(day, 0)
+            cached = self._entries.get(day)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        occupancy = self._build(day, version)
+        if self.ttl_seconds:
+            with self._lock:
+                # Skip the store if a booking changed while this entry was being built.
+                if self._versions.get(day, 0) == version:
+                    self._entries[day] = (now + self.ttl_seconds, occupancy)
+        return occupancy
+
+    def reserved_table_ids(self, date_str, time_str) -> list[int]:
+        selected_dt = self.parse_datetime_fn(date_str, time_str)
+        if selected_dt is None:
+            return []
+        occupancy = self.day(date_str)
+        return occupancy.reserved_table_ids(selected_dt) if occupancy is not None else []
@@ -43,6 +43,7 @@ CREATE TABLE IF NOT EXISTS orders (
     is_delivery_overdue BOOLEAN NOT NULL DEFAULT FALSE,
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     items_total INTEGER NOT NULL DEFAULT 0,
+    items_count INTEGER NOT NULL DEFAULT 0,
     points_applied INTEGER NOT NULL DEFAULT 0,
     payable_total INTEGER NOT NULL DEFAULT 0,
     bonus_earned INTEGER NOT NULL DEFAULT 0,
@@ -68,7 +69,9 @@ CREATE TABLE IF NOT EXISTS orders (
     delivery_comment TEXT NOT NULL DEFAULT '',
     delivery_address TEXT NOT NULL DEFAULT '',
     delivery_eta_minutes INTEGER NOT NULL DEFAULT 20,
-    cancelled_at TIMESTAMPTZ
+    cancelled_at TIMESTAMPTZ,
+    status_timeline JSONB,
+    status_active_until TIMESTAMPTZ
 );
 
 CREATE TABLE IF NOT EXISTS order_items (
@@ -95,6 +98,22 @@ ALTER TABLE orders ADD COLUMN IF NOT EXISTS booking_status TEXT NOT NULL DEFAULT
 ALTER TABLE orders ADD COLUMN IF NOT EXISTS payment_card_brand TEXT NOT NULL DEFAULT '';
 ALTER TABLE orders ADD COLUMN IF NOT EXISTS payment_card_last4 TEXT NOT NULL DEFAULT '';
 ALTER TABLE orders ADD COLUMN IF NOT EXISTS payment_card_expiry TEXT NOT NULL DEFAULT '';
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS items_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS status_timeline JSONB;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS status_active_until TIMESTAMPTZ;
+
+DO $$
+BEGIN
+    ALTER TABLE orders
+        ADD CONSTRAINT orders_lowercase_enums_check
+        CHECK (
+            status = LOWER(status)
+            AND effective_status = LOWER(effective_status)
+            AND order_type = LOWER(order_type)
+        );
+EXCEPTION
+    WHEN duplicate_object THEN NULL;
+END $$;
 
 CREATE INDEX IF NOT EXISTS idx_user_cards_user_id
     ON user_cards(user_id);
@@ -105,9 +124,15 @@ CREATE INDEX IF NOT EXISTS idx_bookings_user_date_time
 CREATE INDEX IF NOT EXISTS idx_orders_user_created
     ON orders(user_id, created_at);
 
+CREATE INDEX IF NOT EXISTS idx_orders_user_active_until
+    ON orders(user_id, status_active_until);
+
 CREATE INDEX IF NOT EXISTS idx_orders_created_at
     ON orders(created_at DESC);
 
+CREATE INDEX IF NOT EXISTS idx_orders_created_id
+    ON orders(created_at DESC, id DESC);
+
 CREATE INDEX IF NOT EXISTS idx_orders_status_created
     ON orders(status, created_at DESC);
 
@@ -121,9 +146,55 @@ CREATE INDEX IF NOT EXISTS idx_orders_delivery_overdue_created
     ON orders(is_delivery_overdue, created_at DESC)
     WHERE order_type = 'delivery';
 
+CREATE INDEX IF NOT EXISTS idx_orders_active_created
+    ON orders(created_at, id)
+    WHERE effective_status NOT IN ('served', 'cancelled');
+
+CREATE INDEX IF NOT EXISTS idx_orders_delivery_active_created
+    ON orders(created_at, id)
+    WHERE order_type = 'delivery' AND effective_status NOT IN ('served', 'cancelled');
+
+CREATE INDEX IF NOT EXISTS idx_orders_paid_created
+    ON orders(created_at)
+    WHERE status <> 'cancelled';
+
+CREATE INDEX IF NOT EXISTS idx_orders_cancelled_at
+    ON orders(cancelled_at)
+    WHERE cancelled_at IS NOT NULL;
+
 CREATE INDEX IF NOT EXISTS idx_order_items_order_id
     ON order_items(order_id);
 
+CREATE TABLE IF NOT EXISTS daily_sales_rollup (
+    sales_date DATE NOT NULL,
+    order_type TEXT NOT NULL,
+    total_orders INTEGER NOT NULL DEFAULT 0,
+    orders_count INTEGER NOT NULL DEFAULT 0,
+    cancellations INTEGER NOT NULL DEFAULT 0,
+    points_applied BIGINT NOT NULL DEFAULT 0,
+    bonus_earned BIGINT NOT NULL DEFAULT 0,
+    revenue BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (sales_date, order_type)
+);
+
+CREATE TABLE IF NOT EXISTS daily_item_rollup (
+    sales_date DATE NOT NULL,
+    order_type TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    qty_total BIGINT NOT NULL DEFAULT 0,
+    revenue_total BIGINT NOT NULL DEFAULT 0,
+    price_total BIGINT NOT NULL DEFAULT 0,
+    price_rows INTEGER NOT NULL DEFAULT 0,
+    last_sold_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (sales_date, order_type, item_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_item_rollup_item_date
+    ON daily_item_rollup(item_id, sales_date DESC);
+
 CREATE TABLE IF NOT EXISTS menu_items (
     id INTEGER PRIMARY KEY,
     slug TEXT NOT NULL UNIQUE,
@@ -173,6 +244,7 @@ CREATE TABLE IF NOT EXISTS promotions (
     condition TEXT NOT NULL DEFAULT '',
     reward TEXT NOT NULL DEFAULT '',
     dsl_version INTEGER,
+    dsl_ast TEXT NOT NULL DEFAULT '',
     notify TEXT NOT NULL DEFAULT '',
     reward_mode TEXT NOT NULL DEFAULT 'once',
     limit_per_order INTEGER,
@@ -198,6 +270,7 @@ CREATE TABLE IF NOT EXISTS promotion_applications (
 
 ALTER TABLE promotions ADD COLUMN IF NOT EXISTS text TEXT NOT NULL DEFAULT '';
 ALTER TABLE promotions ADD COLUMN IF NOT EXISTS link TEXT NOT NULL DEFAULT '';
+ALTER TABLE promotions ADD COLUMN IF NOT EXISTS dsl_ast TEXT NOT NULL DEFAULT '';
 
 CREATE INDEX IF NOT EXISTS idx_menu_items_active_type
     ON menu_items(active, type, id);
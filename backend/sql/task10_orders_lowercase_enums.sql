@@ -0,0 +1,52 @@
+-- Run after task9_orders_items_count.sql.
+-- Dashboard/analytics queries compare status and order_type directly
+-- (no LOWER/COALESCE wrappers), so stored values must already be lower case.
+
+BEGIN;
+
+UPDATE orders
+SET
+    status = CASE
+        WHEN LOWER(BTRIM(status)) = 'canceled' THEN 'cancelled'
+        ELSE COALESCE(NULLIF(LOWER(BTRIM(status)), ''), 'preparing')
+    END,
+    effective_status = CASE
+        WHEN LOWER(BTRIM(effective_status)) = 'canceled' THEN 'cancelled'
+        ELSE COALESCE(NULLIF(LOWER(BTRIM(effective_status)), ''), 'preparing')
+    END,
+    order_type = COALESCE(NULLIF(LOWER(BTRIM(order_type)), ''), 'dine_in')
+WHERE status <> LOWER(BTRIM(status))
+   OR effective_status <> LOWER(BTRIM(effective_status))
+   OR order_type <> LOWER(BTRIM(order_type))
+   OR status IN ('', 'canceled')
+   OR effective_status IN ('', 'canceled')
+   OR order_type = '';
+
+ALTER TABLE orders
+    DROP CONSTRAINT IF EXISTS orders_lowercase_enums_check;
+
+ALTER TABLE orders
+    ADD CONSTRAINT orders_lowercase_enums_check
+    CHECK (
+        status = LOWER(status)
+        AND effective_status = LOWER(effective_status)
+        AND order_type = LOWER(order_type)
+    );
+
+CREATE INDEX IF NOT EXISTS idx_orders_active_created
+    ON orders(created_at, id)
+    WHERE effective_status NOT IN ('served', 'cancelled');
+
+CREATE INDEX IF NOT EXISTS idx_orders_delivery_active_created
+    ON orders(created_at, id)
+    WHERE order_type = 'delivery' AND effective_status NOT IN ('served', 'cancelled');
+
+CREATE INDEX IF NOT EXISTS idx_orders_paid_created
+    ON orders(created_at)
+    WHERE status <> 'cancelled';
+
+CREATE INDEX IF NOT EXISTS idx_orders_cancelled_at
+    ON orders(cancelled_at)
+    WHERE cancelled_at IS NOT NULL;
+
+COMMIT;
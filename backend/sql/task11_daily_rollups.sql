@@ -0,0 +1,38 @@
+-- Run after task10_orders_lowercase_enums.sql.
+-- Daily pre-aggregates for /admin/analytics. Closed days are read from these
+-- tables; only the current local day is aggregated from raw orders.
+-- Fill or repair them with: python ops/rebuild_daily_rollups.py
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS daily_sales_rollup (
+    sales_date DATE NOT NULL,
+    order_type TEXT NOT NULL,
+    total_orders INTEGER NOT NULL DEFAULT 0,
+    orders_count INTEGER NOT NULL DEFAULT 0,
+    cancellations INTEGER NOT NULL DEFAULT 0,
+    points_applied BIGINT NOT NULL DEFAULT 0,
+    bonus_earned BIGINT NOT NULL DEFAULT 0,
+    revenue BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (sales_date, order_type)
+);
+
+CREATE TABLE IF NOT EXISTS daily_item_rollup (
+    sales_date DATE NOT NULL,
+    order_type TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    qty_total BIGINT NOT NULL DEFAULT 0,
+    revenue_total BIGINT NOT NULL DEFAULT 0,
+    price_total BIGINT NOT NULL DEFAULT 0,
+    price_rows INTEGER NOT NULL DEFAULT 0,
+    last_sold_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (sales_date, order_type, item_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_item_rollup_item_date
+    ON daily_item_rollup(item_id, sales_date DESC);
+
+COMMIT;
@@ -0,0 +1,10 @@
+-- Compiled order status timeline (absolute phase boundaries in epoch seconds).
+-- Written once when the order is created; rows without it (legacy orders or
+-- a changed ORDER_STATUS_STEPS signature) are compiled on the fly on read.
+
+BEGIN;
+
+ALTER TABLE orders
+    ADD COLUMN IF NOT EXISTS status_timeline JSONB;
+
+COMMIT;
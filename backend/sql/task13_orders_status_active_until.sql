@@ -0,0 +1,15 @@
+-- Count-only path for the notifications badge.
+-- status_active_until is the moment an order drops out of the user's active
+-- list (delivery: start of "delivered"; dine-in: end of the status cycle).
+-- It is written on insert; rows left NULL are backfilled by the app when it
+-- prepares the schema on start (the value depends on ORDER_STATUS_STEPS).
+
+BEGIN;
+
+ALTER TABLE orders
+    ADD COLUMN IF NOT EXISTS status_active_until TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS idx_orders_user_active_until
+    ON orders(user_id, status_active_until);
+
+COMMIT;
@@ -0,0 +1,13 @@
+-- Pre-parsed promotion rules.
+-- dsl_ast holds the condition/reward AST as compact JSON:
+-- {"v": <format version>, "src": <hash of dsl_version/condition/reward>, "c": ..., "r": ...}.
+-- Readers use it only when both the format version and the source hash match,
+-- and parse the text otherwise. Existing rows are filled by the app when it
+-- prepares the schema on start (the encoding lives in the promotions package).
+
+BEGIN;
+
+ALTER TABLE promotions
+    ADD COLUMN IF NOT EXISTS dsl_ast TEXT NOT NULL DEFAULT '';
+
+COMMIT;
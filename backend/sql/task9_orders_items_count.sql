@@ -0,0 +1,23 @@
+-- Denormalized items_count for the admin orders/delivery listings.
+-- The listing no longer joins order_items with GROUP BY, so existing rows
+-- need their counter backfilled once.
+
+BEGIN;
+
+ALTER TABLE orders
+    ADD COLUMN IF NOT EXISTS items_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE orders o
+SET items_count = counts.items_count
+FROM (
+    SELECT order_id, COUNT(*) AS items_count
+    FROM order_items
+    GROUP BY order_id
+) counts
+WHERE counts.order_id = o.id
+  AND o.items_count <> counts.items_count;
+
+CREATE INDEX IF NOT EXISTS idx_orders_created_id
+    ON orders(created_at DESC, id DESC);
+
+COMMIT;
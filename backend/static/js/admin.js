@@ -217,7 +217,7 @@ if (typeof window.fetch === "function") {
         (resource instanceof Request ? resource.method : "GET")
       ).toUpperCase();
     const label =
-      url.includes("/promo/validate")
+      url.includes("/promo/validate") || url.includes("/promo/simulate")
         ? "акцию"
         : method === "GET"
           ? "данные"
@@ -908,6 +908,7 @@ if (promoForm) {
   const promoPhoto = field("photo");
   const promoReason = field("reason");
   const promoValidateButton = document.getElementById("adminPromoValidateButton");
+  const promoSimulateButton = document.getElementById("adminPromoSimulateButton");
   const promoValidateResult = document.getElementById("adminPromoValidateResult");
   const promoHelper = document.getElementById("adminPromoDslHelper");
   const promoHelperStatus = document.getElementById("adminPromoHelperStatus");
@@ -1179,27 +1180,29 @@ if (promoForm) {
     });
   });
 
+  const buildPromoDslPayload = () => ({
+    class_name: promoType?.value || "akciya",
+    name: promoName?.value || "",
+    lore: promoLore?.value || "",
+    dsl_version: promoDslVersion?.value || "",
+    condition: promoCondition?.value || "",
+    reward: promoReward?.value || "",
+    notify: promoNotify?.value || "",
+    reward_mode: promoRewardMode?.value || "",
+    limit_per_order: promoLimitPerOrder?.value || "",
+    limit_per_user_per_day: promoLimitPerUserDay?.value || "",
+    priority: promoPriority?.value || "100",
+    start_at: promoStart?.value || "",
+    end_at: promoEnd?.value || "",
+    active: promoActive?.checked ? "1" : "0",
+  });
+
   promoValidateButton?.addEventListener("click", async () => {
     if ((promoType?.value || "akciya") !== "akciya") {
       setPromoValidationState("Проверка DSL нужна только для акций.");
       return;
     }
-    const payload = {
-      class_name: promoType?.value || "akciya",
-      name: promoName?.value || "",
-      lore: promoLore?.value || "",
-      dsl_version: promoDslVersion?.value || "",
-      condition: promoCondition?.value || "",
-      reward: promoReward?.value || "",
-      notify: promoNotify?.value || "",
-      reward_mode: promoRewardMode?.value || "",
-      limit_per_order: promoLimitPerOrder?.value || "",
-      limit_per_user_per_day: promoLimitPerUserDay?.value || "",
-      priority: promoPriority?.value || "100",
-      start_at: promoStart?.value || "",
-      end_at: promoEnd?.value || "",
-      active: promoActive?.checked ? "1" : "0",
-    };
+    const payload = buildPromoDslPayload();
     setPromoValidationState("Проверяю DSL...");
     try {
       const response = await fetch("/admin/api/promo/validate", {
@@ -1228,6 +1231,38 @@ if (promoForm) {
     }
   });
 
+  promoSimulateButton?.addEventListener("click", async () => {
+    if ((promoType?.value || "akciya") !== "akciya") {
+      setPromoValidationState("Симуляция доступна только для акций.");
+      return;
+    }
+    setPromoValidationState("Считаю акцию на заказах за 30 дней...");
+    try {
+      const response = await fetch("/admin/api/promo/simulate", {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          "X-CSRF-Token": document.querySelector('meta[name="csrf-token"]')?.content || "",
+        },
+        body: JSON.stringify({ ...buildPromoDslPayload(), days: 30 }),
+      });
+      const data = await response.json();
+      if (!response.ok || !data.ok) {
+        throw new Error(data.error || "Симуляция не удалась.");
+      }
+      const result = data.simulation || {};
+      const hitRate = Math.round(Number(result.hit_rate || 0) * 1000) / 10;
+      setPromoValidationState(
+        `За ${data.days} дн.: сработала в ${result.orders_hit} из ${result.orders_scanned} заказов (${hitRate}%). ` +
+          `Средняя скидка: ${result.avg_discount} ₽, баллов: ${result.points_total}, подарков: ${result.gift_units}. ` +
+          `Влияние на выручку: ${result.revenue_impact_percent}%.`,
+        "success"
+      );
+    } catch (error) {
+      setPromoValidationState(error.message || "Ошибка симуляции акции.", "danger");
+    }
+  });
+
   [promoDslVersion, promoConditionSource, promoConditionItemId, promoConditionType, promoConditionGroupIds, promoConditionMetric, promoConditionOperator, promoConditionValue].forEach((input) => {
     input?.addEventListener("input", syncConditionBuilder);
     input?.addEventListener("change", syncConditionBuilder);
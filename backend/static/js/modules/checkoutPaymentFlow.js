@@ -32,6 +32,43 @@ const setupCheckoutPage = ({
   const goToPaymentInitiallyDisabled = Boolean(goToPayment?.disabled);
   let promoPreviewAbortController = null;
   let promoPreviewSequence = 0;
+  // Server-side pricing context: after the first full preview only the changed cart lines are sent.
+  let pricingSession = null;
+
+  const buildCartDelta = (previousQty, cart) => {
+    const nextQty = new Map(cart.map((item) => [Number(item.id), Number(item.qty)]));
+    const delta = [];
+    nextQty.forEach((qty, id) => {
+      if (previousQty.get(id) !== qty) delta.push({ id, qty });
+    });
+    previousQty.forEach((_qty, id) => {
+      if (!nextQty.has(id)) delta.push({ id, qty: 0 });
+    });
+    return { delta, nextQty };
+  };
+
+  const requestPromoPreview = async (cart, signal) => {
+    const session = pricingSession;
+    const { delta, nextQty } = buildCartDelta(session?.cartQty || new Map(), cart);
+    const payload = session
+      ? { pricing_session: session.id, revision: session.revision, delta }
+      : { items: cart.map((item) => ({ id: Number(item.id), qty: Number(item.qty) })) };
+    const response = await fetch("/api/checkout/promo-preview", {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        ...(getCsrfToken() ? { "X-CSRF-Token": getCsrfToken() } : {}),
+      },
+      body: JSON.stringify({ ...payload, use_points: Boolean(usePoints?.checked) }),
+      signal,
+    }).catch(() => null);
+    if (session && (!response || !response.ok)) {
+      // Expired or out of sync (another tab, a dropped response): start over with the full cart.
+      pricingSession = null;
+      if (response?.status === 409) return requestPromoPreview(cart, signal);
+    }
+    return { response, nextQty };
+  };
 
   const renderPromoHighlight = ({
     promotionsApplied = [],
@@ -102,18 +139,7 @@ const setupCheckoutPage = ({
     promoPreviewSequence += 1;
     const requestSequence = promoPreviewSequence;
 
-    const response = await fetch("/api/checkout/promo-preview", {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-        ...(getCsrfToken() ? { "X-CSRF-Token": getCsrfToken() } : {}),
-      },
-      body: JSON.stringify({
-        items: cart.map((item) => ({ id: Number(item.id), qty: Number(item.qty) })),
-        use_points: Boolean(usePoints?.checked),
-      }),
-      signal: promoPreviewAbortController.signal,
-    }).catch(() => null);
+    const { response, nextQty } = await requestPromoPreview(cart, promoPreviewAbortController.signal);
 
     if (!response || !response.ok || requestSequence !== promoPreviewSequence) {
       if (checkoutItemsTotal) checkoutItemsTotal.textContent = String(fallbackTotal);
@@ -134,6 +160,10 @@ const setupCheckoutPage = ({
       return;
     }
 
+    pricingSession = result.pricing_session
+      ? { id: result.pricing_session, revision: Number(result.revision) || 0, cartQty: nextQty }
+      : null;
+
     const totals = result.totals || {};
     if (checkoutItemsTotal) checkoutItemsTotal.textContent = String(Number(totals.items_total) || fallbackTotal);
     if (checkoutTotal) checkoutTotal.textContent = String(Number(totals.items_total) || fallbackTotal);
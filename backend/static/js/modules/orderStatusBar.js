@@ -194,6 +194,7 @@ const PHRASE_HOLD_MIN_MS = 9000;
 const PHRASE_HOLD_MAX_MS = 14000;
 const ORDER_STATUS_POLL_INTERVAL_MS = 5000;
 const ORDER_STATUS_POLL_BACKOFF_MAX_MS = 30000;
+const ORDER_STATUS_STREAM_URL = "/api/order-statuses/stream";
 
 const randomInt = (min, max) =>
   Math.floor(Math.random() * (max - min + 1)) + min;
@@ -285,6 +286,8 @@ const setupOrderStatusBar = () => {
   let pollId = null;
   let pollInFlight = false;
   let pollDelayMs = ORDER_STATUS_POLL_INTERVAL_MS;
+  let eventSource = null;
+  let streamUnavailable = false;
   let statusesSnapshotAtMs = Date.now();
   let lastPrimarySignature = "";
   let statusAnimationToken = 0;
@@ -580,6 +583,7 @@ const setupOrderStatusBar = () => {
       window.clearTimeout(pollId);
       pollId = null;
     }
+    closeStream();
     clearStatusTypingTimeout();
     bar.classList.add("is-exiting");
     window.setTimeout(() => {
@@ -617,9 +621,52 @@ const setupOrderStatusBar = () => {
     }
   };
 
+  const applyStatusesPayload = (payload) => {
+    if (!payload || !Array.isArray(payload.order_statuses)) {
+      return false;
+    }
+    initialOrders = payload.order_statuses;
+    statusesSnapshotAtMs = Date.now();
+    render();
+    return true;
+  };
+
+  const closeStream = () => {
+    if (eventSource) {
+      eventSource.close();
+      eventSource = null;
+    }
+  };
+
+  const openStream = () => {
+    if (eventSource || streamUnavailable || document.hidden || typeof window.EventSource !== "function") {
+      return Boolean(eventSource);
+    }
+    eventSource = new window.EventSource(ORDER_STATUS_STREAM_URL);
+    eventSource.addEventListener("order-statuses", (event) => {
+      let payload = null;
+      try {
+        payload = JSON.parse(event.data);
+      } catch {
+        payload = null;
+      }
+      applyStatusesPayload(payload);
+    });
+    eventSource.addEventListener("error", () => {
+      // The browser reconnects on its own (with Last-Event-ID) unless the server refused the stream.
+      if (eventSource && eventSource.readyState === window.EventSource.CLOSED) {
+        closeStream();
+        streamUnavailable = true;
+        scheduleNextPoll(ORDER_STATUS_POLL_INTERVAL_MS);
+      }
+    });
+    return true;
+  };
+
   const scheduleNextPoll = (delayMs = pollDelayMs) => {
     stopPolling();
     if (document.hidden) return;
+    if (openStream()) return;
     pollId = window.setTimeout(() => {
       void fetchOrderStatuses();
     }, delayMs);
@@ -647,14 +694,10 @@ const setupOrderStatusBar = () => {
         return;
       }
       const payload = await response.json().catch(() => null);
-      if (!payload || !Array.isArray(payload.order_statuses)) {
+      if (!applyStatusesPayload(payload)) {
         nextDelayMs = Math.min(pollDelayMs * 2, ORDER_STATUS_POLL_BACKOFF_MAX_MS);
         return;
       }
-      initialOrders = payload.order_statuses;
-      statusesSnapshotAtMs = Date.now();
-      pollDelayMs = ORDER_STATUS_POLL_INTERVAL_MS;
-      render();
     } catch {
       nextDelayMs = Math.min(pollDelayMs * 2, ORDER_STATUS_POLL_BACKOFF_MAX_MS);
       // Ignore transient polling errors; next tick will retry.
@@ -767,11 +810,13 @@ const setupOrderStatusBar = () => {
     if (document.hidden) {
       stopRenderTimer();
       stopPolling();
+      closeStream();
       return;
     }
     render();
     ensureRenderTimer();
     pollDelayMs = ORDER_STATUS_POLL_INTERVAL_MS;
+    if (openStream()) return;
     void fetchOrderStatuses();
   });
 };
@@ -304,6 +304,58 @@ const setupTableTooltip = () => {
     syncBookingSummary();
   };
 
+  const DAY_AVAILABILITY_MAX_AGE_MS = 30000;
+  const dayAvailability = new Map();
+
+  const applyReservedTables = (reservedIds) => {
+    document.querySelectorAll(".table").forEach((table) => {
+      const id = Number(table.dataset.id);
+      if (reservedIds.includes(id)) {
+        table.classList.remove("table--free");
+        table.classList.add("table--reserved");
+      } else {
+        table.classList.remove("table--reserved");
+        table.classList.add("table--free");
+      }
+    });
+  };
+
+  const loadDayAvailability = async (dateValue) => {
+    const cached = dayAvailability.get(dateValue);
+    if (cached && Date.now() - cached.checkedAt < DAY_AVAILABILITY_MAX_AGE_MS) return cached.payload;
+    const params = new URLSearchParams({ date: dateValue, encoding: "rle" });
+    const response = await fetch(`/availability/day?${params.toString()}`, {
+      method: "GET",
+      cache: "no-store",
+      headers: {
+        Accept: "application/json",
+        ...(cached?.etag ? { "If-None-Match": cached.etag } : {}),
+      },
+    });
+    if (response.status === 304 && cached) {
+      cached.checkedAt = Date.now();
+      return cached.payload;
+    }
+    const result = await response.json().catch(() => ({}));
+    if (!response.ok || !result.ok) return null;
+    dayAvailability.set(dateValue, {
+      etag: response.headers.get("ETag") || "",
+      checkedAt: Date.now(),
+      payload: result,
+    });
+    return result;
+  };
+
+  const reservedFromDay = (payload, timeValue) => {
+    const minutes = timeToMinutes(timeValue);
+    const slotMinutes = Number(payload?.slot_minutes) || 0;
+    if (minutes === null || !slotMinutes || minutes % slotMinutes !== 0) return null;
+    const slot = minutes / slotMinutes;
+    return Object.entries(payload.reserved || {})
+      .filter(([, runs]) => runs.some(([start, length]) => slot >= start && slot < start + length))
+      .map(([tableId]) => Number(tableId));
+  };
+
   const refreshAvailability = async () => {
     if (!bookingDate?.value || !bookingTime?.value) return;
     if (isSelectedDateTimeInPast()) {
@@ -311,7 +363,18 @@ const setupTableTooltip = () => {
       updateDateValidation();
       return;
     }
-    const params = new URLSearchParams({ date: bookingDate.value, time: bookingTime.value });
+    const dateValue = bookingDate.value;
+    const timeValue = bookingTime.value;
+    const dayPayload = await loadDayAvailability(dateValue).catch(() => null);
+    if (bookingDate.value !== dateValue || bookingTime.value !== timeValue) return;
+    const reservedIds = reservedFromDay(dayPayload, timeValue);
+    if (reservedIds) {
+      applyReservedTables(reservedIds);
+      return;
+    }
+
+    // Times between slots (typed by hand) still go through the single-time endpoint.
+    const params = new URLSearchParams({ date: dateValue, time: timeValue });
     const response = await fetch(`/availability?${params.toString()}`, {
       method: "GET",
       cache: "no-store",
@@ -321,17 +384,7 @@ const setupTableTooltip = () => {
     });
     const result = await response.json().catch(() => ({}));
     if (!response.ok || !result.ok) return;
-
-    document.querySelectorAll(".table").forEach((table) => {
-      const id = Number(table.dataset.id);
-      if (result.reserved.includes(id)) {
-        table.classList.remove("table--free");
-        table.classList.add("table--reserved");
-      } else {
-        table.classList.remove("table--reserved");
-        table.classList.add("table--free");
-      }
-    });
+    applyReservedTables(result.reserved);
   };
 
   const timeToMinutes = (value) => {
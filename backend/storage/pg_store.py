@@ -8,15 +8,25 @@ from pathlib import Path
 
 import psycopg
 from psycopg import sql
-from config import MENU_ITEMS_PATH, MENU_PHOTO_NAMES, PROMO_ITEMS_PATH
-from services.business_logic import current_time_value
+from config import MENU_ITEMS_PATH, MENU_PHOTO_NAMES, ORDER_STATUS_STEPS, PROMO_ITEMS_PATH
+from services.business_logic import (
+    APP_TIMEZONE,
+    current_local_datetime_value,
+    current_time_value,
+    order_timeline_value,
+    parse_iso_datetime_value,
+)
 from services.path_naming import ascii_slug, canonical_menu_photo_path, canonical_promo_photo_path, image_extension
 from services.order_status import apply_persisted_status_fields_value
+from services.promotions.serialization import AST_FORMAT_VERSION, serialize_promo_source
+from storage import query_metrics
 
 
 _SCHEMA_READY = False
 _SCHEMA_LOCK = threading.Lock()
 _LOCAL = threading.local()
+_LEADER_LOCK_CONNS = {}
+_LEADER_LOCK_GUARD = threading.Lock()
 _IS_HF_SPACE = bool(os.getenv("SPACE_ID") or os.getenv("HF_SPACE_ID"))
 _ROW_COUNT_TABLES = frozenset({"users", "bookings", "orders", "menu_items", "promotions"})
 _INTEGER_ID_TABLES = frozenset({"users", "orders"})
@@ -63,6 +73,37 @@ def _database_url():
     return url
 
 
+def _statement_text(cur, query) -> str:
+    if isinstance(query, sql.Composable):
+        try:
+            return query.as_string(cur)
+        except Exception:
+            return repr(query)
+    return query.decode("utf-8", "replace") if isinstance(query, bytes) else str(query)
+
+
+class _MetricsCursor(psycopg.Cursor):
+    """Notes each statement and its parameter shape on the running operation for the slow-query log."""
+
+    def execute(self, query, params=None, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return super().execute(query, params, **kwargs)
+        finally:
+            query_metrics.note_query(_statement_text(self, query), params, (time.perf_counter() - started_at) * 1000.0)
+
+    def executemany(self, query, params_seq, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return super().executemany(query, params_seq, **kwargs)
+        finally:
+            query_metrics.note_query(
+                _statement_text(self, query),
+                params_seq if isinstance(params_seq, (list, tuple)) else None,
+                (time.perf_counter() - started_at) * 1000.0,
+            )
+
+
 def _connect():
     url = _database_url()
     try:
@@ -70,6 +111,7 @@ def _connect():
             url,
             autocommit=True,
             connect_timeout=PG_CONNECT_TIMEOUT_SECONDS,
+            cursor_factory=_MetricsCursor,
         )
     except psycopg.OperationalError as exc:
         message = str(exc)
@@ -80,6 +122,7 @@ def _connect():
                 url,
                 autocommit=True,
                 connect_timeout=PG_CONNECT_TIMEOUT_SECONDS,
+                cursor_factory=_MetricsCursor,
                 sslcertmode="disable",
             )
         except psycopg.ProgrammingError:
@@ -90,6 +133,7 @@ def _connect():
                     url,
                     autocommit=True,
                     connect_timeout=PG_CONNECT_TIMEOUT_SECONDS,
+                    cursor_factory=_MetricsCursor,
                 )
             finally:
                 if old_home is None:
@@ -105,7 +149,9 @@ def _get_conn():
             return conn
     except Exception:
         pass
+    started_at = time.perf_counter()
     conn = _connect()
+    query_metrics.note_connection_acquire((time.perf_counter() - started_at) * 1000.0)
     _LOCAL.conn = conn
     return conn
 
@@ -175,6 +221,7 @@ def _execute_schema(cur):
             is_delivery_overdue BOOLEAN NOT NULL DEFAULT FALSE,
             created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
             items_total INTEGER NOT NULL DEFAULT 0,
+            items_count INTEGER NOT NULL DEFAULT 0,
             points_applied INTEGER NOT NULL DEFAULT 0,
             payable_total INTEGER NOT NULL DEFAULT 0,
             bonus_earned INTEGER NOT NULL DEFAULT 0,
@@ -200,7 +247,9 @@ def _execute_schema(cur):
             delivery_comment TEXT NOT NULL DEFAULT '',
             delivery_address TEXT NOT NULL DEFAULT '',
             delivery_eta_minutes INTEGER NOT NULL DEFAULT 20,
-            cancelled_at TIMESTAMPTZ
+            cancelled_at TIMESTAMPTZ,
+            status_timeline JSONB,
+            status_active_until TIMESTAMPTZ
         );
         """
     )
@@ -298,6 +347,7 @@ def _execute_schema(cur):
             condition TEXT NOT NULL DEFAULT '',
             reward TEXT NOT NULL DEFAULT '',
             dsl_version INTEGER,
+            dsl_ast TEXT NOT NULL DEFAULT '',
             notify TEXT NOT NULL DEFAULT '',
             reward_mode TEXT NOT NULL DEFAULT 'once',
             limit_per_order INTEGER,
@@ -334,6 +384,39 @@ def _execute_schema(cur):
         );
         """
     )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS daily_sales_rollup (
+            sales_date DATE NOT NULL,
+            order_type TEXT NOT NULL,
+            total_orders INTEGER NOT NULL DEFAULT 0,
+            orders_count INTEGER NOT NULL DEFAULT 0,
+            cancellations INTEGER NOT NULL DEFAULT 0,
+            points_applied BIGINT NOT NULL DEFAULT 0,
+            bonus_earned BIGINT NOT NULL DEFAULT 0,
+            revenue BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (sales_date, order_type)
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS daily_item_rollup (
+            sales_date DATE NOT NULL,
+            order_type TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            name TEXT NOT NULL DEFAULT '',
+            qty_total BIGINT NOT NULL DEFAULT 0,
+            revenue_total BIGINT NOT NULL DEFAULT 0,
+            price_total BIGINT NOT NULL DEFAULT 0,
+            price_rows INTEGER NOT NULL DEFAULT 0,
+            last_sold_at TIMESTAMPTZ,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (sales_date, order_type, item_id)
+        );
+        """
+    )
     cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS serving_mode TEXT NOT NULL DEFAULT ''")
     cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS serving_label TEXT NOT NULL DEFAULT ''")
     cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS serving_time TEXT NOT NULL DEFAULT ''")
@@ -348,10 +431,30 @@ def _execute_schema(cur):
     cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS payment_card_brand TEXT NOT NULL DEFAULT ''")
     cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS payment_card_last4 TEXT NOT NULL DEFAULT ''")
     cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS payment_card_expiry TEXT NOT NULL DEFAULT ''")
+    cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS status_timeline JSONB")
+    cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS status_active_until TIMESTAMPTZ")
+    items_count_missing = not _column_exists(cur, "orders", "items_count")
+    cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS items_count INTEGER NOT NULL DEFAULT 0")
+    if items_count_missing:
+        _backfill_orders_items_count(cur)
     cur.execute("ALTER TABLE orders ALTER COLUMN cancelled_at DROP NOT NULL")
+    if not _constraint_exists(cur, "orders", "orders_lowercase_enums_check"):
+        _normalize_orders_enum_case(cur)
+        cur.execute(
+            """
+            ALTER TABLE orders
+            ADD CONSTRAINT orders_lowercase_enums_check
+            CHECK (
+                status = LOWER(status)
+                AND effective_status = LOWER(effective_status)
+                AND order_type = LOWER(order_type)
+            )
+            """
+        )
     cur.execute("ALTER TABLE promotions ADD COLUMN IF NOT EXISTS text TEXT NOT NULL DEFAULT ''")
     cur.execute("ALTER TABLE promotions ADD COLUMN IF NOT EXISTS link TEXT NOT NULL DEFAULT ''")
     cur.execute("ALTER TABLE promotions ADD COLUMN IF NOT EXISTS dsl_version INTEGER")
+    cur.execute("ALTER TABLE promotions ADD COLUMN IF NOT EXISTS dsl_ast TEXT NOT NULL DEFAULT ''")
     cur.execute(
         "CREATE INDEX IF NOT EXISTS idx_user_cards_user_id ON user_cards(user_id);"
     )
@@ -361,9 +464,15 @@ def _execute_schema(cur):
     cur.execute(
         "CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_id, created_at);"
     )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_orders_user_active_until ON orders(user_id, status_active_until);"
+    )
     cur.execute(
         "CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at DESC);"
     )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_orders_created_id ON orders(created_at DESC, id DESC);"
+    )
     cur.execute(
         "CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at DESC);"
     )
@@ -376,6 +485,18 @@ def _execute_schema(cur):
     cur.execute(
         "CREATE INDEX IF NOT EXISTS idx_orders_delivery_overdue_created ON orders(is_delivery_overdue, created_at DESC) WHERE order_type = 'delivery';"
     )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_orders_active_created ON orders(created_at, id) WHERE effective_status NOT IN ('served', 'cancelled');"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_orders_delivery_active_created ON orders(created_at, id) WHERE order_type = 'delivery' AND effective_status NOT IN ('served', 'cancelled');"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_orders_paid_created ON orders(created_at) WHERE status <> 'cancelled';"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_orders_cancelled_at ON orders(cancelled_at) WHERE cancelled_at IS NOT NULL;"
+    )
     cur.execute(
         "CREATE INDEX IF NOT EXISTS idx_orders_booking_slot ON orders(booking_table_id, booking_date, booking_time);"
     )
@@ -385,6 +506,9 @@ def _execute_schema(cur):
     cur.execute(
         "CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id);"
     )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_daily_item_rollup_item_date ON daily_item_rollup(item_id, sales_date DESC);"
+    )
     cur.execute(
         "CREATE INDEX IF NOT EXISTS idx_menu_items_active_type ON menu_items(active, type, id);"
     )
@@ -565,6 +689,23 @@ def _column_exists(cur, table_name, column_name):
     return bool(row[0]) if row else False
 
 
+def _constraint_exists(cur, table_name, constraint_name):
+    cur.execute(
+        """
+        SELECT EXISTS (
+            SELECT 1
+            FROM information_schema.table_constraints
+            WHERE table_schema = 'public'
+              AND table_name = %s
+              AND constraint_name = %s
+        )
+        """,
+        (table_name, constraint_name),
+    )
+    row = cur.fetchone()
+    return bool(row[0]) if row else False
+
+
 def _column_type_info(cur, table_name, column_name):
     cur.execute(
         """
@@ -770,6 +911,17 @@ def _coerce_dict(value):
     return value if isinstance(value, dict) else {}
 
 
+def _normalize_order_status(value, default="preparing"):
+    normalized = _coerce_text(value).strip().lower()
+    if normalized == "canceled":
+        return "cancelled"
+    return normalized or default
+
+
+def _normalize_order_type(value):
+    return _coerce_text(value).strip().lower() or "dine_in"
+
+
 def _coerce_list(value):
     return value if isinstance(value, list) else []
 
@@ -956,10 +1108,26 @@ def _replace_bookings_in_tx(cur, bookings):
         )
 
 
-def _replace_orders_in_tx(cur, orders):
+def _status_timeline_json(value):
+    return json.dumps(value, ensure_ascii=False) if isinstance(value, dict) else None
+
+
+def _order_status_active_until(order: dict):
+    timeline = order_timeline_value(order, ORDER_STATUS_STEPS, parse_iso_datetime_value)
+    if timeline is None:
+        return None
+    return datetime.fromtimestamp(timeline.active_until(), tz=timezone.utc)
+
+
+def _delete_all_orders_in_tx(cur):
+    _stage_daily_rollup_delta(cur, "TRUE", (), sign=-1)
     cur.execute("DELETE FROM order_items")
     cur.execute("DELETE FROM orders")
 
+
+def _replace_orders_in_tx(cur, orders):
+    _delete_all_orders_in_tx(cur)
+
     order_rows = []
     item_rows = []
     now = current_time_value()
@@ -971,18 +1139,20 @@ def _replace_orders_in_tx(cur, orders):
         user_id = _coerce_int(normalized_order.get("user_id"), 0)
         if order_id <= 0 or user_id <= 0:
             continue
+        order_items = [item for item in _coerce_list(normalized_order.get("items")) if isinstance(item, dict)]
 
         order_rows.append(
             (
                 order_id,
                 user_id,
-                _coerce_text(normalized_order.get("order_type"), "dine_in") or "dine_in",
-                _coerce_text(normalized_order.get("status"), "preparing") or "preparing",
-                _coerce_text(normalized_order.get("effective_status"), "preparing") or "preparing",
+                _normalize_order_type(normalized_order.get("order_type")),
+                _normalize_order_status(normalized_order.get("status")),
+                _normalize_order_status(normalized_order.get("effective_status")),
                 _parse_optional_datetime_utc(normalized_order.get("effective_status_updated_at")),
                 bool(normalized_order.get("is_delivery_overdue")),
                 _parse_optional_datetime_utc(normalized_order.get("created_at")) or datetime.now(timezone.utc),
                 _coerce_int(normalized_order.get("items_total"), 0),
+                len(order_items),
                 _coerce_int(normalized_order.get("points_applied"), 0),
                 _coerce_int(normalized_order.get("payable_total"), 0),
                 _coerce_int(normalized_order.get("bonus_earned"), 0),
@@ -1012,13 +1182,12 @@ def _replace_orders_in_tx(cur, orders):
                 _coerce_text(normalized_order.get("delivery_address")),
                 _coerce_int(normalized_order.get("delivery_eta_minutes"), 20),
                 _parse_optional_datetime_utc(normalized_order.get("cancelled_at")),
+                _status_timeline_json(normalized_order.get("status_timeline")),
+                _order_status_active_until(normalized_order),
             )
         )
 
-        position = 0
-        for item in _coerce_list(normalized_order.get("items")):
-            if not isinstance(item, dict):
-                continue
+        for position, item in enumerate(order_items):
             item_rows.append(
                 (
                     order_id,
@@ -1030,7 +1199,6 @@ def _replace_orders_in_tx(cur, orders):
                     _coerce_text(item.get("photo")) or None,
                 )
             )
-            position += 1
 
     if order_rows:
         cur.executemany(
@@ -1045,6 +1213,7 @@ def _replace_orders_in_tx(cur, orders):
                 is_delivery_overdue,
                 created_at,
                 items_total,
+                items_count,
                 points_applied,
                 payable_total,
                 bonus_earned,
@@ -1070,12 +1239,14 @@ def _replace_orders_in_tx(cur, orders):
                 delivery_comment,
                 delivery_address,
                 delivery_eta_minutes,
-                cancelled_at
+                cancelled_at,
+                status_timeline,
+                status_active_until
             )
             VALUES (
                 %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
                 %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                %s, %s, %s
+                %s, %s, %s, %s, %s::jsonb, %s
             )
             """,
             order_rows,
@@ -1091,6 +1262,268 @@ def _replace_orders_in_tx(cur, orders):
             """,
             item_rows,
         )
+    # The rollups take the net difference between the old and the new rows, so days of orders that are no longer
+    # in the table (retention pruning) keep their totals and unchanged days are not written.
+    _stage_daily_rollup_delta(cur, "TRUE", (), sign=1)
+    _flush_daily_rollup_delta(cur)
+
+
+_ROLLUP_PAYABLE_SQL = "GREATEST(COALESCE(o.payable_total, COALESCE(o.items_total, 0) - COALESCE(o.points_applied, 0)), 0)"
+_ROLLUP_BONUS_SQL = f"""
+    CASE
+        WHEN o.bonus_earned IS NULL
+            OR (
+                COALESCE(o.bonus_earned, 0) <= 0
+                AND COALESCE(o.points_applied, 0) <= 0
+                AND {_ROLLUP_PAYABLE_SQL} > 0
+            )
+        THEN FLOOR({_ROLLUP_PAYABLE_SQL} * 0.05)
+        ELSE GREATEST(COALESCE(o.bonus_earned, 0), 0)
+    END
+"""
+
+
+def _rollup_timezone_name():
+    return getattr(APP_TIMEZONE, "key", "UTC")
+
+
+def _local_day_start(value: date):
+    return datetime(value.year, value.month, value.day, tzinfo=APP_TIMEZONE)
+
+
+_ROLLUP_SALES_COLUMNS = "sales_date, order_type, total_orders, orders_count, cancellations, points_applied, bonus_earned, revenue"
+_ROLLUP_ITEM_COLUMNS = "sales_date, order_type, item_id, name, qty_total, revenue_total, price_total, price_rows, last_sold_at"
+
+
+def _rollup_sales_select(where_sql, sign=1):
+    return f"""
+        SELECT
+            (o.created_at AT TIME ZONE %s)::date,
+            o.order_type,
+            {sign} * COUNT(*),
+            {sign} * COUNT(*) FILTER (WHERE o.status <> 'cancelled'),
+            {sign} * COUNT(*) FILTER (WHERE o.status = 'cancelled'),
+            {sign} * COALESCE(SUM(GREATEST(COALESCE(o.points_applied, 0), 0)), 0),
+            {sign} * COALESCE(SUM({_ROLLUP_BONUS_SQL}), 0),
+            {sign} * COALESCE(SUM({_ROLLUP_PAYABLE_SQL}) FILTER (WHERE o.status <> 'cancelled'), 0)
+        FROM orders o
+        WHERE {where_sql}
+        GROUP BY 1, 2
+    """
+
+
+def _rollup_items_select(where_sql, sign=1):
+    return f"""
+        SELECT
+            (o.created_at AT TIME ZONE %s)::date,
+            o.order_type,
+            oi.item_id,
+            MAX(oi.name),
+            {sign} * COALESCE(SUM(oi.qty), 0),
+            {sign} * COALESCE(SUM(oi.qty * oi.price), 0),
+            {sign} * COALESCE(SUM(oi.price), 0),
+            {sign} * COUNT(*),
+            MAX(o.created_at)
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        WHERE o.status <> 'cancelled'
+          AND {where_sql}
+        GROUP BY 1, 2, 3
+    """
+
+
+def _upsert_daily_rollups(cur, sales_select, items_select, params):
+    cur.execute(
+        f"""
+        INSERT INTO daily_sales_rollup AS r ({_ROLLUP_SALES_COLUMNS})
+        {sales_select}
+        ON CONFLICT (sales_date, order_type) DO UPDATE SET
+            total_orders = r.total_orders + EXCLUDED.total_orders,
+            orders_count = r.orders_count + EXCLUDED.orders_count,
+            cancellations = r.cancellations + EXCLUDED.cancellations,
+            points_applied = r.points_applied + EXCLUDED.points_applied,
+            bonus_earned = r.bonus_earned + EXCLUDED.bonus_earned,
+            revenue = r.revenue + EXCLUDED.revenue,
+            updated_at = NOW()
+        """,
+        params,
+    )
+    cur.execute(
+        f"""
+        INSERT INTO daily_item_rollup AS r ({_ROLLUP_ITEM_COLUMNS})
+        {items_select}
+        ON CONFLICT (sales_date, order_type, item_id) DO UPDATE SET
+            name = CASE WHEN EXCLUDED.price_rows > 0 THEN EXCLUDED.name ELSE r.name END,
+            qty_total = r.qty_total + EXCLUDED.qty_total,
+            revenue_total = r.revenue_total + EXCLUDED.revenue_total,
+            price_total = r.price_total + EXCLUDED.price_total,
+            price_rows = r.price_rows + EXCLUDED.price_rows,
+            last_sold_at = GREATEST(r.last_sold_at, EXCLUDED.last_sold_at),
+            updated_at = NOW()
+        """,
+        params,
+    )
+
+
+def _drop_empty_daily_rollups(cur, dates_sql, params):
+    cur.execute(f"DELETE FROM daily_sales_rollup WHERE total_orders <= 0 AND sales_date IN ({dates_sql})", params)
+    cur.execute(f"DELETE FROM daily_item_rollup WHERE price_rows <= 0 AND sales_date IN ({dates_sql})", params)
+
+
+def _apply_orders_to_daily_rollups(cur, where_sql, params, *, sign=1):
+    """Adds (sign=1) or subtracts (sign=-1) the current rows of the matching orders to the daily rollups."""
+    params = (_rollup_timezone_name(), *params)
+    _upsert_daily_rollups(cur, _rollup_sales_select(where_sql, sign), _rollup_items_select(where_sql, sign), params)
+    if sign < 0:
+        _drop_empty_daily_rollups(cur, f"SELECT (o.created_at AT TIME ZONE %s)::date FROM orders o WHERE {where_sql}", params)
+
+
+def _stage_daily_rollup_delta(cur, where_sql, params, *, sign):
+    cur.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS daily_sales_rollup_delta "
+        "(LIKE daily_sales_rollup INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+    )
+    cur.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS daily_item_rollup_delta "
+        "(LIKE daily_item_rollup INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+    )
+    params = (_rollup_timezone_name(), *params)
+    cur.execute(f"INSERT INTO daily_sales_rollup_delta ({_ROLLUP_SALES_COLUMNS}) {_rollup_sales_select(where_sql, sign)}", params)
+    cur.execute(f"INSERT INTO daily_item_rollup_delta ({_ROLLUP_ITEM_COLUMNS}) {_rollup_items_select(where_sql, sign)}", params)
+
+
+def _flush_daily_rollup_delta(cur):
+    _upsert_daily_rollups(
+        cur,
+        """
+        SELECT sales_date, order_type, SUM(total_orders), SUM(orders_count), SUM(cancellations),
+               SUM(points_applied), SUM(bonus_earned), SUM(revenue)
+        FROM daily_sales_rollup_delta
+        GROUP BY 1, 2
+        HAVING SUM(total_orders) <> 0 OR SUM(orders_count) <> 0 OR SUM(points_applied) <> 0
+            OR SUM(bonus_earned) <> 0 OR SUM(revenue) <> 0
+        """,
+        """
+        SELECT sales_date, order_type, item_id, COALESCE(MAX(name) FILTER (WHERE price_rows > 0), MAX(name)),
+               SUM(qty_total), SUM(revenue_total), SUM(price_total), SUM(price_rows), MAX(last_sold_at)
+        FROM daily_item_rollup_delta
+        GROUP BY 1, 2, 3
+        HAVING SUM(qty_total) <> 0 OR SUM(revenue_total) <> 0 OR SUM(price_total) <> 0 OR SUM(price_rows) <> 0
+        """,
+        (),
+    )
+    _drop_empty_daily_rollups(cur, "SELECT sales_date FROM daily_sales_rollup_delta", ())
+    cur.execute("DELETE FROM daily_sales_rollup_delta")
+    cur.execute("DELETE FROM daily_item_rollup_delta")
+
+
+def _rebuild_daily_rollups_in_tx(cur, start_date: date | None = None, end_date: date | None = None):
+    cur.execute("LOCK TABLE daily_sales_rollup, daily_item_rollup IN EXCLUSIVE MODE")
+    rollup_conditions = []
+    rollup_params = []
+    order_conditions = []
+    order_params = []
+    if start_date is not None:
+        rollup_conditions.append("sales_date >= %s")
+        rollup_params.append(start_date)
+        order_conditions.append("o.created_at >= %s")
+        order_params.append(_local_day_start(start_date))
+    if end_date is not None:
+        rollup_conditions.append("sales_date < %s")
+        rollup_params.append(end_date)
+        order_conditions.append("o.created_at < %s")
+        order_params.append(_local_day_start(end_date))
+    rollup_where_sql = "WHERE " + " AND ".join(rollup_conditions) if rollup_conditions else ""
+    cur.execute(f"DELETE FROM daily_sales_rollup {rollup_where_sql}", tuple(rollup_params))
+    cur.execute(f"DELETE FROM daily_item_rollup {rollup_where_sql}", tuple(rollup_params))
+    _apply_orders_to_daily_rollups(cur, " AND ".join(order_conditions) or "TRUE", tuple(order_params))
+
+
+def _normalize_orders_enum_case(cur):
+    cur.execute(
+        """
+        UPDATE orders
+        SET
+            status = CASE
+                WHEN LOWER(BTRIM(status)) = 'canceled' THEN 'cancelled'
+                ELSE COALESCE(NULLIF(LOWER(BTRIM(status)), ''), 'preparing')
+            END,
+            effective_status = CASE
+                WHEN LOWER(BTRIM(effective_status)) = 'canceled' THEN 'cancelled'
+                ELSE COALESCE(NULLIF(LOWER(BTRIM(effective_status)), ''), 'preparing')
+            END,
+            order_type = COALESCE(NULLIF(LOWER(BTRIM(order_type)), ''), 'dine_in')
+        WHERE status <> LOWER(BTRIM(status))
+           OR effective_status <> LOWER(BTRIM(effective_status))
+           OR order_type <> LOWER(BTRIM(order_type))
+           OR status IN ('', 'canceled')
+           OR effective_status IN ('', 'canceled')
+           OR order_type = ''
+        """
+    )
+
+
+def _backfill_orders_items_count(cur):
+    cur.execute(
+        """
+        UPDATE orders o
+        SET items_count = counts.items_count
+        FROM (
+            SELECT order_id, COUNT(*) AS items_count
+            FROM order_items
+            GROUP BY order_id
+        ) counts
+        WHERE counts.order_id = o.id
+          AND o.items_count <> counts.items_count
+        """
+    )
+
+
+def _backfill_orders_status_active_until(cur):
+    cur.execute(
+        f"""
+        SELECT {_ORDER_SELECT_COLUMNS}
+        FROM orders
+        WHERE status_active_until IS NULL
+          AND status NOT IN ('cancelled', 'canceled')
+        """
+    )
+    orders = _hydrate_orders(cur, cur.fetchall(), include_items=False)
+    updates = [
+        (active_until, int(order["id"]))
+        for order in orders
+        if (active_until := _order_status_active_until(order)) is not None
+    ]
+    if updates:
+        cur.executemany("UPDATE orders SET status_active_until = %s WHERE id = %s", updates)
+
+
+def _backfill_promotions_dsl_ast(cur):
+    # Rows saved before the column existed, or with another AST format version, are re-encoded once.
+    cur.execute(
+        """
+        SELECT id, condition, reward, dsl_version
+        FROM promotions
+        WHERE class_name = 'akciya'
+          AND condition <> ''
+          AND reward <> ''
+          AND dsl_ast NOT LIKE %s
+        """,
+        (f'{{"v":{AST_FORMAT_VERSION},%',),
+    )
+    updates = []
+    for promotion_id, condition, reward, dsl_version in cur.fetchall():
+        dsl_ast = serialize_promo_source(
+            {
+                "condition": _coerce_text(condition).strip(),
+                "reward": _coerce_text(reward).strip(),
+                "dsl_version": "" if dsl_version is None else str(dsl_version),
+            }
+        )
+        if dsl_ast:
+            updates.append((dsl_ast, int(promotion_id)))
+    if updates:
+        cur.executemany("UPDATE promotions SET dsl_ast = %s WHERE id = %s", updates)
 
 
 def _migrate_legacy_orders_columns(cur):
@@ -1424,6 +1857,15 @@ def _upsert_promotions_in_tx(cur, promotions):
         canonical_slug = ascii_slug(
             promotion.get("slug") or promotion.get("name") or promotion.get("text") or f"{class_name}-{promotion_id}"
         )
+        dsl_version = _coerce_int(promotion.get("dsl_version"), 0) or None
+        dsl_ast = serialize_promo_source(
+            {
+                "class": class_name,
+                "condition": _coerce_text(promotion.get("condition")).strip(),
+                "reward": _coerce_text(promotion.get("reward")).strip(),
+                "dsl_version": "" if dsl_version is None else str(dsl_version),
+            }
+        )
         rows.append(
             (
                 promotion_id,
@@ -1437,7 +1879,8 @@ def _upsert_promotions_in_tx(cur, promotions):
                 _coerce_int(promotion.get("priority"), 100),
                 _coerce_text(promotion.get("condition")).strip(),
                 _coerce_text(promotion.get("reward")).strip(),
-                (_coerce_int(promotion.get("dsl_version"), 0) or None),
+                dsl_version,
+                dsl_ast,
                 _coerce_text(promotion.get("notify")).strip(),
                 _coerce_text(promotion.get("reward_mode"), "once").strip() or "once",
                 (_coerce_int(promotion.get("limit_per_order"), 0) or None),
@@ -1471,6 +1914,7 @@ def _upsert_promotions_in_tx(cur, promotions):
             condition,
             reward,
             dsl_version,
+            dsl_ast,
             notify,
             reward_mode,
             limit_per_order,
@@ -1482,7 +1926,7 @@ def _upsert_promotions_in_tx(cur, promotions):
             updated_by_admin_user_id
         )
         VALUES (
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
         )
         ON CONFLICT (id)
         DO UPDATE SET
@@ -1497,6 +1941,7 @@ def _upsert_promotions_in_tx(cur, promotions):
             condition = EXCLUDED.condition,
             reward = EXCLUDED.reward,
             dsl_version = EXCLUDED.dsl_version,
+            dsl_ast = EXCLUDED.dsl_ast,
             notify = EXCLUDED.notify,
             reward_mode = EXCLUDED.reward_mode,
             limit_per_order = EXCLUDED.limit_per_order,
@@ -1620,27 +2065,37 @@ def _ensure_schema():
         conn = _get_conn()
         with conn.transaction():
             with conn.cursor() as cur:
+                daily_rollups_missing = not _table_exists(cur, "daily_sales_rollup")
                 _execute_schema(cur)
                 _normalize_legacy_temporal_columns(cur)
                 _migrate_legacy_orders_columns(cur)
                 _maybe_migrate_legacy_app_state(cur)
                 _maybe_migrate_legacy_menu_items(cur)
                 _maybe_migrate_legacy_promotions(cur)
+                _backfill_promotions_dsl_ast(cur)
+                if daily_rollups_missing:
+                    _rebuild_daily_rollups_in_tx(cur)
+                _backfill_orders_status_active_until(cur)
         _SCHEMA_READY = True
 
 
-def _run_db_operation(operation):
-    last_error = None
-    for attempt in range(DB_OPERATION_RETRIES):
-        try:
-            return operation()
-        except Exception as exc:
-            last_error = exc
-            _reset_conn()
-            if attempt == DB_OPERATION_RETRIES - 1:
-                break
-            time.sleep(DB_RETRY_DELAY_SECONDS)
-    raise last_error
+def _run_db_operation(operation, name: str | None = None):
+    with query_metrics.track_operation(name or query_metrics.operation_name(operation)) as metrics_entry:
+        last_error = None
+        for attempt in range(DB_OPERATION_RETRIES):
+            metrics_entry["retries"] = attempt
+            try:
+                result = operation()
+                if metrics_entry["rows"] is None:
+                    metrics_entry["rows"] = query_metrics.infer_rows(result)
+                return result
+            except Exception as exc:
+                last_error = exc
+                _reset_conn()
+                if attempt == DB_OPERATION_RETRIES - 1:
+                    break
+                time.sleep(DB_RETRY_DELAY_SECONDS)
+        raise last_error
 
 
 _ORDER_SELECT_COLUMNS = """
@@ -1678,7 +2133,8 @@ _ORDER_SELECT_COLUMNS = """
     delivery_comment,
     delivery_address,
     delivery_eta_minutes,
-    cancelled_at
+    cancelled_at,
+    status_timeline
 """
 
 
@@ -1834,6 +2290,8 @@ def _order_row_to_dict(row, items_by_order):
     cancelled_at = _serialize_datetime_utc(row[34])
     if cancelled_at:
         order["cancelled_at"] = cancelled_at
+    if isinstance(row[35], dict):
+        order["status_timeline"] = row[35]
     return order
 
 
@@ -2208,28 +2666,95 @@ def list_user_bookings(user_id: int, *, include_expired: bool = False, booking_d
     return _run_db_operation(operation)
 
 
-def list_reserved_table_ids(date_str: str, time_str: str, *, booking_duration_minutes: int = 60):
+def count_user_notifications(user_id: int, now: datetime | None = None, *, booking_duration_minutes: int = 60):
+    def operation():
+        _ensure_schema()
+        conn = _get_conn()
+        current = (now or current_time_value()).replace(tzinfo=None)
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT
+                    (
+                        SELECT COUNT(*)
+                        FROM bookings
+                        WHERE user_id = %s
+                          AND booking_date + booking_time + make_interval(mins => %s) > %s::timestamp
+                    ),
+                    (
+                        SELECT COUNT(*)
+                        FROM orders
+                        WHERE user_id = %s
+                          AND status NOT IN ('cancelled', 'canceled')
+                          AND status_active_until > %s
+                    )
+                """,
+                (
+                    int(user_id),
+                    max(1, int(booking_duration_minutes or 60)),
+                    current,
+                    int(user_id),
+                    current.replace(tzinfo=timezone.utc),
+                ),
+            )
+            row = cur.fetchone() or (0, 0)
+        return {"bookings": _coerce_int(row[0], 0), "orders": _coerce_int(row[1], 0)}
+
+    return _run_db_operation(operation)
+
+
+def delete_expired_bookings(*, booking_duration_minutes: int = 60):
     def operation():
         _ensure_schema()
         conn = _get_conn()
-        selected_at = datetime.fromisoformat(f"{_coerce_text(date_str)}T{_coerce_text(time_str)}")
-        selected_until = selected_at + timedelta(minutes=max(1, int(booking_duration_minutes or 60)))
         with conn.cursor() as cur:
             cur.execute(
                 """
-                SELECT DISTINCT table_id
+                DELETE FROM bookings
+                WHERE booking_date + booking_time + make_interval(mins => %s) <= %s::timestamp
+                """,
+                (max(1, int(booking_duration_minutes or 60)), current_local_datetime_value()),
+            )
+            return max(0, cur.rowcount or 0)
+
+    return _run_db_operation(operation)
+
+
+def delete_expired_orders(*, retention_days: int):
+    def operation():
+        _ensure_schema()
+        conn = _get_conn()
+        with conn.cursor() as cur:
+            # order_items rows go with their order (ON DELETE CASCADE); daily rollups keep the history.
+            cur.execute(
+                """
+                DELETE FROM orders
+                WHERE created_at < NOW() - make_interval(days => %s)
+                  AND effective_status IN ('served', 'cancelled')
+                """,
+                (max(1, int(retention_days)),),
+            )
+            return max(0, cur.rowcount or 0)
+
+    return _run_db_operation(operation)
+
+
+def list_bookings_between_dates(start_date, end_date):
+    def operation():
+        _ensure_schema()
+        conn = _get_conn()
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT user_id, table_id, booking_date, booking_time, name, created_at
                 FROM bookings
-                WHERE tsrange(
-                    booking_date + booking_time,
-                    booking_date + booking_time + make_interval(mins => %s),
-                    '[)'
-                ) && tsrange(%s::timestamp, %s::timestamp, '[)')
-                ORDER BY table_id ASC
+                WHERE booking_date BETWEEN %s AND %s
+                ORDER BY booking_date, booking_time, table_id
                 """,
-                (max(1, int(booking_duration_minutes or 60)), selected_at, selected_until),
+                (start_date, end_date),
             )
             rows = cur.fetchall()
-        return [_coerce_int(row[0], 0) for row in rows if _coerce_int(row[0], 0) > 0]
+        return [_booking_row_to_dict(row) for row in rows]
 
     return _run_db_operation(operation)
 
@@ -2254,6 +2779,26 @@ def list_user_orders(user_id: int):
     return _run_db_operation(operation)
 
 
+def list_user_orders_by_ids(user_id: int, order_ids: list[int]):
+    def operation():
+        _ensure_schema()
+        conn = _get_conn()
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT { _ORDER_SELECT_COLUMNS }
+                FROM orders
+                WHERE user_id = %s AND id = ANY(%s)
+                ORDER BY id ASC
+                """,
+                (int(user_id), [int(order_id) for order_id in order_ids]),
+            )
+            order_rows = cur.fetchall()
+            return _hydrate_orders(cur, order_rows, include_items=False)
+
+    return _run_db_operation(operation)
+
+
 def get_user_order(user_id: int, order_id: int):
     def operation():
         _ensure_schema()
@@ -2379,6 +2924,24 @@ def cancel_booking_with_orders(user_id: int, table_id: int, date_str: str, time_
                 booking_removed = cur.fetchone() is not None
                 if not booking_removed:
                     return False
+                cur.execute(
+                    """
+                    SELECT id
+                    FROM orders
+                    WHERE user_id = %s
+                      AND order_type <> 'delivery'
+                      AND status <> 'cancelled'
+                      AND booking_table_id = %s
+                      AND booking_date = %s
+                      AND booking_time = %s
+                    FOR UPDATE
+                    """,
+                    (normalized_user_id, normalized_table_id, normalized_date, normalized_time),
+                )
+                cancelled_order_ids = [row[0] for row in cur.fetchall()]
+                if not cancelled_order_ids:
+                    return True
+                _apply_orders_to_daily_rollups(cur, "o.id = ANY(%s)", (cancelled_order_ids,), sign=-1)
                 cur.execute(
                     """
                     UPDATE orders
@@ -2388,22 +2951,11 @@ def cancel_booking_with_orders(user_id: int, table_id: int, date_str: str, time_
                         effective_status_updated_at = %s,
                         is_delivery_overdue = FALSE,
                         cancelled_at = %s
-                    WHERE user_id = %s
-                      AND LOWER(COALESCE(order_type, 'dine_in')) <> 'delivery'
-                      AND LOWER(COALESCE(status, '')) NOT IN ('cancelled', 'canceled')
-                      AND booking_table_id = %s
-                      AND booking_date = %s
-                      AND booking_time = %s
+                    WHERE id = ANY(%s)
                     """,
-                    (
-                        normalized_cancelled_at,
-                        normalized_cancelled_at,
-                        normalized_user_id,
-                        normalized_table_id,
-                        normalized_date,
-                        normalized_time,
-                    ),
+                    (normalized_cancelled_at, normalized_cancelled_at, cancelled_order_ids),
                 )
+                _apply_orders_to_daily_rollups(cur, "o.id = ANY(%s)", (cancelled_order_ids,))
                 return True
 
     return _run_db_operation(operation)
@@ -2425,15 +2977,9 @@ def refresh_persisted_order_fields(*, order_ids: list[int] | None = None, user_i
             conditions.append("user_id = %s")
             params.append(int(user_id))
         if active_only:
-            conditions.append(
-                """
-                (
-                    COALESCE(effective_status, '') = ''
-                    OR LOWER(COALESCE(effective_status, status, '')) NOT IN ('served', 'cancelled')
-                    OR (LOWER(COALESCE(order_type, 'dine_in')) = 'delivery' AND COALESCE(is_delivery_overdue, FALSE) = FALSE)
-                )
-                """
-            )
+            # effective_status is NOT NULL and lower-case (CHECK), so this also matches rows with an empty status.
+            # Finished delivery orders are never overdue (runtime_delivery_overdue_value), so refreshing them is a no-op.
+            conditions.append("effective_status NOT IN ('served', 'cancelled')")
         where_sql = "WHERE " + " AND ".join(condition.strip() for condition in conditions) if conditions else ""
         with conn.transaction():
             with conn.cursor() as cur:
@@ -2481,6 +3027,107 @@ def refresh_persisted_order_fields(*, order_ids: list[int] | None = None, user_i
     return _run_db_operation(operation)
 
 
+def list_open_orders(*, order_ids: list[int] | None = None):
+    def operation():
+        _ensure_schema()
+        conn = _get_conn()
+        conditions = ["effective_status NOT IN ('served', 'cancelled')"]
+        params = []
+        if order_ids is not None:
+            conditions.append("id = ANY(%s)")
+            params.append([int(order_id) for order_id in order_ids])
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT { _ORDER_SELECT_COLUMNS }
+                FROM orders
+                WHERE {" AND ".join(conditions)}
+                ORDER BY created_at ASC, id ASC
+                """,
+                tuple(params),
+            )
+            order_rows = cur.fetchall()
+            return _hydrate_orders(cur, order_rows, include_items=False)
+
+    return _run_db_operation(operation)
+
+
+def persist_order_status_fields(updates: list[dict]):
+    rows = [
+        (
+            _coerce_text(update.get("effective_status"), "preparing") or "preparing",
+            _coerce_text(update.get("effective_status_updated_at")),
+            bool(update.get("is_delivery_overdue")),
+            int(update["id"]),
+            _normalize_order_status(update.get("status")),
+        )
+        for update in updates or []
+        if _coerce_int(update.get("id"), 0) > 0
+    ]
+    if not rows:
+        return 0
+
+    def operation():
+        _ensure_schema()
+        conn = _get_conn()
+        with conn.transaction():
+            with conn.cursor() as cur:
+                # The status guard skips rows an admin changed since they were scheduled.
+                cur.executemany(
+                    """
+                    UPDATE orders
+                    SET
+                        effective_status = %s,
+                        effective_status_updated_at = %s,
+                        is_delivery_overdue = %s
+                    WHERE id = %s
+                      AND status = %s
+                    """,
+                    rows,
+                )
+        return len(rows)
+
+    return _run_db_operation(operation)
+
+
+def set_order_status(order_id: int, *, status: str, cancelled_at=None):
+    def operation():
+        _ensure_schema()
+        conn = _get_conn()
+        normalized_order_id = int(order_id)
+        with conn.transaction():
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM orders WHERE id = %s FOR UPDATE", (normalized_order_id,))
+                if cur.fetchone() is None:
+                    return False
+                # The rollups move by this order's own delta: its old rows out, the updated rows in.
+                _apply_orders_to_daily_rollups(cur, "o.id = %s", (normalized_order_id,), sign=-1)
+                cur.execute(
+                    "UPDATE orders SET status = %s, cancelled_at = %s WHERE id = %s",
+                    (_normalize_order_status(status), cancelled_at, normalized_order_id),
+                )
+                _apply_orders_to_daily_rollups(cur, "o.id = %s", (normalized_order_id,))
+                return True
+
+    return _run_db_operation(operation)
+
+
+def rebuild_daily_rollups(*, start_date: date | None = None, end_date: date | None = None):
+    def operation():
+        _ensure_schema()
+        conn = _get_conn()
+        with conn.transaction():
+            with conn.cursor() as cur:
+                _rebuild_daily_rollups_in_tx(cur, start_date, end_date)
+                cur.execute("SELECT COUNT(*) FROM daily_sales_rollup")
+                sales_rows = _coerce_int(cur.fetchone()[0], 0)
+                cur.execute("SELECT COUNT(*) FROM daily_item_rollup")
+                item_rows = _coerce_int(cur.fetchone()[0], 0)
+        return {"sales_rows": sales_rows, "item_rows": item_rows}
+
+    return _run_db_operation(operation)
+
+
 def create_order(order: dict):
     def operation():
         _ensure_schema()
@@ -2493,6 +3140,7 @@ def create_order(order: dict):
                 user_id = _coerce_int(normalized_order.get("user_id"), 0)
                 if user_id <= 0:
                     raise ValueError("Order user_id is required")
+                order_items = [item for item in _coerce_list(normalized_order.get("items")) if isinstance(item, dict)]
                 cur.execute(
                     """
                     INSERT INTO orders (
@@ -2505,6 +3153,7 @@ def create_order(order: dict):
                         is_delivery_overdue,
                         created_at,
                         items_total,
+                        items_count,
                         points_applied,
                         payable_total,
                         bonus_earned,
@@ -2530,24 +3179,27 @@ def create_order(order: dict):
                         delivery_comment,
                         delivery_address,
                         delivery_eta_minutes,
-                        cancelled_at
+                        cancelled_at,
+                        status_timeline,
+                        status_active_until
                     )
                     VALUES (
                         %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
                         %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                        %s, %s, %s
+                        %s, %s, %s, %s, %s::jsonb, %s
                     )
                     """,
                     (
                         order_id,
                         user_id,
-                        _coerce_text(normalized_order.get("order_type"), "dine_in") or "dine_in",
-                        _coerce_text(normalized_order.get("status"), "preparing") or "preparing",
-                        _coerce_text(normalized_order.get("effective_status"), "preparing") or "preparing",
+                        _normalize_order_type(normalized_order.get("order_type")),
+                        _normalize_order_status(normalized_order.get("status")),
+                        _normalize_order_status(normalized_order.get("effective_status")),
                         _parse_optional_datetime_utc(normalized_order.get("effective_status_updated_at")),
                         bool(normalized_order.get("is_delivery_overdue")),
                         _parse_optional_datetime_utc(normalized_order.get("created_at")) or datetime.now(timezone.utc),
                         _coerce_int(normalized_order.get("items_total"), 0),
+                        len(order_items),
                         _coerce_int(normalized_order.get("points_applied"), 0),
                         _coerce_int(normalized_order.get("payable_total"), 0),
                         _coerce_int(normalized_order.get("bonus_earned"), 0),
@@ -2574,12 +3226,12 @@ def create_order(order: dict):
                         _coerce_text(normalized_order.get("delivery_address")),
                         _coerce_int(normalized_order.get("delivery_eta_minutes"), 20),
                         _parse_optional_datetime_utc(normalized_order.get("cancelled_at")),
+                        _status_timeline_json(normalized_order.get("status_timeline")),
+                        _order_status_active_until(normalized_order),
                     ),
                 )
                 item_rows = []
-                for position, item in enumerate(_coerce_list(normalized_order.get("items"))):
-                    if not isinstance(item, dict):
-                        continue
+                for position, item in enumerate(order_items):
                     item_rows.append(
                         (
                             order_id,
@@ -2601,6 +3253,7 @@ def create_order(order: dict):
                         """,
                         item_rows,
                     )
+                _apply_orders_to_daily_rollups(cur, "o.id = %s", (order_id,))
                 return normalized_order
 
     return _run_db_operation(operation)
@@ -2649,8 +3302,7 @@ def replace_all_state(users, bookings, orders):
         conn = _get_conn()
         with conn.transaction():
             with conn.cursor() as cur:
-                cur.execute("DELETE FROM order_items")
-                cur.execute("DELETE FROM orders")
+                _delete_all_orders_in_tx(cur)
                 cur.execute("DELETE FROM bookings")
                 cur.execute("DELETE FROM user_cards")
                 cur.execute("DELETE FROM users")
@@ -2684,6 +3336,44 @@ def ping():
     return _run_db_operation(operation)
 
 
+def try_acquire_leader_lock(lock_key: int) -> bool:
+    # Session-level advisory lock on a dedicated connection: it is held until that connection closes.
+    with _LEADER_LOCK_GUARD:
+        conn = _LEADER_LOCK_CONNS.get(int(lock_key))
+        if conn is not None:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                    cur.fetchone()
+                return True
+            except Exception:
+                _LEADER_LOCK_CONNS.pop(int(lock_key), None)
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        conn = _connect()
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (int(lock_key),))
+            row = cur.fetchone()
+        if not row or not row[0]:
+            conn.close()
+            return False
+        _LEADER_LOCK_CONNS[int(lock_key)] = conn
+        return True
+
+
+def release_leader_lock(lock_key: int):
+    with _LEADER_LOCK_GUARD:
+        conn = _LEADER_LOCK_CONNS.pop(int(lock_key), None)
+    if conn is None:
+        return
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
 def load_menu_items(*, include_inactive: bool = False):
     def operation():
         _ensure_schema()
@@ -2811,7 +3501,8 @@ def load_promotions():
                     limit_per_user_per_day,
                     start_at,
                     end_at,
-                    photo_path
+                    photo_path,
+                    dsl_ast
                 FROM promotions
                 WHERE class_name IN ('akciya', 'reklama')
                 ORDER BY priority DESC, id ASC
@@ -2839,6 +3530,7 @@ def load_promotions():
                 "start_at": row[16].isoformat() if isinstance(row[16], datetime) else _coerce_text(row[16]),
                 "end_at": row[17].isoformat() if isinstance(row[17], datetime) else _coerce_text(row[17]),
                 "photo": _coerce_text(row[18]) or None,
+                "dsl_ast": _coerce_text(row[19]),
             }
             for row in rows
         ]
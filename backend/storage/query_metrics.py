@@ -0,0 +1,235 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
+
+def _env_int(name, default):
+    value = (os.getenv(name) or "").strip()
+    if not value:
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+DB_SLOW_QUERY_MS = max(1, _env_int("DB_SLOW_QUERY_MS", 250))
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+SERVER_TIMING_MAX_ENTRIES = 8
+
+_LOCAL = threading.local()
+_STATS_LOCK = threading.Lock()
+_STATS = {}
+_SERVER_TIMING_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+_FROM_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+
+
+def operation_name(operation) -> str:
+    qualname = str(getattr(operation, "__qualname__", "") or getattr(operation, "__name__", "") or "operation")
+    return qualname.split(".<locals>", 1)[0] or "operation"
+
+
+def query_label(query: str, prefix: str = "sql") -> str:
+    match = _FROM_TABLE_RE.search(str(query or ""))
+    return f"{prefix}.{match.group(1).lower()}" if match else prefix
+
+
+def params_shape(params) -> str:
+    if params is None:
+        return "None"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{key}: {params_shape(value)}" for key, value in params.items()) + "}"
+    if isinstance(params, (list, tuple)):
+        if len(params) > 6 and not isinstance(params, tuple):
+            return f"list[{len(params)}]"
+        inner = ", ".join(params_shape(value) for value in params)
+        return f"({inner})" if isinstance(params, tuple) else f"[{inner}]"
+    if isinstance(params, str):
+        return f"str[{len(params)}]"
+    if isinstance(params, datetime):
+        return "datetime" if params.tzinfo is None else "datetime+tz"
+    if isinstance(params, date):
+        return "date"
+    return type(params).__name__
+
+
+def begin_request():
+    _LOCAL.request_entries = []
+
+
+def end_request() -> list[dict]:
+    entries = getattr(_LOCAL, "request_entries", None) or []
+    _LOCAL.request_entries = None
+    return entries
+
+
+def note_connection_acquire(duration_ms: float):
+    stack = getattr(_LOCAL, "operations", None)
+    if stack:
+        stack[-1]["acquire_ms"] += max(0.0, float(duration_ms))
+
+
+def note_rows(count: int):
+    stack = getattr(_LOCAL, "operations", None)
+    if stack:
+        stack[-1]["rows"] = (stack[-1]["rows"] or 0) + max(0, int(count or 0))
+
+
+def note_query(query: str, params=None, duration_ms: float | None = None):
+    """Remember the statement for the slow log; with a duration only the slowest statement of the operation is kept."""
+    stack = getattr(_LOCAL, "operations", None)
+    if not stack:
+        return
+    entry = stack[-1]
+    if duration_ms is not None:
+        if duration_ms < entry["query_ms"]:
+            return
+        entry["query_ms"] = float(duration_ms)
+    entry["query"] = " ".join(str(query or "").split())[:200]
+    entry["params_shape"] = params_shape(params)
+
+
+@contextmanager
+def track_operation(name: str):
+    stack = getattr(_LOCAL, "operations", None)
+    if stack is None:
+        stack = []
+        _LOCAL.operations = stack
+    entry = {
+        "name": str(name or "operation"),
+        "rows": None,
+        "retries": 0,
+        "acquire_ms": 0.0,
+        "query": "",
+        "query_ms": 0.0,
+        "params_shape": "",
+        # Nested operations run inside their parent's time and are left out of the request's db total.
+        "nested": bool(stack),
+    }
+    stack.append(entry)
+    started_at = time.perf_counter()
+    try:
+        yield entry
+    finally:
+        stack.pop()
+        entry["duration_ms"] = max(0.0, (time.perf_counter() - started_at) * 1000.0)
+        record(entry)
+
+
+def infer_rows(result) -> int | None:
+    if result is None or isinstance(result, bool):
+        return 0
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return None
+
+
+def record(entry: dict):
+    name = entry["name"]
+    duration_ms = float(entry.get("duration_ms") or 0.0)
+    rows = int(entry.get("rows") or 0)
+    retries = int(entry.get("retries") or 0)
+    acquire_ms = float(entry.get("acquire_ms") or 0.0)
+    with _STATS_LOCK:
+        stats = _STATS.get(name)
+        if stats is None:
+            stats = {
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "rows_total": 0,
+                "retries_total": 0,
+                "acquire_ms_total": 0.0,
+                "slow_count": 0,
+                "buckets": [0] * (len(HISTOGRAM_BUCKETS_MS) + 1),
+            }
+            _STATS[name] = stats
+        stats["count"] += 1
+        stats["total_ms"] += duration_ms
+        stats["max_ms"] = max(stats["max_ms"], duration_ms)
+        stats["rows_total"] += rows
+        stats["retries_total"] += retries
+        stats["acquire_ms_total"] += acquire_ms
+        bucket_index = next((index for index, bound in enumerate(HISTOGRAM_BUCKETS_MS) if duration_ms <= bound), len(HISTOGRAM_BUCKETS_MS))
+        stats["buckets"][bucket_index] += 1
+        if duration_ms >= DB_SLOW_QUERY_MS:
+            stats["slow_count"] += 1
+    request_entries = getattr(_LOCAL, "request_entries", None)
+    if request_entries is not None:
+        request_entries.append(
+            {
+                "name": name,
+                "duration_ms": duration_ms,
+                "rows": rows,
+                "retries": retries,
+                "acquire_ms": acquire_ms,
+                "nested": bool(entry.get("nested")),
+            }
+        )
+    if duration_ms >= DB_SLOW_QUERY_MS:
+        print(
+            "[db-slow] {0} dur={1:.1f}ms rows={2} retries={3} acquire={4:.1f}ms params={5} query={6}".format(
+                name,
+                duration_ms,
+                rows,
+                retries,
+                acquire_ms,
+                entry.get("params_shape") or "-",
+                entry.get("query") or "-",
+            )
+        )
+
+
+def server_timing_entries(entries: list[dict]) -> list[str]:
+    if not entries:
+        return []
+    by_name = {}
+    for entry in entries:
+        totals = by_name.setdefault(entry["name"], {"duration_ms": 0.0, "count": 0})
+        totals["duration_ms"] += entry["duration_ms"]
+        totals["count"] += 1
+    total_ms = sum(entry["duration_ms"] for entry in entries if not entry.get("nested"))
+    acquire_ms = sum(entry["acquire_ms"] for entry in entries)
+    timings = [f'db;dur={total_ms:.1f};desc="{len(entries)} ops"']
+    if acquire_ms >= 0.1:
+        timings.append(f"db-acquire;dur={acquire_ms:.1f}")
+    ranked = sorted(by_name.items(), key=lambda item: -item[1]["duration_ms"])[:SERVER_TIMING_MAX_ENTRIES]
+    for name, totals in ranked:
+        token = _SERVER_TIMING_NAME_RE.sub("_", name)
+        timings.append(f'db-{token};dur={totals["duration_ms"]:.1f};desc="x{totals["count"]}"')
+    return timings
+
+
+def snapshot() -> dict:
+    with _STATS_LOCK:
+        operations = []
+        for name, stats in _STATS.items():
+            count = stats["count"] or 1
+            operations.append(
+                {
+                    "name": name,
+                    "count": stats["count"],
+                    "avg_ms": round(stats["total_ms"] / count, 2),
+                    "max_ms": round(stats["max_ms"], 2),
+                    "total_ms": round(stats["total_ms"], 2),
+                    "rows_total": stats["rows_total"],
+                    "avg_rows": round(stats["rows_total"] / count, 2),
+                    "retries_total": stats["retries_total"],
+                    "avg_acquire_ms": round(stats["acquire_ms_total"] / count, 2),
+                    "slow_count": stats["slow_count"],
+                    "histogram": {
+                        (f"<={bound}ms" if index < len(HISTOGRAM_BUCKETS_MS) else f">{HISTOGRAM_BUCKETS_MS[-1]}ms"): value
+                        for index, (bound, value) in enumerate(zip((*HISTOGRAM_BUCKETS_MS, None), stats["buckets"]))
+                    },
+                }
+            )
+    operations.sort(key=lambda item: -item["total_ms"])
+    return {"slow_query_ms": DB_SLOW_QUERY_MS, "operations": operations}
+
+
+def reset():
+    with _STATS_LOCK:
+        _STATS.clear()
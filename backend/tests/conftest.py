@@ -28,6 +28,7 @@ def app_module(tmp_path, monkeypatch):
     monkeypatch.setenv("SESSION_DEBUG_ENABLED", "0")
     monkeypatch.setenv("MENU_CACHE_ENABLED", "0")
     monkeypatch.setenv("DB_KEEPALIVE_ENABLED", "0")
+    monkeypatch.setenv("HOUSEKEEPING_ENABLED", "0")
 
     if str(BACKEND_DIR) not in sys.path:
         sys.path.insert(0, str(BACKEND_DIR))
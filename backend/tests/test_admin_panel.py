@@ -1,4 +1,8 @@
 import importlib
+import json
+import os
+import re
+import time
 from datetime import datetime
 from pathlib import Path
 
@@ -8,6 +12,7 @@ from flask import Flask, session
 from conftest import write_json
 from services.auth_session import AuthSessionService
 from services.menu_content import MenuContentService
+from services import admin_content_management
 from services.admin_service import AdminService
 from services.order_status import apply_persisted_status_fields_value
 
@@ -288,6 +293,126 @@ def test_admin_service_marks_completed_delivery_as_served_instead_of_overdue(mon
     assert service.is_delivery_overdue(order) is False
 
 
+def test_order_deadline_scheduler_persists_transitions_when_due():
+    from datetime import timedelta
+
+    from services.order_deadlines import OrderDeadlineScheduler
+
+    created_at = datetime(2026, 10, 19, 12, 0, 0)
+    clock = {"now": created_at}
+    persisted = []
+    order = {
+        "id": 41,
+        "order_type": "delivery",
+        "status": "preparing",
+        "effective_status": "cooking",
+        "effective_status_updated_at": created_at.isoformat(),
+        "is_delivery_overdue": False,
+        "created_at": created_at.isoformat(),
+        "delivery_eta_minutes": 30,
+    }
+    scheduler = OrderDeadlineScheduler(
+        load_open_orders=lambda order_ids=None: [dict(order)],
+        persist_updates=persisted.append,
+        resync_seconds=3600,
+        max_sleep_seconds=3600,
+        now=lambda: clock["now"],
+        monotonic=lambda: 0.0,
+    )
+    scheduler.resync()
+
+    assert scheduler.run_due() == 0
+    assert scheduler.seconds_until_next_due() == pytest.approx(15 * 60)
+
+    clock["now"] = created_at + timedelta(minutes=15)
+    assert scheduler.run_due() == 1
+    assert persisted[-1][0]["effective_status"] == "delivering"
+    assert persisted[-1][0]["status"] == "preparing"
+
+    clock["now"] = created_at + timedelta(minutes=20)
+    assert scheduler.run_due() == 0
+
+    clock["now"] = created_at + timedelta(minutes=30)
+    assert scheduler.run_due() == 1
+    assert persisted[-1][0]["effective_status"] == "served"
+    assert persisted[-1][0]["is_delivery_overdue"] is False
+    assert len(scheduler) == 0
+
+
+def test_order_deadline_scheduler_follows_housekeeping_leadership_and_picks_up_other_workers_orders():
+    from services.housekeeping import HousekeepingService
+    from services.order_deadlines import OrderDeadlineScheduler
+
+    created_at = datetime(2026, 10, 19, 12, 0, 0)
+    open_orders = [
+        {"id": 51, "order_type": "dine_in", "status": "preparing", "effective_status": "cooking", "created_at": created_at.isoformat()},
+    ]
+    scheduler = OrderDeadlineScheduler(
+        load_open_orders=lambda order_ids=None: [dict(order) for order in open_orders],
+        persist_updates=lambda updates: None,
+        resync_seconds=3600,
+        max_sleep_seconds=3600,
+        now=lambda: created_at,
+    )
+    leadership = {"leader": False}
+    housekeeping = HousekeepingService(try_acquire_leadership=lambda: leadership["leader"])
+    housekeeping.add_leadership_listener(lambda leader: scheduler.start() if leader else scheduler.stop())
+
+    try:
+        housekeeping.tick()
+        assert not scheduler.running
+
+        leadership["leader"] = True
+        housekeeping.tick()
+        assert scheduler.running
+        deadline = time.monotonic() + 5
+        while len(scheduler) != 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(scheduler) == 1
+
+        # An order created on another worker is not in this process's heap until it is picked up.
+        open_orders.append(dict(open_orders[0], id=52))
+        assert scheduler.track_untracked() == 1
+        assert scheduler.track_untracked() == 0
+        assert len(scheduler) == 2
+
+        leadership["leader"] = False
+        housekeeping.tick()
+        scheduler._thread.join(timeout=5)
+        assert not scheduler.running
+        assert len(scheduler) == 0
+    finally:
+        scheduler.stop()
+
+
+def test_admin_orders_page_skips_full_refresh_when_scheduler_runs(monkeypatch):
+    class SchedulerStub:
+        running = True
+        due_runs = 0
+        untracked_runs = 0
+
+        def track_untracked(self):
+            self.untracked_runs += 1
+            return 0
+
+        def run_due(self):
+            self.due_runs += 1
+            return 0
+
+    scheduler = SchedulerStub()
+    service = AdminService(active_storage="postgres", menu_content=None, order_deadline_scheduler=scheduler)
+    monkeypatch.setattr(
+        service,
+        "_refresh_persisted_order_fields",
+        lambda **kwargs: pytest.fail("full refresh should not run"),
+    )
+    monkeypatch.setattr(service, "_fetch_all", lambda query, params=(): [])
+
+    assert service.list_orders({}) == []
+    assert scheduler.due_runs == 1
+    assert scheduler.untracked_runs == 1
+
+
 def test_admin_list_orders_uses_persisted_effective_status(monkeypatch):
     service = AdminService(active_storage="postgres", menu_content=None)
     order = {
@@ -318,6 +443,43 @@ def test_admin_list_orders_uses_persisted_effective_status(monkeypatch):
     assert orders[0]["status_label"] == "Выдан"
 
 
+def test_admin_orders_page_reads_items_count_without_order_items_join(monkeypatch):
+    service = AdminService(active_storage="postgres", menu_content=None)
+    captured = []
+
+    def fake_fetch_one(query, params=()):
+        captured.append(query)
+        return {"count": 1}
+
+    def fake_fetch_all(query, params=()):
+        captured.append(query)
+        return [
+            {
+                "id": 21,
+                "user_id": 1,
+                "order_type": "delivery",
+                "status": "cooking",
+                "effective_status": "cooking",
+                "created_at": "2026-03-20T09:00:00",
+                "items_count": 3,
+                "items_total": 900,
+                "payable_total": 900,
+            }
+        ]
+
+    monkeypatch.setattr(service, "_refresh_persisted_order_fields", lambda **kwargs: 0)
+    monkeypatch.setattr(service, "_fetch_one", fake_fetch_one)
+    monkeypatch.setattr(service, "_fetch_all", fake_fetch_all)
+
+    orders, pagination = service.paginate_orders({}, page=1, per_page=25)
+
+    assert orders[0]["items_count"] == 3
+    assert pagination["total"] == 1
+    assert all("order_items" not in query for query in captured)
+    assert all("GROUP BY" not in query for query in captured)
+    assert "ORDER BY o.created_at DESC, o.id DESC" in captured[-1]
+
+
 def test_apply_persisted_status_fields_preserves_updated_at_without_status_change():
     now = datetime(2026, 3, 20, 10, 30, 0)
     order = {
@@ -362,7 +524,7 @@ def test_admin_analytics_uses_sql_aggregates(monkeypatch):
         return {}
 
     def fake_fetch_all(query, params=()):
-        if "GROUP BY created_at::date" in query:
+        if "GROUP BY 1" in query:
             return [
                 {
                     "label": "2026-03-19",
@@ -407,6 +569,285 @@ def test_admin_analytics_uses_sql_aggregates(monkeypatch):
     assert analytics["no_sales_items"][0]["name"] == "Паста"
 
 
+def test_admin_analytics_uses_typed_bounds_and_plain_predicates(monkeypatch):
+    class MenuContentStub:
+        def load_menu_items_admin(self):
+            return [{"id": 1, "name": "Борщ", "type": "Супы", "price": 450}]
+
+    service = AdminService(active_storage="postgres", menu_content=MenuContentStub())
+    calls = []
+    aggregate_keys = (
+        "total_orders",
+        "orders_count",
+        "cancellations",
+        "points_applied",
+        "bonus_earned",
+        "revenue",
+        "dine_in_orders",
+        "delivery_orders",
+        "dine_in_revenue",
+        "delivery_revenue",
+    )
+
+    def fake_fetch_one(query, params=()):
+        calls.append((query, params))
+        if "COUNT(*) AS total_orders" in query:
+            return {key: 0 for key in aggregate_keys}
+        return {"count": 0}
+
+    def fake_fetch_all(query, params=()):
+        calls.append((query, params))
+        return []
+
+    monkeypatch.setattr(service, "_fetch_one", fake_fetch_one)
+    monkeypatch.setattr(service, "_fetch_all", fake_fetch_all)
+
+    service.get_analytics({"period": "7d", "mode": "delivery"})
+
+    order_calls = [(query, params) for query, params in calls if "orders" in query]
+    assert order_calls
+    for query, params in order_calls:
+        assert "LOWER(" not in query
+        for value in params:
+            if isinstance(value, datetime):
+                assert value.tzinfo is not None
+    daily_query, daily_params = next((query, params) for query, params in calls if "GROUP BY 1" in query)
+    assert "AT TIME ZONE %s" in daily_query
+    assert isinstance(daily_params[0], str) and daily_params[0]
+
+
+def test_pg_store_normalizes_order_status_and_type_case(app_module):
+    pg_store = importlib.import_module("storage.pg_store")
+
+    assert pg_store._normalize_order_status(" Cancelled ") == "cancelled"
+    assert pg_store._normalize_order_status("CANCELED") == "cancelled"
+    assert pg_store._normalize_order_status("") == "preparing"
+    assert pg_store._normalize_order_type("Delivery") == "delivery"
+    assert pg_store._normalize_order_type(None) == "dine_in"
+
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL is not set")
+def test_admin_dashboard_queries_use_orders_indexes(app_module, monkeypatch):
+    psycopg = pytest.importorskip("psycopg")
+    database_url = os.environ["TEST_DATABASE_URL"]
+    monkeypatch.setenv("DATABASE_URL", database_url)
+    pg_store = importlib.import_module("storage.pg_store")
+    monkeypatch.setattr(pg_store, "_SCHEMA_READY", False)
+    pg_store._ensure_schema()
+
+    class MenuContentStub:
+        def load_menu_items_admin(self):
+            return []
+
+    def collect_index_names(node, relation):
+        found = set()
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") == relation:
+            found.add("Seq Scan")
+        if node.get("Node Type") in {"Index Scan", "Index Only Scan", "Bitmap Index Scan"} and node.get("Index Name"):
+            found.add(node["Index Name"])
+        for child in node.get("Plans", []):
+            found |= collect_index_names(child, relation)
+        return found
+
+    # Each predicate of the dashboard queries and the indexes built for it; the planner may pick any of them.
+    predicate_indexes = [
+        (r"WHERE effective_status NOT IN", {"idx_orders_active_created"}),
+        (
+            r"order_type = 'delivery' AND effective_status NOT IN",
+            {"idx_orders_delivery_active_created", "idx_orders_delivery_overdue_created"},
+        ),
+        (
+            r"created_at < %s (?:AND o\.order_type = %s )?AND (?:o\.)?status <> 'cancelled'",
+            {"idx_orders_paid_created", "idx_orders_type_created"},
+        ),
+        (r"cancelled_at >= %s AND cancelled_at < %s", {"idx_orders_cancelled_at"}),
+        (
+            r"created_at >= %s AND (?:o\.)?created_at < %s",
+            {"idx_orders_created_at", "idx_orders_created_id", "idx_orders_type_created", "idx_orders_paid_created"},
+        ),
+    ]
+
+    plans = []
+    # Seeded rows live only inside this transaction; statistics make the planner choose indexes on its own.
+    with psycopg.connect(database_url) as conn:
+        cur = psycopg.ClientCursor(conn)
+        cur.execute(
+            "INSERT INTO users (id, name, phone, password_hash) VALUES (%s, 'Plan', '+70000000999', 'x') ON CONFLICT (id) DO NOTHING",
+            (999_999_001,),
+        )
+        cur.execute(
+            """
+            INSERT INTO orders (id, user_id, order_type, status, effective_status, created_at)
+            SELECT 900000000 + g, 999999001,
+                   CASE WHEN g % 2 = 0 THEN 'delivery' ELSE 'dine_in' END,
+                   CASE WHEN g % 3 = 0 THEN 'served' ELSE 'cancelled' END,
+                   CASE WHEN g % 3 = 0 THEN 'served' ELSE 'cancelled' END,
+                   NOW() - INTERVAL '2 days' - (g % 300) * INTERVAL '1 day' - (g % 1440) * INTERVAL '1 minute'
+            FROM generate_series(1, 30000) AS g
+            """
+        )
+        # Mostly cancelled history keeps every partial index much smaller than the full created_at indexes.
+        cur.execute("UPDATE orders SET cancelled_at = created_at WHERE id > 900000000 AND status = 'cancelled'")
+        cur.execute(
+            """
+            INSERT INTO orders (id, user_id, order_type, status, effective_status, is_delivery_overdue, created_at, cancelled_at)
+            SELECT 900100000 + g, 999999001,
+                   CASE WHEN g % 2 = 0 THEN 'delivery' ELSE 'dine_in' END,
+                   CASE WHEN g <= 10 THEN 'cancelled' ELSE 'preparing' END,
+                   CASE WHEN g <= 10 THEN 'cancelled' ELSE 'preparing' END,
+                   g % 5 = 0 AND g > 10,
+                   NOW() - g * INTERVAL '1 minute',
+                   CASE WHEN g <= 10 THEN NOW() - g * INTERVAL '30 second' END
+            FROM generate_series(1, 40) AS g
+            """
+        )
+        cur.execute("ANALYZE orders")
+
+        def explain(query, params=()):
+            if "FROM orders" not in query and "JOIN orders" not in query:
+                return
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            raw_plan = cur.fetchone()[0]
+            plan = raw_plan if isinstance(raw_plan, list) else json.loads(raw_plan)
+            plans.append((query, plan[0]["Plan"]))
+
+        zero_row = {
+            key: 0
+            for key in (
+                "count",
+                "total_orders",
+                "orders_count",
+                "cancellations",
+                "points_applied",
+                "bonus_earned",
+                "revenue",
+                "dine_in_orders",
+                "delivery_orders",
+                "dine_in_revenue",
+                "delivery_revenue",
+            )
+        }
+        service = AdminService(active_storage="postgres", menu_content=MenuContentStub())
+        monkeypatch.setattr(service, "_refresh_persisted_order_fields", lambda **kwargs: 0)
+        monkeypatch.setattr(service, "_fetch_one", lambda query, params=(): explain(query, params) or dict(zero_row))
+        monkeypatch.setattr(service, "_fetch_all", lambda query, params=(): explain(query, params) or [])
+        monkeypatch.setattr(service, "list_audit_actions", lambda limit=8: [])
+
+        try:
+            with app_module.app.test_request_context("/admin/dashboard"):
+                service.get_dashboard_data()
+            for mode in ("all", "delivery"):
+                service.get_analytics({"period": "7d", "mode": mode})
+        finally:
+            conn.rollback()
+
+    assert plans
+    for query, plan in plans:
+        used = collect_index_names(plan, "orders")
+        normalized_query = " ".join(query.split())
+        matched = [indexes for pattern, indexes in predicate_indexes if re.search(pattern, normalized_query)]
+        assert matched, normalized_query
+        assert "Seq Scan" not in used, normalized_query
+        for indexes in matched:
+            assert used & indexes, (sorted(used), sorted(indexes), normalized_query)
+
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL is not set")
+def test_pg_refresh_active_orders_covers_empty_effective_status(app_module, monkeypatch):
+    psycopg = pytest.importorskip("psycopg")
+    database_url = os.environ["TEST_DATABASE_URL"]
+    monkeypatch.setenv("DATABASE_URL", database_url)
+    pg_store = importlib.import_module("storage.pg_store")
+    monkeypatch.setattr(pg_store, "_SCHEMA_READY", False)
+    pg_store._ensure_schema()
+
+    order_ids = [900200001, 900200002]
+    with psycopg.connect(database_url, autocommit=True) as conn:
+        conn.execute(
+            "INSERT INTO users (id, name, phone, password_hash) VALUES (%s, 'Refresh', '+70000000998', 'x') ON CONFLICT (id) DO NOTHING",
+            (999_999_002,),
+        )
+        try:
+            # An order saved without effective_status and a finished delivery order that is not overdue.
+            conn.execute(
+                """
+                INSERT INTO orders (id, user_id, order_type, status, effective_status, created_at)
+                VALUES
+                    (%s, 999999002, 'dine_in', 'served', '', NOW() - INTERVAL '3 hours'),
+                    (%s, 999999002, 'delivery', 'served', 'served', NOW() - INTERVAL '3 hours')
+                """,
+                tuple(order_ids),
+            )
+
+            assert pg_store.refresh_persisted_order_fields(user_id=999_999_002, active_only=True) == 1
+
+            rows = conn.execute(
+                "SELECT id, effective_status, is_delivery_overdue FROM orders WHERE id = ANY(%s) ORDER BY id",
+                (order_ids,),
+            ).fetchall()
+            assert rows == [(order_ids[0], "served", False), (order_ids[1], "served", False)]
+            assert pg_store.refresh_persisted_order_fields(user_id=999_999_002) == 0
+        finally:
+            conn.execute("DELETE FROM orders WHERE id = ANY(%s)", (order_ids,))
+            conn.execute("DELETE FROM users WHERE id = %s", (999_999_002,))
+
+
+def test_admin_analytics_reads_closed_days_from_daily_rollups(monkeypatch):
+    class MenuContentStub:
+        def load_menu_items_admin(self):
+            return [
+                {"id": 1, "name": "Борщ", "type": "Супы", "price": 450},
+                {"id": 2, "name": "Морс", "type": "Напитки", "price": 150},
+            ]
+
+    service = AdminService(active_storage="postgres", menu_content=MenuContentStub())
+    now = datetime(2026, 10, 19, 15, 30)
+    calls = []
+
+    def fake_fetch_one(query, params=()):
+        calls.append((query, params))
+        if "FROM daily_sales_rollup" in query:
+            return {"total_orders": 10, "orders_count": 9, "cancellations": 1, "revenue": 9000, "dine_in_orders": 9, "dine_in_revenue": 9000}
+        if "COUNT(*) AS total_orders" in query:
+            return {"total_orders": 2, "orders_count": 2, "cancellations": 0, "revenue": 1000, "delivery_orders": 2, "delivery_revenue": 1000}
+        return {"count": 0}
+
+    def fake_fetch_all(query, params=()):
+        calls.append((query, params))
+        if "FROM daily_item_rollup" in query and "SUM(qty_total)" in query:
+            return [{"item_id": 1, "name": "Борщ", "qty_total": 4, "revenue_total": 1800, "price_total": 900, "price_rows": 2}]
+        if "FROM daily_item_rollup" in query:
+            return [{"item_id": 1, "last_sold_at": "2026-10-18T12:00:00"}, {"item_id": 2, "last_sold_at": "2026-09-01T10:00:00"}]
+        if "FROM order_items" in query:
+            return [{"item_id": 1, "name": "Борщ", "qty_total": 1, "revenue_total": 450, "price_total": 450, "price_rows": 1, "last_sold_at": "2026-10-19T10:00:00"}]
+        return []
+
+    monkeypatch.setattr(service, "_fetch_one", fake_fetch_one)
+    monkeypatch.setattr(service, "_fetch_all", fake_fetch_all)
+    monkeypatch.setattr("services.admin_service.current_local_datetime_value", lambda: now)
+
+    analytics = service.get_analytics({"period": "7d", "mode": "all"})
+
+    assert analytics["metrics"]["revenue"] == 10000
+    assert analytics["metrics"]["orders_count"] == 11
+    assert analytics["metrics"]["dine_in_orders"] == 9
+    assert analytics["metrics"]["delivery_orders"] == 2
+    borscht = next(item for item in analytics["full_items"] if item["id"] == 1)
+    assert borscht["qty_total"] == 5
+    assert borscht["revenue_total"] == 2250
+    assert borscht["average_price"] == 450
+    assert borscht["last_sold_at"] == "2026-10-19T10:00:00"
+    assert next(item for item in analytics["full_items"] if item["id"] == 2)["last_sold_at"] == "2026-09-01T10:00:00"
+    today_start = datetime(2026, 10, 19)
+    for query, params in calls:
+        if "FROM orders" in query or "JOIN orders" in query:
+            assert "FROM order_items" not in query or "o.created_at >= %s" in query
+            bounds = [value for value in params if isinstance(value, datetime)]
+            assert bounds
+            if bounds[0].replace(tzinfo=None) >= datetime(2026, 10, 13):
+                assert bounds[0].replace(tzinfo=None) >= today_start
+
+
 def test_menu_content_admin_and_promo_use_memory_cache(tmp_path, monkeypatch):
     service = MenuContentService(
         menu_cache_enabled=False,
@@ -446,6 +887,66 @@ def test_menu_content_admin_and_promo_use_memory_cache(tmp_path, monkeypatch):
     assert calls["promo"] == 1
 
 
+
+def test_menu_content_promo_schedule_switches_at_window_boundaries(monkeypatch):
+    from services.promotions import apply_promotions_to_order, compiled_promotions
+
+    service = MenuContentService(
+        menu_cache_enabled=False,
+        menu_cache_key="menu:test",
+        menu_cache_ttl_seconds=3600,
+        redis_module=None,
+        redis_url="",
+    )
+    always = {"id": 1, "class": "akciya", "name": "Всегда", "priority": 10, "active": True, "condition": "ORDER.SUM >= 1", "reward": "POINTS(10)"}
+    lunch = {
+        "id": 2,
+        "class": "akciya",
+        "name": "Обед",
+        "priority": 20,
+        "active": True,
+        "condition": "ORDER.SUM >= 1",
+        "reward": "POINTS(50)",
+        "start_at": "2026-10-19T12:00:00",
+        "end_at": "2026-10-19T15:00:00",
+    }
+    loads = {"count": 0}
+
+    def fake_disk_promos(include_inactive, allowed_classes):
+        loads["count"] += 1
+        return [dict(always), dict(lunch)] if "akciya" in allowed_classes else []
+
+    clock = {"now": datetime(2026, 10, 19, 11, 59, 59)}
+    monkeypatch.setattr(service, "_load_disk_promo_items", fake_disk_promos)
+    monkeypatch.setattr("services.menu_content.current_local_datetime_value", lambda: clock["now"])
+    menu_items = [{"id": 1, "type": "горячее", "price": 500}]
+    order = {"items": [{"id": 1, "type": "горячее", "price": 500, "qty": 1}]}
+
+    def points():
+        return apply_promotions_to_order(order=order, promo_items=service.load_promo_items(), menu_items=menu_items, at=clock["now"])["awarded_points"]
+
+    compiled_promotions.invalidate()
+    assert [item["id"] for item in service.load_promo_items()] == [1]
+    assert points() == 10
+    builds = compiled_promotions.builds
+    assert points() == 10
+    assert compiled_promotions.builds == builds
+
+    clock["now"] = datetime(2026, 10, 19, 12, 0)
+    assert [item["id"] for item in service.load_promo_items()] == [2, 1]
+    assert service.load_promo_items() is service.load_promo_items()
+    assert points() == 60
+    assert compiled_promotions.builds == builds + 1
+
+    clock["now"] = datetime(2026, 10, 19, 15, 0)
+    assert points() == 60
+    clock["now"] = datetime(2026, 10, 19, 15, 0, 0, 1)
+    assert [item["id"] for item in service.load_promo_items()] == [1]
+    assert points() == 10
+    # The promo list was read from storage once; the windows are applied from the cached schedule.
+    assert loads["count"] == 2
+
+
 def test_auth_session_caches_users_and_bookings_within_request():
     app = Flask(__name__)
     app.secret_key = "test-secret"
@@ -738,6 +1239,75 @@ def test_admin_api_validates_promo_dsl(app_module, client, monkeypatch):
     assert payload["summary"]["reward_kind"] == "POINTS"
 
 
+def test_admin_api_simulates_promo_over_recent_order_carts(app_module, client, monkeypatch):
+    seed_logged_in_session(client)
+    csrf_token = get_csrf_token(client)
+    app_module.admin_service.active_storage = "postgres"
+    monkeypatch.setattr(app_module.admin_service, "is_admin_user", lambda user_id: True)
+    monkeypatch.setattr(
+        app_module.admin_service.menu_content,
+        "load_menu_items_admin",
+        lambda: [
+            {"id": 101, "name": "Закуска", "type": "закуски", "price": 300, "active": True},
+            {"id": 102, "name": "Суп", "type": "супы", "price": 500, "active": True},
+        ],
+    )
+    created_at = app_module.current_time_value().isoformat(timespec="seconds")
+    carts = [
+        {"id": 1, "user_id": 1, "created_at": created_at, "item_ids": [101], "prices": [300], "qtys": [2]},
+        {"id": 2, "user_id": 1, "created_at": created_at, "item_ids": [101], "prices": [300], "qtys": [3]},
+        {"id": 3, "user_id": 2, "created_at": created_at, "item_ids": [102], "prices": [500], "qtys": [1]},
+        {"id": 4, "user_id": 2, "created_at": created_at, "item_ids": [101, 102], "prices": [300, 0], "qtys": [2, 1]},
+    ]
+    pages = []
+
+    def fake_fetch_all(query, params=()):
+        if "array_agg" not in query:
+            return []
+        _since, last_order_id, limit = params
+        pages.append(last_order_id)
+        return [cart for cart in carts if cart["id"] > last_order_id][:limit]
+
+    monkeypatch.setattr(app_module.admin_service, "_fetch_all", fake_fetch_all)
+    monkeypatch.setattr(
+        app_module.admin_service,
+        "simulate_promo_dsl",
+        lambda form: admin_content_management.simulate_promo_dsl(app_module.admin_service, form, chunk_size=3),
+    )
+
+    response = client.post(
+        "/admin/api/promo/simulate",
+        json={
+            "name": "Snack discount",
+            "lore": "Скидка за две закуски",
+            "condition": "ID(101).QTY >= 2",
+            "reward": "DISCOUNT_PERCENT(10)",
+            "limit_per_user_per_day": "1",
+            "active": "0",
+            "days": 7,
+        },
+        headers={"X-CSRF-Token": csrf_token},
+    )
+
+    payload = response.get_json()
+    assert response.status_code == 200
+    assert pages == [0, 3]
+    assert payload["days"] == 7
+    assert payload["simulation"] == {
+        "orders_scanned": 4,
+        "orders_hit": 2,
+        "hit_rate": 0.5,
+        "applications": 2,
+        "discount_total": 120,
+        "avg_discount": 60.0,
+        "points_total": 0,
+        "gift_units": 0,
+        "revenue_total": 2600,
+        "revenue_after_discount": 2480,
+        "revenue_impact_percent": -4.62,
+    }
+
+
 def test_admin_promo_page_renders_dsl_helper(app_module, client, monkeypatch):
     seed_logged_in_session(client)
     app_module.admin_service.active_storage = "postgres"
@@ -1387,6 +1957,88 @@ def test_pg_store_legacy_promotion_rows_normalize_slug_and_photo_path(tmp_path,
     assert rows[0]["photo_path"] == "promo_items/akciya/proydi-opros/photo.webp"
 
 
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL is not set")
+def test_pg_daily_rollups_apply_per_order_deltas(app_module, monkeypatch):
+    from datetime import date
+
+    psycopg = pytest.importorskip("psycopg")
+    database_url = os.environ["TEST_DATABASE_URL"]
+    monkeypatch.setenv("DATABASE_URL", database_url)
+    pg_store = importlib.import_module("storage.pg_store")
+    monkeypatch.setattr(pg_store, "_SCHEMA_READY", False)
+    pg_store._ensure_schema()
+
+    user_id = 999_999_003
+    first_day, second_day = date(2001, 2, 3), date(2001, 2, 4)
+
+    def order(order_id, day, *, status="served", qty=1):
+        return {
+            "id": order_id,
+            "user_id": user_id,
+            "order_type": "dine_in",
+            "status": status,
+            "created_at": f"{day.isoformat()}T12:00:00+00:00",
+            "items_total": 100 * qty,
+            "payable_total": 100 * qty,
+            "bonus_earned": 5,
+            "items": [{"id": 7, "name": "Борщ", "price": 100, "qty": qty}],
+        }
+
+    def rollups(cur):
+        cur.execute(
+            "SELECT sales_date, total_orders, orders_count, cancellations, revenue FROM daily_sales_rollup "
+            "WHERE sales_date IN (%s, %s) ORDER BY sales_date",
+            (first_day, second_day),
+        )
+        sales = cur.fetchall()
+        cur.execute(
+            "SELECT sales_date, item_id, qty_total, price_rows FROM daily_item_rollup "
+            "WHERE sales_date IN (%s, %s) ORDER BY sales_date",
+            (first_day, second_day),
+        )
+        return sales, cur.fetchall()
+
+    with psycopg.connect(database_url, autocommit=True) as conn:
+        conn.execute(
+            "INSERT INTO users (id, name, phone, password_hash) VALUES (%s, 'Rollup', '+70000000997', 'x') ON CONFLICT (id) DO NOTHING",
+            (user_id,),
+        )
+        conn.execute("DELETE FROM daily_sales_rollup WHERE sales_date IN (%s, %s)", (first_day, second_day))
+        conn.execute("DELETE FROM daily_item_rollup WHERE sales_date IN (%s, %s)", (first_day, second_day))
+        created_ids = []
+        try:
+            # A full rewrite replaces every order in the database, so it runs in a transaction that is rolled back.
+            with conn.transaction(force_rollback=True), conn.cursor() as cur:
+                pg_store._replace_orders_in_tx(cur, [order(900300001, first_day), order(900300002, first_day), order(900300003, second_day)])
+                assert rollups(cur) == (
+                    [(first_day, 2, 2, 0, 200), (second_day, 1, 1, 0, 100)],
+                    [(first_day, 7, 2, 2), (second_day, 7, 1, 1)],
+                )
+
+                # Order 3 is pruned by retention, order 2 is cancelled and order 1 changes quantity.
+                cur.execute("DELETE FROM orders WHERE id = %s", (900300003,))
+                pg_store._replace_orders_in_tx(cur, [order(900300001, first_day, qty=3), order(900300002, first_day, status="cancelled")])
+                assert rollups(cur) == (
+                    [(first_day, 2, 1, 1, 300), (second_day, 1, 1, 0, 100)],
+                    [(first_day, 7, 3, 1), (second_day, 7, 1, 1)],
+                )
+
+            created = pg_store.create_order(order(0, second_day, qty=2))
+            created_ids.append(created["id"])
+            assert rollups(conn.cursor()) == ([(second_day, 1, 1, 0, 200)], [(second_day, 7, 2, 1)])
+
+            assert pg_store.set_order_status(created["id"], status="cancelled") is True
+            assert rollups(conn.cursor()) == ([(second_day, 1, 0, 1, 0)], [])
+            assert pg_store.set_order_status(created["id"], status="served") is True
+            assert rollups(conn.cursor()) == ([(second_day, 1, 1, 0, 200)], [(second_day, 7, 2, 1)])
+            assert pg_store.set_order_status(900300999, status="served") is False
+        finally:
+            conn.execute("DELETE FROM orders WHERE id = ANY(%s)", (created_ids,))
+            conn.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.execute("DELETE FROM daily_sales_rollup WHERE sales_date IN (%s, %s)", (first_day, second_day))
+            conn.execute("DELETE FROM daily_item_rollup WHERE sales_date IN (%s, %s)", (first_day, second_day))
+
+
 def test_pg_schema_normalizes_user_cards_created_at_text_column(app_module):
     pg_store = importlib.import_module("storage.pg_store")
 
@@ -1568,3 +2220,47 @@ def test_promo_content_db_read_failure_does_not_fallback_to_disk(monkeypatch):
         service.load_promotions_from_db()
 
     assert disk_calls["count"] == 0
+
+
+def test_popular_items_serves_stale_value_while_refreshing_in_background(monkeypatch):
+    service = AdminService(active_storage="postgres", menu_content=None, popular_items_ttl_seconds=60)
+    loads = []
+
+    def fake_load(period):
+        loads.append(period)
+        return [{"id": len(loads), "qty_total": 10}]
+
+    monkeypatch.setattr(service, "_load_popular_items", fake_load)
+
+    assert service.popular_items("30d") == [{"id": 1, "qty_total": 10}]
+    assert service.popular_items("30d") == [{"id": 1, "qty_total": 10}]
+    assert loads == ["30d"]
+
+    expires_at, items = service._popular_items_cache["30d"]
+    service._popular_items_cache["30d"] = (expires_at - 120, items)
+    assert service.popular_items("30d") == [{"id": 1, "qty_total": 10}]
+    deadline = time.monotonic() + 2
+    while service._popular_items_refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert loads == ["30d", "30d"]
+    assert service.popular_items("30d") == [{"id": 2, "qty_total": 10}]
+
+
+def test_popular_items_query_reads_rollups_and_today_only(monkeypatch):
+    service = AdminService(active_storage="postgres", menu_content=None)
+    calls = []
+
+    def fake_fetch_all(query, params=()):
+        calls.append((query, params))
+        if "FROM daily_item_rollup" in query:
+            return [{"item_id": 1, "qty_total": 3}, {"item_id": 2, "qty_total": 5}]
+        return [{"item_id": 1, "qty_total": 4}]
+
+    monkeypatch.setattr(service, "_fetch_all", fake_fetch_all)
+    monkeypatch.setattr("services.admin_service.current_local_datetime_value", lambda: datetime(2026, 10, 19, 12, 0))
+
+    assert service._load_popular_items("30d") == [{"id": 1, "qty_total": 7}, {"id": 2, "qty_total": 5}]
+    raw_query, raw_params = calls[-1]
+    assert "FROM order_items" in raw_query
+    assert raw_params[0].replace(tzinfo=None) == datetime(2026, 10, 19)
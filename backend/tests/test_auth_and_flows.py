@@ -2,9 +2,12 @@ import hashlib
 import importlib
 import json
 import sys
+import time
 from datetime import datetime, timedelta
 from urllib.parse import parse_qs, urlparse
 
+import pytest
+
 from conftest import BACKEND_DIR, write_json
 
 
@@ -192,6 +195,584 @@ def test_debug_storage_requires_admin_when_enabled(app_module, client):
     assert response.get_json()["ok"] is False
 
 
+def test_db_operations_are_timed_and_exposed_in_server_timing(app_module, monkeypatch):
+    from flask import Response
+
+    from storage import pg_store, query_metrics
+
+    query_metrics.reset()
+    monkeypatch.setattr(pg_store, "DB_RETRY_DELAY_SECONDS", 0)
+    monkeypatch.setattr(pg_store, "_reset_conn", lambda: None)
+    attempts = []
+
+    def flaky_operation():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("connection dropped")
+        return [{"id": 1}, {"id": 2}]
+
+    with app_module.app.test_request_context("/"):
+        app_module.start_request_timer()
+        assert pg_store._run_db_operation(flaky_operation, "load_orders") == [{"id": 1}, {"id": 2}]
+        response = app_module.append_server_timing_headers(Response())
+
+    server_timing = response.headers["Server-Timing"]
+    assert server_timing.startswith("app;dur=")
+    assert 'db;dur=' in server_timing
+    assert "db-load_orders;dur=" in server_timing
+    stats = next(item for item in query_metrics.snapshot()["operations"] if item["name"] == "load_orders")
+    assert stats["count"] == 1
+    assert stats["rows_total"] == 2
+    assert stats["retries_total"] == 1
+    assert sum(stats["histogram"].values()) == 1
+
+
+def test_slow_db_operation_logs_params_shape_without_values(monkeypatch, capsys):
+    from storage import query_metrics
+
+    monkeypatch.setattr(query_metrics, "DB_SLOW_QUERY_MS", 1)
+    with query_metrics.track_operation("admin.orders"):
+        query_metrics.note_query("SELECT * FROM orders WHERE user_id = %s AND phone = %s", (42, "+79990001122"))
+        time.sleep(0.01)
+
+    output = capsys.readouterr().out
+    assert "[db-slow] admin.orders" in output
+    assert "params=(int, str[12])" in output
+    assert "+79990001122" not in output
+
+
+def test_pg_cursor_notes_statements_for_the_slow_log(monkeypatch, capsys):
+    import psycopg
+
+    from storage import pg_store, query_metrics
+
+    monkeypatch.setattr(query_metrics, "DB_SLOW_QUERY_MS", 1)
+    monkeypatch.setattr(psycopg.Cursor, "execute", lambda self, query, params=None, **kwargs: self)
+    cur = object.__new__(pg_store._MetricsCursor)
+    with query_metrics.track_operation("load_menu_items"):
+        cur.execute("SELECT id, name FROM menu_items WHERE id = ANY(%s)", ([1, 2],))
+        time.sleep(0.01)
+
+    output = capsys.readouterr().out
+    assert "[db-slow] load_menu_items" in output
+    assert "params=([int, int])" in output
+    assert "query=SELECT id, name FROM menu_items WHERE id = ANY(%s)" in output
+
+
+def test_server_timing_db_total_skips_nested_operations(monkeypatch):
+    from storage import query_metrics
+
+    clock = {"now": 0.0}
+    monkeypatch.setattr(query_metrics.time, "perf_counter", lambda: clock["now"])
+    query_metrics.begin_request()
+    with query_metrics.track_operation("admin.orders"):
+        with query_metrics.track_operation("refresh_persisted_order_fields"):
+            clock["now"] += 0.03
+        clock["now"] += 0.01
+    timings = query_metrics.server_timing_entries(query_metrics.end_request())
+
+    assert timings[0].startswith("db;dur=40.0;")
+    assert query_metrics.infer_rows({"id": 1}) is None
+    assert query_metrics.infer_rows(3) is None
+    assert query_metrics.infer_rows([{"id": 1}]) == 1
+
+
+def test_order_status_stream_pushes_phase_changes_without_reloading_orders():
+    from services.order_status_stream import OrderStatusStream
+
+    clock = {"now": 0.0}
+    base = datetime(2026, 10, 19, 12, 0, 0)
+    versions = {5: 0}
+    loads = []
+    sleeps = []
+
+    def load_orders(user_id):
+        loads.append((user_id, clock["now"]))
+        return [{"id": 7, "cancelled": versions[user_id] > 0}]
+
+    def statuses_for(orders):
+        # Phases come from the loaded orders and the clock, like the compiled order timeline.
+        if orders[0]["cancelled"]:
+            return []
+        if clock["now"] < 30:
+            return [{"order_id": 7, "phase": "cooking", "phase_ends_at": (base + timedelta(seconds=30)).isoformat()}]
+        return [{"order_id": 7, "phase": "courier_sent", "phase_ends_at": (base + timedelta(seconds=90)).isoformat()}]
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock["now"] += seconds
+        if clock["now"] >= 60:
+            versions[5] = 1
+
+    stream = OrderStatusStream(
+        load_orders=load_orders,
+        statuses_for=statuses_for,
+        version=versions.get,
+        heartbeat_seconds=20,
+        reload_seconds=300,
+        max_stream_seconds=85,
+        sleep=sleep,
+        monotonic=lambda: clock["now"],
+        now=lambda: base + timedelta(seconds=clock["now"]),
+    )
+
+    chunks = list(stream.events(5))
+
+    assert chunks[0].startswith("retry: ")
+    events = [chunk for chunk in chunks if chunk.startswith("id: ")]
+    assert len(events) == 3
+    assert '"phase":"cooking"' in events[0]
+    assert '"phase":"courier_sent"' in events[1]
+    assert '"order_statuses":[]' in events[2]
+    assert ": ping\n\n" in chunks
+    # The phase change came from the loaded orders; only the version bump read the storage again.
+    assert [user_id for user_id, _at in loads] == [5, 5]
+    assert 60 <= loads[1][1] <= 80
+    assert max(sleeps) <= 20
+
+
+def test_order_status_stream_resumes_from_last_event_id():
+    from services.order_status_stream import OrderStatusStream, status_event_id
+
+    clock = {"now": 0.0}
+    statuses = [{"order_id": 3, "phase": "waiting", "phase_ends_at": "2026-10-19T12:10:00"}]
+
+    def sleep(seconds):
+        clock["now"] += seconds
+
+    stream = OrderStatusStream(
+        load_orders=lambda user_id: [],
+        statuses_for=lambda orders: statuses,
+        max_stream_seconds=5,
+        sleep=sleep,
+        monotonic=lambda: clock["now"],
+        now=lambda: datetime(2026, 10, 19, 12, 0, 0),
+    )
+
+    chunks = list(stream.events(1, last_event_id=status_event_id(statuses)))
+
+    assert not [chunk for chunk in chunks if chunk.startswith("id: ")]
+
+
+def test_order_status_stream_route_requires_login_and_caps_open_streams(app_module, client):
+    assert client.get("/api/order-statuses/stream").status_code == 401
+
+    with client.session_transaction() as session_state:
+        session_state["user_id"] = 1
+    stream = app_module.order_status_stream
+    acquired = 0
+    while stream.try_acquire():
+        acquired += 1
+    try:
+        response = client.get("/api/order-statuses/stream")
+        assert response.status_code == 503
+        assert response.headers.get("Retry-After")
+    finally:
+        for _ in range(acquired):
+            stream.release()
+
+    response = client.get("/api/order-statuses/stream")
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert stream.open_streams == 1
+    response.close()
+    assert stream.open_streams == 0
+
+
+def test_order_status_stream_leaves_threads_for_other_requests(app_module, monkeypatch):
+    import http.client
+    import threading
+
+    from werkzeug.serving import make_server
+
+    stream = app_module.order_status_stream
+    monkeypatch.setattr(stream, "load_orders", lambda user_id: [])
+    # A short-lived stream, so its handler thread finishes soon after the test.
+    monkeypatch.setattr(stream, "max_stream_seconds", 2)
+    session_cookie = app_module.app.session_interface.get_signing_serializer(app_module.app).dumps({"user_id": 1})
+    cookie_header = f"{app_module.app.config.get('SESSION_COOKIE_NAME', 'session')}={session_cookie}"
+
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    stream_connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+    try:
+        stream_connection.request("GET", "/api/order-statuses/stream", headers={"Cookie": cookie_header})
+        stream_response = stream_connection.getresponse()
+        assert stream_response.status == 200
+        assert stream_response.readline().startswith(b"retry: ")
+        assert stream.open_streams == 1
+
+        other_connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+        try:
+            other_connection.request("GET", "/login")
+            other_response = other_connection.getresponse()
+            other_response.read()
+            assert other_response.status == 200
+        finally:
+            other_connection.close()
+        assert stream.open_streams == 1
+    finally:
+        stream_connection.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_order_status_stream_capacity_keeps_threads_free():
+    import runpy
+
+    from services.order_status_stream import OrderStatusStream, stream_capacity_value
+
+    assert stream_capacity_value(50, 8) == 6
+    assert stream_capacity_value(3, 8) == 3
+    assert stream_capacity_value(50, 2) == 0
+    assert not OrderStatusStream(load_orders=lambda user_id: [], statuses_for=list, max_streams=0).try_acquire()
+
+    gunicorn_settings = runpy.run_path(str(BACKEND_DIR / "gunicorn.conf.py"))
+    assert gunicorn_settings["worker_class"] == "gthread"
+    assert stream_capacity_value(50, gunicorn_settings["threads"]) < gunicorn_settings["threads"]
+
+
+def test_order_timeline_bisect_matches_phase_boundaries(app_module):
+    from services.business_logic import compile_order_timeline_value, order_statuses_at_value
+
+    created_at = datetime(2026, 10, 19, 12, 0, 0)
+    delivery = {"id": 1, "order_type": "delivery", "created_at": created_at.isoformat(), "delivery_eta_minutes": 30}
+    dine_in = {"id": 2, "order_type": "dine_in", "created_at": created_at.isoformat()}
+    timeline = compile_order_timeline_value(delivery, app_module.ORDER_STATUS_STEPS, app_module.parse_iso_datetime_value)
+
+    assert timeline.keys == ["cooking", "courier_sent", "delivering", "delivered"]
+    for offset, phase in ((0, "cooking"), (899, "cooking"), (900, "courier_sent"), (960, "delivering"), (1800, "delivered")):
+        statuses = order_statuses_at_value(
+            [delivery, dine_in, "broken"],
+            created_at + timedelta(seconds=offset),
+            app_module.ORDER_STATUS_STEPS,
+            app_module.parse_iso_datetime_value,
+        )
+        assert statuses[0]["phase"] == phase
+        assert statuses[2] is None
+    assert timeline.status_at(timeline.cycle_end) is None
+
+
+def test_persisted_order_timeline_matches_compiled_statuses(app_module):
+    steps = app_module.ORDER_STATUS_STEPS
+    created_at = datetime(2026, 10, 19, 12, 0, 0)
+    order = {
+        "id": 5,
+        "order_type": "dine_in",
+        "created_at": created_at.isoformat(),
+        "booking": {"table_id": 3, "date": "2026-10-19", "time": "13:00"},
+        "serving": {"mode": "time", "time": "13:30"},
+    }
+    persisted = {
+        **order,
+        "status_timeline": json.loads(
+            json.dumps(app_module.compile_order_timeline_value(order, steps, app_module.parse_iso_datetime_value).to_payload())
+        ),
+    }
+    stale = {**order, "status_timeline": {**persisted["status_timeline"], "steps": "preparing:1"}}
+
+    for offset in range(0, 6 * 3600, 97):
+        now = created_at + timedelta(seconds=offset)
+        expected = app_module.build_order_status_timeline_value(order, now, steps, app_module.parse_iso_datetime_value)
+        assert app_module.build_order_status_timeline_value(persisted, now, steps, app_module.parse_iso_datetime_value) == expected
+        assert app_module.build_order_status_timeline_value(stale, now, steps, app_module.parse_iso_datetime_value) == expected
+
+
+def test_create_order_persists_compiled_status_timeline(app_module):
+    order = app_module.create_order(
+        {
+            "user_id": 1,
+            "order_type": "delivery",
+            "status": "preparing",
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "items": [],
+            "delivery_eta_minutes": 25,
+        }
+    )
+
+    stored = read_json(app_module.ORDERS_PATH)[-1]
+    assert stored["id"] == order["id"]
+    assert stored["status_timeline"]["flow"] == "delivery"
+    assert stored["status_timeline"]["keys"][0] == "cooking"
+
+
+def test_index_builds_user_activity_once_per_request(app_module, client, monkeypatch):
+    user = build_user(app_module, balance=0)
+    write_json(app_module.USERS_PATH, [user])
+    write_json(
+        app_module.ORDERS_PATH,
+        [
+            {
+                "id": 1,
+                "user_id": user["id"],
+                "order_type": "delivery",
+                "status": "preparing",
+                "created_at": app_module.current_time_value().isoformat(timespec="seconds"),
+                "items": [],
+                "delivery_eta_minutes": 30,
+            }
+        ],
+    )
+    csrf_token = get_csrf_token(client)
+    client.post(
+        "/login",
+        data={"csrf_token": csrf_token, "phone": user["phone"], "password": "1234"},
+    )
+    calls = {"bookings": 0, "orders": 0, "statuses": 0}
+    original_list_user_bookings = app_module.list_user_bookings
+    original_load_orders = app_module.load_orders
+    original_order_statuses_at = app_module.order_statuses_at
+
+    def counted(key, fn):
+        def wrapper(*args, **kwargs):
+            calls[key] += 1
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+    monkeypatch.setattr(app_module, "list_user_bookings", counted("bookings", original_list_user_bookings))
+    monkeypatch.setattr(app_module, "load_orders", counted("orders", original_load_orders))
+    monkeypatch.setattr(app_module, "order_statuses_at", counted("statuses", original_order_statuses_at))
+
+    response = client.get("/")
+
+    assert response.status_code == 200
+    assert calls == {"bookings": 1, "orders": 1, "statuses": 1}
+    with app_module.app.test_request_context("/"):
+        activity = app_module.get_request_activity(user["id"])
+        assert app_module.get_request_activity(user["id"]) is activity
+    assert activity["order_statuses"][0]["phase"] == "cooking"
+    assert activity["preparing_orders"][0]["status_title"] == "Готовим заказ"
+
+
+def test_promo_usage_counter_loads_orders_once_and_counts_writes_through(app_module):
+    from services.promo_usage import PromoUsageCounter
+
+    class FakeRedis:
+        def __init__(self):
+            self.hashes = {}
+
+        def hgetall(self, key):
+            return {field: str(value) for field, value in self.hashes.get(key, {}).items()}
+
+        def hset(self, key, mapping):
+            self.hashes.setdefault(key, {}).update(mapping)
+
+        def expire(self, key, seconds):
+            return True
+
+        def exists(self, key):
+            return key in self.hashes
+
+        def hincrby(self, key, field, amount):
+            self.hashes[key][field] = int(self.hashes[key].get(field, 0)) + amount
+
+        def pipeline(self):
+            return self
+
+        def execute(self):
+            return []
+
+    created_at = app_module.current_time_value().isoformat(timespec="seconds")
+    orders = [
+        {"id": 1, "user_id": 7, "created_at": created_at, "promotions_applied": [{"promo_id": 501, "applied_count": 1}]},
+        {"id": 2, "user_id": 7, "created_at": "2020-01-01T10:00:00", "promotions_applied": [{"promo_id": 501, "applied_count": 3}]},
+    ]
+    loads = []
+    redis = FakeRedis()
+
+    def load_user_orders(user_id):
+        loads.append(user_id)
+        return orders
+
+    counter = PromoUsageCounter(load_user_orders=load_user_orders, redis_client_fn=lambda: redis)
+    assert counter.counts(user_id=7) == {501: 1}
+    assert counter.counts(user_id=7) == {501: 1}
+    assert loads == [7]
+
+    saved = []
+    counter.save_applications(
+        lambda **kwargs: saved.append(kwargs["order_id"]),
+        order_id=3,
+        user_id=7,
+        applied_promotions=[{"promo_id": 501, "applied_count": 1}, {"promo_id": 502, "applied_count": 2}],
+        applied_at=datetime.fromisoformat(created_at),
+    )
+    assert saved == [3]
+    assert counter.counts(user_id=7) == {501: 2, 502: 2}
+
+    other_worker = PromoUsageCounter(load_user_orders=load_user_orders, redis_client_fn=lambda: redis)
+    assert other_worker.counts(user_id=7) == {501: 2, 502: 2}
+    assert loads == [7]
+
+    counter.record(user_id=7, applied_promotions=[{"promo_id": 501, "applied_count": 1}], applied_at=datetime.fromisoformat(created_at))
+    assert other_worker.counts(user_id=7) == {501: 3, 502: 2}
+    assert loads == [7]
+
+
+def test_promo_usage_fresh_counts_see_other_workers_applications():
+    from services.promo_usage import PromoUsageCounter
+
+    stored = {}
+
+    def load_counts(user_id):
+        return dict(stored)
+
+    def save(**kwargs):
+        for applied in kwargs["applied_promotions"]:
+            stored[applied["promo_id"]] = stored.get(applied["promo_id"], 0) + applied["applied_count"]
+
+    first_worker = PromoUsageCounter(load_counts=load_counts)
+    second_worker = PromoUsageCounter(load_counts=load_counts)
+    assert second_worker.counts(user_id=7) == {}
+
+    first_worker.save_applications(save, order_id=1, user_id=7, applied_promotions=[{"promo_id": 501, "applied_count": 1}])
+
+    # Previews may use the per-process entry; payment reads the origin.
+    assert second_worker.counts(user_id=7) == {}
+    assert second_worker.fresh_counts(user_id=7) == {501: 1}
+    assert second_worker.counts(user_id=7) == {501: 1}
+
+
+def test_order_status_batch_caches_only_the_requested_ids():
+    from services.order_status_batch import OrderStatusBatch
+
+    clock = {"now": 0.0}
+    loads = []
+
+    def load_user_orders(user_id, order_ids):
+        loads.append(order_ids)
+        return [{"id": order_id, "user_id": user_id, "status": "served"} for order_id in order_ids]
+
+    batch = OrderStatusBatch(
+        load_user_orders=load_user_orders,
+        statuses_at=lambda orders, now: [None] * len(orders),
+        ttl_seconds=10,
+        monotonic=lambda: clock["now"],
+    )
+    for start in range(0, 100, 50):
+        batch.snapshot(7, list(range(start + 1, start + 51)))
+    batch.snapshot(7, [51, 52])
+
+    assert [len(order_ids) for order_ids in loads] == [50, 50]
+    assert len(batch._orders[7][2]) == 50
+
+    batch.snapshot(8, [1])
+    clock["now"] = 11.0
+    batch.snapshot(7, [1])
+    assert loads[-1] == [1]
+    assert list(batch._orders) == [7]
+
+
+def test_batch_order_status_api_answers_304_until_user_version_changes(app_module, client, monkeypatch):
+    user = build_user(app_module)
+    write_json(app_module.USERS_PATH, [user])
+    created_at = app_module.current_time_value().isoformat(timespec="seconds")
+    write_json(
+        app_module.ORDERS_PATH,
+        [
+            {"id": 1, "user_id": user["id"], "order_type": "delivery", "status": "preparing", "created_at": created_at, "items": [], "delivery_eta_minutes": 30},
+            {"id": 2, "user_id": 2, "order_type": "delivery", "status": "preparing", "created_at": created_at, "items": []},
+        ],
+    )
+    assert client.get("/api/orders/status?ids=1").status_code == 401
+    csrf_token = get_csrf_token(client)
+    client.post("/login", data={"csrf_token": csrf_token, "phone": user["phone"], "password": "1234"})
+    assert client.get("/api/orders/status?ids=1,abc").status_code == 400
+    assert client.get("/api/orders/status").status_code == 400
+
+    loads = []
+    original_load = app_module.storage.list_user_orders_by_ids
+    monkeypatch.setattr(
+        app_module.storage.order_status_batch,
+        "load_user_orders",
+        lambda user_id, order_ids: loads.append(order_ids) or original_load(user_id, order_ids),
+    )
+
+    response = client.get("/api/orders/status?ids=1,2")
+    payload = response.get_json()
+    assert response.status_code == 200
+    assert payload["fields"] == ["order_id", "status", "phase", "phase_ends_at", "cycle_ends_at"]
+    assert payload["orders"][0][:3] == [1, "cooking", "cooking"]
+    assert payload["missing"] == [2]
+    etag = response.headers["ETag"]
+
+    repeat = client.get("/api/orders/status?ids=1,2", headers={"If-None-Match": etag})
+    assert repeat.status_code == 304
+    assert client.get("/api/orders/status?ids=2,1", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/orders/status?ids=1", headers={"If-None-Match": etag}).status_code == 200
+    assert loads == [[1, 2]]
+
+    app_module.storage.invalidate_user_notifications(user["id"])
+    changed = client.get("/api/orders/status?ids=1,2", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.get_json()["version"] == payload["version"] + 1
+    assert len(loads) == 2
+
+
+def test_order_timeline_active_until_matches_listed_statuses(app_module):
+    created_at = datetime(2026, 10, 19, 12, 0, 0)
+    order = {"id": 1, "order_type": "delivery", "created_at": created_at.isoformat(), "delivery_eta_minutes": 25}
+    timeline = app_module.compile_order_timeline_value(order, app_module.ORDER_STATUS_STEPS, app_module.parse_iso_datetime_value)
+    active_until = timeline.active_until()
+
+    assert timeline.status_at(active_until - 1)["phase"] == "delivering"
+    assert timeline.status_at(active_until)["phase"] == "delivered"
+
+
+def test_notifications_count_is_cached_per_user_and_invalidated_by_writes(app_module, monkeypatch):
+    storage = app_module.storage
+    monkeypatch.setattr(storage, "notifications_count_ttl_seconds", 60)
+    storage.invalidate_user_notifications()
+    now = app_module.current_time_value()
+    write_json(
+        app_module.ORDERS_PATH,
+        [
+            {"id": 1, "user_id": 1, "order_type": "delivery", "status": "preparing", "created_at": now.isoformat(timespec="seconds"), "items": []},
+            {"id": 2, "user_id": 1, "order_type": "delivery", "status": "cancelled", "created_at": now.isoformat(timespec="seconds"), "items": []},
+            {"id": 3, "user_id": 2, "order_type": "delivery", "status": "preparing", "created_at": now.isoformat(timespec="seconds"), "items": []},
+        ],
+    )
+    load_calls = []
+    original_load_orders = storage.load_orders
+
+    def load_orders():
+        load_calls.append(1)
+        return original_load_orders()
+
+    monkeypatch.setattr(storage, "load_orders", load_orders)
+
+    assert storage.count_user_notifications(1) == {"bookings": 0, "orders": 1}
+    assert storage.count_user_notifications(1) == {"bookings": 0, "orders": 1}
+    assert len(load_calls) == 1
+
+    storage.create_order({"user_id": 1, "order_type": "delivery", "status": "preparing", "created_at": now.isoformat(timespec="seconds"), "items": []})
+
+    assert storage.count_user_notifications(1) == {"bookings": 0, "orders": 2}
+
+
+def test_notifications_badge_uses_count_query_without_hydrating_activity(app_module):
+    from flask import session
+
+    auth_session = app_module.auth_session
+    calls = []
+    original_build = auth_session.build_user_activity
+    original_count = auth_session.count_user_notifications
+    auth_session.build_user_activity = lambda user_id: calls.append("activity") or {"bookings": [], "preparing_orders": [], "order_statuses": []}
+    auth_session.count_user_notifications = lambda user_id: calls.append("count") or {"bookings": 2, "orders": 1}
+    try:
+        with app_module.app.test_request_context("/"):
+            session["user_id"] = 1
+            assert auth_session.get_request_notifications_count() == 3
+            assert auth_session.get_request_notifications_count() == 3
+    finally:
+        auth_session.build_user_activity = original_build
+        auth_session.count_user_notifications = original_count
+
+    assert calls == ["count"]
+
+
 def test_user_agreement_page_renders_current_document(client):
     response = client.get("/user-agreement")
     html = response.get_data(as_text=True)
@@ -265,23 +846,22 @@ def test_popular_items_fill_up_to_limit_with_random_fallback(app_module):
         for item_id in range(1, 13)
     ]
 
-    def get_popular_analytics(_filters):
-        return {
-            "top_qty_items": [
-                {"id": 2},
-                {"id": 5},
-                {"id": 9},
-            ]
-        }
+    def get_popular_items(period):
+        assert period == "30d"
+        return [
+            {"id": 2, "qty_total": 12},
+            {"id": 5, "qty_total": 7},
+            {"id": 9, "qty_total": 3},
+        ]
 
-    selected = _pick_popular_items_from_analytics(get_popular_analytics, items, 10)
+    selected = _pick_popular_items_from_analytics(get_popular_items, items, 10)
 
     assert len(selected) == 10
     assert [item["id"] for item in selected[:3]] == [2, 5, 9]
     assert len({item["id"] for item in selected}) == 10
 
 
-def test_menu_popularity_uses_analytics_ranking_for_all_items(app_module):
+def test_menu_popularity_uses_sales_ranking_for_all_items(app_module):
     from routes.menu_routes import _attach_menu_popularity
 
     items = [
@@ -290,16 +870,14 @@ def test_menu_popularity_uses_analytics_ranking_for_all_items(app_module):
         {"id": 3, "name": "Блюдо 3", "popularity": 0},
     ]
 
-    def get_popular_analytics(_filters):
-        return {
-            "full_items": [
-                {"id": 3, "qty_total": 17},
-                {"id": 1, "qty_total": 4},
-                {"id": 2, "qty_total": 9},
-            ]
-        }
+    def get_popular_items(_period):
+        return [
+            {"id": 3, "qty_total": 17},
+            {"id": 2, "qty_total": 9},
+            {"id": 1, "qty_total": 4},
+        ]
 
-    enriched = _attach_menu_popularity(items, get_popular_analytics)
+    enriched = _attach_menu_popularity(items, get_popular_items)
 
     assert [item["popularity_sort"] for item in enriched] == [4, 9, 17]
 
@@ -606,6 +1184,206 @@ def test_order_totals_helper_reuses_same_rules_for_points_and_delivery(app_modul
     assert fully_paid["bonus_earned"] == 0
 
 
+def test_availability_day_bitmap_is_cached_and_invalidated_by_bookings(app_module, client, monkeypatch):
+    user = build_user(app_module)
+    write_json(app_module.USERS_PATH, [user])
+    csrf_token = get_csrf_token(client)
+    client.post("/login", data={"csrf_token": csrf_token, "phone": user["phone"], "password": "1234"})
+
+    booking_date = (datetime.now() + timedelta(days=2)).strftime("%Y-%m-%d")
+    response = client.post(
+        "/book",
+        json={"table_id": 2, "date": booking_date, "time": "12:10", "name": user["name"]},
+        headers={"X-CSRF-Token": csrf_token},
+    )
+    assert response.get_json()["ok"] is True
+
+    loads = []
+    original_load = app_module.storage._load_bookings_between
+    monkeypatch.setattr(
+        app_module.storage.table_availability,
+        "load_bookings_between",
+        lambda start, end: loads.append((start, end)) or original_load(start, end),
+    )
+
+    day_payload = client.get(f"/availability/day?date={booking_date}").get_json()
+    assert day_payload["slot_minutes"] == 15
+    assert day_payload["slots"] == 96
+    # 11:15 .. 13:00 are the slot starts whose hour overlaps 12:10-13:10.
+    assert int(day_payload["reserved"]["2"], 16) == sum(1 << slot for slot in range(45, 53))
+    assert day_payload["reserved"]["1"] == "0"
+
+    assert client.get(f"/availability?date={booking_date}&time=11:00").get_json()["reserved"] == []
+    assert client.get(f"/availability?date={booking_date}&time=11:15").get_json()["reserved"] == [2]
+    assert client.get(f"/availability?date={booking_date}&time=13:05").get_json()["reserved"] == [2]
+    assert client.get(f"/availability?date={booking_date}&time=13:10").get_json()["reserved"] == []
+    assert len(loads) == 1
+
+    client.post(
+        "/bookings/cancel",
+        data={"csrf_token": csrf_token, "table_id": 2, "date": booking_date, "time": "12:10"},
+    )
+    assert client.get(f"/availability?date={booking_date}&time=12:00").get_json()["reserved"] == []
+    assert len(loads) == 2
+
+    assert client.get("/availability/day?date=bad").status_code == 400
+
+
+def test_availability_day_matrix_supports_rle_and_conditional_get(app_module, client):
+    booking_date = (datetime.now() + timedelta(days=3)).strftime("%Y-%m-%d")
+    write_json(
+        app_module.BOOKINGS_PATH,
+        [
+            {"user_id": 1, "table_id": 3, "date": booking_date, "time": "18:00", "name": "Тест", "created_at": ""},
+            {"user_id": 1, "table_id": 3, "date": booking_date, "time": "19:30", "name": "Тест", "created_at": ""},
+        ],
+    )
+
+    response = client.get(f"/availability/day?date={booking_date}&encoding=rle")
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload["encoding"] == "rle"
+    assert payload["duration_minutes"] == app_module.BOOKING_DURATION_MINUTES
+    assert payload["reserved"]["3"] == [[69, 13]]
+    assert payload["reserved"]["1"] == []
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    not_modified = client.get(
+        f"/availability/day?date={booking_date}&encoding=rle",
+        headers={"If-None-Match": etag},
+    )
+    assert not_modified.status_code == 304
+    assert not_modified.get_data() == b""
+
+    bitset = client.get(f"/availability/day?date={booking_date}", headers={"If-None-Match": etag})
+    assert bitset.status_code == 200
+    assert bitset.headers["ETag"] != etag
+
+    app_module.storage.invalidate_table_availability()
+    write_json(app_module.BOOKINGS_PATH, [])
+    changed = client.get(
+        f"/availability/day?date={booking_date}&encoding=rle",
+        headers={"If-None-Match": etag},
+    )
+    assert changed.status_code == 200
+    assert changed.get_json()["reserved"]["3"] == []
+    assert client.get(f"/availability/day?date={booking_date}&encoding=csv").status_code == 400
+
+
+def test_json_booking_index_checks_overlaps_without_reparsing_bookings(app_module, client, monkeypatch):
+    storage = app_module.storage
+    booking_date = (datetime.now() + timedelta(days=4)).strftime("%Y-%m-%d")
+    write_json(
+        app_module.BOOKINGS_PATH,
+        [
+            {"user_id": 9, "table_id": 5, "date": booking_date, "time": f"{hour:02d}:00", "name": "Гость", "created_at": ""}
+            for hour in range(9, 21, 2)
+        ],
+    )
+    parse_calls = []
+    original_parse = storage.parse_datetime_fn
+    monkeypatch.setattr(storage, "parse_datetime_fn", lambda *args: parse_calls.append(args) or original_parse(*args))
+
+    def book(time_str, user_id=1):
+        return storage.create_booking_if_available(
+            user_id=user_id, table_id=5, date_str=booking_date, time_str=time_str, name="Тест", created_at=""
+        )
+
+    assert book("10:30") is False
+    parse_calls.clear()
+    assert book("10:00") is True
+    assert book("10:59") is False
+    assert book("21:00") is True
+    assert len(parse_calls) == 3
+    assert [entry["time"] for entry in read_json(app_module.BOOKINGS_PATH)][-2:] == ["10:00", "21:00"]
+
+    assert storage.cancel_user_booking(user_id=1, table_id=5, date_str=booking_date, time_str="10:00") is True
+    assert book("10:00", user_id=2) is True
+    assert book("20:30") is False
+
+    write_json(app_module.BOOKINGS_PATH, [])
+    assert book("20:30") is True
+
+
+def test_housekeeping_runs_jobs_only_on_leader_and_records_metrics(tmp_path):
+    from services.housekeeping import FileLeaderLock, HousekeepingService
+
+    first_lock = FileLeaderLock(tmp_path / "housekeeping.lock")
+    second_lock = FileLeaderLock(tmp_path / "housekeeping.lock")
+    assert first_lock.try_acquire() is True
+    assert second_lock.try_acquire() is False
+
+    clock = {"now": 100.0}
+    calls = []
+    follower = HousekeepingService(try_acquire_leadership=second_lock.try_acquire, monotonic=lambda: clock["now"])
+    follower.add_job("bookings_expiry", 60, lambda: calls.append("follower"))
+    assert follower.tick() == follower.leader_retry_seconds
+    assert calls == []
+
+    leader = HousekeepingService(try_acquire_leadership=first_lock.try_acquire, monotonic=lambda: clock["now"])
+    leader.add_job("bookings_expiry", 60, lambda: calls.append("expiry") or 2)
+    leader.add_job("orders_retention", 300, lambda: 1 / 0)
+    assert leader.tick() == pytest.approx(30.0)
+    assert calls == ["expiry"]
+
+    clock["now"] += 30
+    leader.tick()
+    assert calls == ["expiry"]
+    clock["now"] += 30
+    leader.tick()
+    assert calls == ["expiry", "expiry"]
+
+    jobs = {job["name"]: job for job in leader.snapshot()["jobs"]}
+    assert leader.snapshot()["is_leader"] is True
+    assert jobs["bookings_expiry"]["runs"] == 2
+    assert jobs["bookings_expiry"]["last_result"] == 2
+    assert jobs["orders_retention"]["failures"] == 1
+    assert "division" in jobs["orders_retention"]["last_error"]
+
+    first_lock.release()
+    assert second_lock.try_acquire() is True
+    second_lock.release()
+
+
+def test_background_housekeeping_moves_booking_expiry_off_reads(app_module, client, monkeypatch):
+    storage = app_module.storage
+    monkeypatch.setattr(storage, "background_housekeeping", True)
+    past = datetime.now() - timedelta(days=2)
+    future = datetime.now() + timedelta(days=2)
+    expired = {"user_id": 1, "table_id": 1, "date": past.strftime("%Y-%m-%d"), "time": "12:00", "name": "A", "created_at": ""}
+    upcoming = {"user_id": 1, "table_id": 2, "date": future.strftime("%Y-%m-%d"), "time": "12:00", "name": "B", "created_at": ""}
+    write_json(app_module.BOOKINGS_PATH, [expired, upcoming])
+
+    assert storage.load_bookings() == [upcoming]
+    assert len(read_json(app_module.BOOKINGS_PATH)) == 2
+
+    assert storage.expire_bookings() == 1
+    assert read_json(app_module.BOOKINGS_PATH) == [upcoming]
+    assert storage.expire_bookings() == 0
+
+
+def test_prune_expired_orders_deletes_in_place_on_postgres(app_module, monkeypatch):
+    pg_store = importlib.import_module("storage.pg_store")
+    storage = app_module.storage
+    calls = []
+
+    def delete_expired_orders(*, retention_days):
+        calls.append(retention_days)
+        return 2
+
+    def rewrite(*args, **kwargs):
+        raise AssertionError("orders must not be rewritten from a snapshot in Postgres mode")
+
+    monkeypatch.setattr(storage, "active_storage", "postgres")
+    monkeypatch.setattr(pg_store, "delete_expired_orders", delete_expired_orders)
+    monkeypatch.setattr(storage, "store_load_orders", rewrite)
+    monkeypatch.setattr(storage, "store_save_orders", rewrite)
+
+    assert storage.prune_expired_orders() == 2
+    assert calls == [storage.order_retention_days]
+
+
 def test_booking_time_checks_use_app_timezone_helpers(app_module, monkeypatch, tmp_path):
     from services import business_logic
     from storage import json_store
@@ -897,6 +1675,89 @@ def test_payment_confirm_recomputes_promotions_at_confirmation(app_module, clien
     assert orders[0]["promotions_applied"] == []
 
 
+
+def test_checkout_promo_preview_reprices_cart_delta_in_pricing_session(app_module, client, monkeypatch):
+    user = build_user(app_module, balance=0)
+    write_json(app_module.USERS_PATH, [user])
+    menu_items = [
+        {"id": 101, "name": "Закуска", "type": "закуски", "price": 300, "photo": "", "active": True},
+        {"id": 102, "name": "Суп", "type": "супы", "price": 250, "photo": "", "active": True},
+    ]
+    promo_items = [
+        {
+            "id": 900,
+            "class": "akciya",
+            "name": "Snack bonus",
+            "priority": 10,
+            "active": True,
+            "condition": "ID(101).QTY >= 2",
+            "reward": "POINTS(50)",
+            "reward_mode": "once",
+            "dsl_valid": True,
+        }
+    ]
+    calls = {"counts": 0}
+
+    def fake_counts(**kwargs):
+        calls["counts"] += 1
+        return {}
+
+    app_module.checkout_pricing_sessions.invalidate()
+    monkeypatch.setattr(app_module, "load_menu_items", lambda: menu_items)
+    monkeypatch.setattr(app_module, "load_promo_items", lambda: promo_items)
+    monkeypatch.setattr(app_module, "load_promo_application_counts", fake_counts)
+
+    csrf_token = get_csrf_token(client)
+    login_response = client.post("/login", data={"csrf_token": csrf_token, "phone": user["phone"], "password": "1234"})
+    assert login_response.status_code == 200
+    headers = {"X-CSRF-Token": csrf_token}
+
+    full = client.post("/api/checkout/promo-preview", json={"items": [{"id": 101, "qty": 1}]}, headers=headers).get_json()
+    assert full["ok"] is True
+    assert full["promo_points"] == 0
+    assert full["revision"] == 1
+
+    delta = client.post(
+        "/api/checkout/promo-preview",
+        json={"pricing_session": full["pricing_session"], "revision": 1, "delta": [{"id": 101, "qty": 2}, {"id": 102, "qty": 1}]},
+        headers=headers,
+    ).get_json()
+    assert delta["revision"] == 2
+    assert delta["promo_points"] == 50
+    assert delta["totals"]["items_total"] == 850
+    assert calls["counts"] == 1
+
+    reference = client.post(
+        "/api/checkout/promo-preview",
+        json={"items": [{"id": 101, "qty": 2}, {"id": 102, "qty": 1}]},
+        headers=headers,
+    ).get_json()
+    assert {key: reference[key] for key in ("totals", "promo_points", "promotions_applied")} == {
+        key: delta[key] for key in ("totals", "promo_points", "promotions_applied")
+    }
+
+    # The full preview replaced the user's context, and a stale revision is never applied.
+    stale = client.post(
+        "/api/checkout/promo-preview",
+        json={"pricing_session": full["pricing_session"], "revision": 2, "delta": [{"id": 102, "qty": 0}]},
+        headers=headers,
+    )
+    assert stale.status_code == 409
+    out_of_sync = client.post(
+        "/api/checkout/promo-preview",
+        json={"pricing_session": reference["pricing_session"], "revision": 0, "delta": [{"id": 102, "qty": 0}]},
+        headers=headers,
+    )
+    assert out_of_sync.status_code == 409
+    removed = client.post(
+        "/api/checkout/promo-preview",
+        json={"pricing_session": reference["pricing_session"], "revision": 1, "delta": [{"id": 102, "qty": 0}]},
+        headers=headers,
+    ).get_json()
+    assert removed["totals"]["items_total"] == 600
+    assert removed["revision"] == 2
+
+
 def test_delivery_does_not_apply_akciya_promotions(app_module, client, monkeypatch):
     user = build_user(app_module, balance=0)
     write_json(app_module.USERS_PATH, [user])
@@ -1,12 +1,20 @@
+import time
 from datetime import datetime
 
 import pytest
 
 from services.promotions import (
+    CompiledPromotionCache,
     PromotionApplicationState,
+    PromotionIndex,
     PromotionValidationError,
     apply_reward,
     apply_promotions_to_order,
+    build_dsl_text_from_promo_item as build_dsl_text,
+    build_order_features,
+    collect_runtime_promotions,
+    compile_promotion,
+    evaluate_compiled_promotion,
     evaluate_condition,
     evaluate_promotion,
     parse_promotion,
@@ -369,3 +377,237 @@ condition=NOT ID.QTY >= 1
 reward=POINTS(10)
 """
         )
+
+
+def test_compiled_promotion_cache_reuses_entries_until_invalidated_or_reloaded():
+    calls = []
+
+    def compile_fn(promo_items, *, menu_items):
+        calls.append([item["id"] for item in promo_items])
+        return collect_runtime_promotions(promo_items, menu_items=menu_items)
+
+    cache = CompiledPromotionCache(compile_fn=compile_fn)
+    promo = {"id": 7, "class": "akciya", "name": "Bonus", "active": True, "condition": "ID(101).QTY >= 1", "reward": "POINTS(10)"}
+    banner = {"id": 8, "class": "reklama", "name": "Banner"}
+    menu_items = [{"id": 101, "name": "Закуска", "type": "закуски", "price": 300, "active": True}]
+
+    first = cache.get([promo, banner], menu_items=menu_items)
+    assert [entry.source["id"] for entry in first] == [7]
+    assert cache.get([banner, promo], menu_items=menu_items) is first
+    assert calls == [[7]]
+
+    cache.invalidate()
+    assert cache.get([promo], menu_items=menu_items) is not first
+    cache.get([promo], menu_items=list(menu_items))
+    cache.get([dict(promo)], menu_items=menu_items)
+    assert len(calls) == 4
+
+
+@pytest.mark.parametrize(
+    "condition",
+    [
+        "ID(1).QTY >= 2",
+        "ID(1).SUM > 500 OR ID(3).QTY == 1",
+        "TYPE(закуски).QTY >= 3 AND ORDER.SUM >= 900",
+        "TYPE(закуски).UNIQUE_QTY >= 2",
+        "ID.QTY >= 4",
+        "ID.UNIQUE_QTY != 3",
+        "GROUP(1,2,9).SUM <= 1200",
+        "NOT GROUP(2,3).UNIQUE_QTY < 2",
+    ],
+)
+def test_compiled_condition_matches_ast_evaluation(condition):
+    promotion = validate_promotion(
+        f"""
+dsl_version=2
+name=Parity
+condition={condition}
+reward=POINTS(10)
+"""
+    )
+    order = build_order(
+        {"id": 1, "type": "закуски", "price": 200, "qty": 2},
+        {"id": 2, "type": "закуски", "price": 500, "qty": 1},
+        {"id": 3, "type": "горячее", "price": 700, "qty": 1},
+        {"id": 1, "type": "закуски", "price": 200, "qty": 1},
+        {"id": 9, "type": "напитки", "price": 0, "qty": 5, "is_gift": True},
+    )
+
+    expected = evaluate_promotion(promotion, order)
+    actual = evaluate_compiled_promotion(promotion, compile_promotion(promotion), build_order_features(order))
+
+    assert actual == expected
+
+
+def test_promotion_index_skips_promotions_whose_items_are_not_in_cart():
+    conditions = {
+        1: "ID(1).QTY >= 1",
+        2: "TYPE(напитки).SUM > 0",
+        3: "ID(2).QTY < 1",
+        4: "GROUP(3,4).QTY >= 2 AND ORDER.SUM >= 100",
+        5: "ID(5).QTY >= 1 OR ORDER.SUM >= 5000",
+    }
+    promo_items = [
+        {"id": promo_id, "class": "akciya", "name": f"P{promo_id}", "priority": 10 - promo_id, "condition": condition, "reward": "POINTS(5)", "dsl_version": "2"}
+        for promo_id, condition in conditions.items()
+    ]
+    entries = collect_runtime_promotions(promo_items, menu_items=[])
+    index = PromotionIndex(entries)
+
+    cart = build_order({"id": 4, "type": "горячее", "price": 300, "qty": 2})
+    assert [entry.source["id"] for entry in index.candidates(build_order_features(cart))] == [3, 4, 5]
+
+    cart["items"].append({"id": 7, "type": "напитки", "price": 100, "qty": 1})
+    assert [entry.source["id"] for entry in index.candidates(build_order_features(cart))] == [2, 3, 4, 5]
+
+
+def test_stored_promotion_ast_skips_tokenizing_and_falls_back_when_stale(monkeypatch):
+    from services.promotions import parser, serialization
+    from services.promotions.engine import parse_and_validate_promo_source
+
+    promo_item = {
+        "id": 11,
+        "class": "akciya",
+        "name": "Combo",
+        "condition": "NOT ID(1).QTY < 2 AND GROUP(2,3).SUM >= 500",
+        "reward": "DISCOUNT_PERCENT(10, TARGET=GROUP(2,3))",
+        "dsl_version": "2",
+    }
+    promo_item["dsl_ast"] = serialization.serialize_promo_source(promo_item)
+    expected = parse_promotion(build_dsl_text(promo_item))
+
+    def fail_tokenize(text):
+        raise AssertionError(f"tokenized {text!r}")
+
+    monkeypatch.setattr(parser, "_tokenize", fail_tokenize)
+    parser._parse_condition_memo.cache_clear()
+    assert parse_and_validate_promo_source(promo_item, menu_items=[]) == expected
+
+    stale = dict(promo_item, condition="ID(1).QTY >= 3")
+    assert serialization.load_promotion_rules(stale["dsl_ast"], condition=stale["condition"], reward=stale["reward"], dsl_version="2") is None
+    other_format = promo_item["dsl_ast"].replace('"v":1', '"v":0')
+    assert serialization.load_promotion_rules(other_format, condition=promo_item["condition"], reward=promo_item["reward"], dsl_version="2") is None
+    with pytest.raises(AssertionError, match="tokenized"):
+        parse_and_validate_promo_source(stale, menu_items=[])
+
+
+def test_optimal_discount_mode_picks_best_legal_combination():
+    from services.promotions import DiscountPolicy
+
+    promo_items = [
+        {"id": 1, "class": "akciya", "name": "Rub", "priority": 50, "condition": "ID(1).QTY >= 1", "reward": "DISCOUNT_RUB(100)"},
+        {"id": 2, "class": "akciya", "name": "Percent", "priority": 10, "condition": "ID(1).QTY >= 1", "reward": "DISCOUNT_PERCENT(20)"},
+        {"id": 3, "class": "akciya", "name": "Soup", "priority": 5, "condition": "ID(2).QTY >= 1", "reward": "DISCOUNT_PERCENT(15, TARGET=GROUP(2))", "dsl_version": "2"},
+    ]
+    menu_items = [{"id": 1, "type": "горячее", "price": 1000}, {"id": 2, "type": "супы", "price": 500}]
+    order = build_order({"id": 1, "type": "горячее", "price": 1000, "qty": 1}, {"id": 2, "type": "супы", "price": 500, "qty": 2})
+
+    def discount(policy):
+        result = apply_promotions_to_order(order=order, promo_items=promo_items, menu_items=menu_items, discount_policy=policy)
+        return result["best_discount"]["promotion_name"], result["best_discount"]["amount"]
+
+    assert discount(DiscountPolicy()) == ("Rub", 100)
+    assert discount(DiscountPolicy(mode="optimal")) == ("Percent", 400)
+    assert discount(DiscountPolicy(mode="optimal", max_stacked=2)) == ("Percent", 400)
+    assert discount(DiscountPolicy(mode="optimal", max_stacked=2, allow_overlapping_targets=True)) == ("Percent + Soup", 550)
+    assert discount(
+        DiscountPolicy(mode="optimal", max_stacked=2, allow_overlapping_targets=True, exclusive_kinds=frozenset({"DISCOUNT_PERCENT"}))
+    ) == ("Percent", 400)
+
+
+def test_discount_solver_matches_brute_force_within_latency_budget():
+    import itertools
+    import random
+
+    from services.promotions import DiscountPolicy, solve_discounts
+
+    rng = random.Random(47)
+    policy = DiscountPolicy(mode="optimal", max_stacked=4, exclusive_kinds=frozenset({"DISCOUNT_PERCENT"}))
+    elapsed = 0.0
+    for _round in range(30):
+        candidates = [
+            {
+                "kind": rng.choice(["DISCOUNT_RUB", "DISCOUNT_RUB", "DISCOUNT_PERCENT"]),
+                "amount": rng.randint(10, 400),
+                "priority": rng.randint(0, 100),
+                "promotion_name": f"P{index}",
+                "target_kind": "GROUP",
+                "target_group_ids": rng.sample(range(1, 30), 2),
+            }
+            for index in range(policy.candidate_budget)
+        ]
+        cap = rng.randint(300, 1500)
+        started_at = time.perf_counter()
+        solution = solve_discounts(candidates, policy, cap=cap)
+        elapsed += time.perf_counter() - started_at
+
+        best = 0
+        for size in range(1, policy.max_stacked + 1):
+            for combo in itertools.combinations(candidates, size):
+                if size > 1 and any(item["kind"] in policy.exclusive_kinds for item in combo):
+                    continue
+                item_ids = [item_id for item in combo for item_id in item["target_group_ids"]]
+                if len(item_ids) != len(set(item_ids)):
+                    continue
+                best = max(best, min(cap, sum(item["amount"] for item in combo)))
+        assert solution.exhaustive is True
+        assert solution.amount == best
+        assert solution.nodes <= policy.node_budget
+
+    assert elapsed / 30 < 0.05
+
+    many = [
+        {"kind": "DISCOUNT_RUB", "amount": 10 + index, "priority": index % 7, "promotion_name": f"P{index}", "target_kind": "ORDER"}
+        for index in range(40)
+    ]
+    fallback = solve_discounts(many, policy, cap=10_000)
+    assert fallback.exhaustive is False
+    assert [item["promotion_name"] for item in fallback.discounts] == ["P6"]
+
+
+def test_promotion_benchmark_harness_runs_and_flags_regressions():
+    import importlib.util
+    from pathlib import Path
+
+    spec = importlib.util.spec_from_file_location("bench_promotions", Path(__file__).resolve().parents[1] / "ops" / "bench_promotions.py")
+    bench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+
+    results = bench.run_benchmarks({"tiny": {"menu_items": 24, "promotions": 12, "carts": 10}}, repeats=1, seed=7)
+    scale = results["scales"]["tiny"]
+    # Every synthetic promotion must survive validation, otherwise the benchmark measures the error path.
+    assert scale["valid_promotions"] == 12
+    assert set(scale["operations"]) == set(bench.OPERATIONS)
+    assert scale["operations"]["apply_promotions_to_order"]["calls"] == 10
+
+    baseline = {"scales": {"tiny": {"operations": {name: dict(timing) for name, timing in scale["operations"].items()}}}}
+    assert bench.find_regressions(results, baseline, max_regression=0.25) == []
+    baseline["scales"]["tiny"]["operations"]["parse_promotion"]["median_us"] = scale["operations"]["parse_promotion"]["median_us"] / 10
+    regressions = bench.find_regressions(results, baseline, max_regression=0.25, min_delta_us=0)
+    assert [(item["scale"], item["operation"]) for item in regressions] == [("tiny", "parse_promotion")]
+
+
+def test_promotion_schedule_bisects_window_boundaries():
+    from services.business_logic import APP_TIMEZONE
+    from services.promotions import PromotionSchedule
+
+    items = [
+        {"id": 1},
+        {"id": 2, "start_at": "2026-10-19T12:00:00", "end_at": "2026-10-19T15:00:00"},
+        {"id": 3, "start_at": "2026-10-19T14:00:00"},
+        {"id": 4, "end_at": datetime(2026, 10, 19, 13, 0, tzinfo=APP_TIMEZONE).isoformat()},
+        {"id": 5, "start_at": "broken"},
+    ]
+    schedule = PromotionSchedule(items)
+
+    def active(at):
+        return [item["id"] for item in schedule.active_at(at)]
+
+    assert active(datetime(2026, 10, 19, 11, 0)) == [1, 4, 5]
+    assert active(datetime(2026, 10, 19, 12, 0)) == [1, 2, 4, 5]
+    assert active(datetime(2026, 10, 19, 13, 0, 0, 1)) == [1, 2, 5]
+    assert active(datetime(2026, 10, 19, 14, 30)) == [1, 2, 3, 5]
+    assert active(datetime(2026, 10, 19, 15, 0)) == [1, 2, 3, 5]
+    assert active(datetime(2026, 10, 19, 15, 0, 0, 1)) == [1, 3, 5]
+    assert schedule.next_boundary(datetime(2026, 10, 19, 12, 30)) == datetime(2026, 10, 19, 13, 0, 0, 1)
+    assert schedule.next_boundary(datetime(2026, 10, 20)) is None
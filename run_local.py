@@ -99,7 +99,9 @@ def apply_local_defaults():
 
 
 def run_server(venv_python: Path, host: str, port: int):
-    print(f"[local] starting waitress on http://{host}:{port}")
+    # The app caps open order status streams at WEB_THREADS - 2, so waitress must get the same thread count.
+    threads = os.environ.get("WEB_THREADS", "8")
+    print(f"[local] starting waitress on http://{host}:{port} threads={threads}")
     subprocess.run(
         [
             str(venv_python),
@@ -109,6 +111,8 @@ def run_server(venv_python: Path, host: str, port: int):
             host,
             "--port",
             str(port),
+            "--threads",
+            threads,
             "app:app",
         ],
         check=True,